@@ -10,6 +10,8 @@ import uuid
 import calendar
 import logging
 
+from ledger_checkpoints import build_period_checkpoints, drop_period_checkpoints
+
 logger = logging.getLogger(__name__)
 
 # Router
@@ -218,7 +220,10 @@ async def close_accrual_period(period_id: str):
         }}
     )
     
-    logger.info(f"Closed accrual period: {period['code']}")
+    # Kapanan ayın ledger toplamları: bakiye raporları bu aya tekrar inmez
+    checkpoint_stats = await build_period_checkpoints(db, period["code"])
+    
+    logger.info(f"Closed accrual period: {period['code']} ({checkpoint_stats['checkpoints']} ledger checkpoints)")
     
     updated = await db.accrual_periods.find_one({"id": period_id}, {"_id": 0})
     return updated
@@ -238,6 +243,8 @@ async def reopen_accrual_period(period_id: str):
         {"$set": {"is_closed": False}, "$unset": {"closed_at": ""}}
     )
     
+    await drop_period_checkpoints(db, period["code"])
+    
     logger.info(f"Reopened accrual period: {period['code']}")
     
     updated = await db.accrual_periods.find_one({"id": period_id}, {"_id": 0})
@@ -1,8 +1,27 @@
-"""Authentication utilities"""
+"""Authentication utilities
+
+Tüm router'lar (stock_count_management dahil) kimlik doğrulamayı buradan alır.
+
+- get_current_user: token'daki user_id ile kullanıcı kaydı; kayıtlar TTL'li
+  LRU cache'te tutulur (AUTH_USER_CACHE_TTL sn), routers/users.py
+  güncelleme/silmede invalidate_user_cache çağırır
+- get_current_user_claims: JWT_EMBED_CLAIMS=true ise token role/status
+  claim'lerini taşır; salt okunur endpoint'ler DB/cache'e hiç gitmez.
+  Claim'ler token süresi boyunca geçerlidir (rol değişikliği yeni login'de
+  yansır), yetki değiştiren endpoint'ler get_current_user kullanmalı.
+- get_current_user_from_query: SSE için ?token= ile gelen kısa ömürlü stream
+  token'ı (create_stream_token, scope="stream"). URL erişim loglarına düştüğü
+  için access token yerine kullanılır; stream token Bearer olarak kabul edilmez.
+"""
+import asyncio
 import bcrypt
 import jwt
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from fastapi import Depends, HTTPException
+from typing import Optional
+from fastapi import Depends, HTTPException, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 
@@ -13,10 +32,76 @@ from models.user import User
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
+JWT_EMBED_CLAIMS = os.environ.get('JWT_EMBED_CLAIMS', 'false').lower() == 'true'
+
+# SSE stream token (sadece bağlantı açılırken doğrulanır)
+STREAM_TOKEN_SCOPE = 'stream'
+STREAM_TOKEN_TTL_SECONDS = int(os.environ.get('STREAM_TOKEN_TTL_SECONDS', '60'))
+
+# bcrypt event loop dışında, sınırlı thread havuzunda (bcrypt GIL'i bırakır)
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', str(min(4, os.cpu_count() or 1))))
+
+# User cache
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', '60'))
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', '1000'))
+
+# Token'a gömülen kullanıcı alanları (JWT_EMBED_CLAIMS)
+TOKEN_CLAIM_FIELDS = ("email", "username", "name", "role", "status", "is_active")
 
 security = HTTPBearer()
 
 
+class UserCache:
+    """user_id -> kullanıcı kaydı, TTL + LRU sınırlı"""
+
+    def __init__(self, ttl: int = AUTH_USER_CACHE_TTL, max_size: int = AUTH_USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        item = self._items.get(user_id)
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            self._items.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, user_id: str, user: dict):
+        self._items[user_id] = (time.monotonic(), user)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Process-wide user cache
+user_cache = UserCache()
+
+
+def invalidate_user_cache(user_id: Optional[str] = None):
+    """Kullanıcı güncellendi/silindi - sonraki istekte DB'den oku"""
+    user_cache.invalidate(user_id)
+
+
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -29,6 +114,31 @@ def verify_password(plain_password: str, hashed_password) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password - event loop'u bloklamadan (async handler'lar bunu kullanmalı)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password) -> bool:
+    """verify_password - event loop'u bloklamadan"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+
+def build_token_claims(user: dict) -> dict:
+    """Login/register token içeriği: user_id (+ JWT_EMBED_CLAIMS ise role/status vb.)"""
+    claims = {"user_id": user["id"]}
+    if JWT_EMBED_CLAIMS:
+        for field in TOKEN_CLAIM_FIELDS:
+            if user.get(field) is not None:
+                claims[field] = user[field]
+    return claims
+
+
 def create_access_token(data: dict) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
@@ -38,26 +148,73 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Get current authenticated user from JWT token"""
-    db = get_db()
+def create_stream_token(user_id: str) -> str:
+    """Tek amaçlı, kısa ömürlü SSE token'ı (?token= ile gönderilir)"""
+    expire = datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_TTL_SECONDS)
+    return jwt.encode(
+        {"user_id": user_id, "scope": STREAM_TOKEN_SCOPE, "exp": expire},
+        JWT_SECRET, algorithm=JWT_ALGORITHM
+    )
+
+
+def decode_token(token: str, scope: Optional[str] = None) -> dict:
+    """JWT doğrula ve payload döndür (scope: None = access token)"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        # Convert datetime fields to strings for Pydantic validation
-        if user.get('created_at') and isinstance(user['created_at'], datetime):
-            user['created_at'] = user['created_at'].isoformat()
-        
-        return User(**user)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("user_id") is None or payload.get("scope") != scope:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+
+async def load_user(user_id: str) -> dict:
+    """Kullanıcı kaydı - önce cache, yoksa DB (users.id index)"""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    db = get_db()
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0, "hashed_password": 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    # Convert datetime fields to strings for Pydantic validation
+    if user.get('created_at') and isinstance(user['created_at'], datetime):
+        user['created_at'] = user['created_at'].isoformat()
+
+    user_cache.put(user_id, user)
+    return user
+
+
+async def get_user_from_token(token: str, scope: Optional[str] = None) -> User:
+    """Decode JWT and load the user"""
+    payload = decode_token(token, scope)
+    return User(**await load_user(payload["user_id"]))
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    """Get current authenticated user from JWT token"""
+    return await get_user_from_token(credentials.credentials)
+
+
+async def get_current_user_from_query(token: str = Query(...)) -> User:
+    """
+    Stream token'ı ?token= parametresinden al
+    EventSource (SSE) Authorization header gönderemez; access token URL'de
+    taşınmaz (erişim logları), POST /market-data/stream-token kullanılır
+    """
+    return await get_user_from_token(token, STREAM_TOKEN_SCOPE)
+
+
+async def get_current_user_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    """
+    Salt okunur endpoint'ler için: token role/status claim'i taşıyorsa
+    kullanıcı kaydı okunmaz; eski token'larda get_current_user'a düşer
+    """
+    payload = decode_token(credentials.credentials)
+    if "role" not in payload or "email" not in payload:
+        return User(**await load_user(payload["user_id"]))
+    return User(id=payload["user_id"], **{f: payload[f] for f in TOKEN_CLAIM_FIELDS if f in payload})
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Streaming Export Benchmark
+==========================
+Ayrı bir DB'ye (BENCH_DB_NAME, varsayılan sarraf_export_bench) N adet
+ledger kaydı yazar ve /reports/unified-ledger/export'un kullandığı akış
+yazıcılarıyla (utils/export.py) cursor'dan CSV ve XLSX üretir.
+
+Ölçülenler: süre, satır/sn, çıktı boyutu ve export sırasında process
+RSS artışı (sabit bellek beklenir). Karşılaştırma için eski yöntemin
+(skip/limit ile 50'şer satır) ilk ve son sayfa süreleri de ölçülür.
+
+Kullanım:
+    python benchmark_export.py [kayıt_sayısı]      # varsayılan 1000000
+
+Sonunda DB silinir. Çıktı diske yazılmaz (sadece sayılır).
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+BENCH_DB_NAME = os.environ.get('BENCH_DB_NAME', 'sarraf_export_bench')
+PAGE_SIZE = 50
+
+from utils.export import EXPORT_BATCH_SIZE, stream_csv, stream_xlsx
+from routers.reports import LEDGER_EXPORT_COLUMNS
+
+TYPES = ["SALE", "PURCHASE", "RECEIPT", "PAYMENT", "EXPENSE", "EXCHANGE"]
+
+
+def rss_mb():
+    """Anlık RSS (Linux /proc); başka platformda None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+async def seed(db, count: int):
+    """count adet ledger kaydı (10.000'lik insert_many)"""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    step = timedelta(days=365) / count
+    batch = []
+    for i in range(count):
+        tx_date = start + step * i
+        amount = round(random.uniform(100, 50000), 2)
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "type": random.choice(TYPES),
+            "transaction_date": tx_date.isoformat(),
+            "created_at": tx_date.isoformat(),
+            "has_in": round(random.uniform(0, 20), 6),
+            "has_out": round(random.uniform(0, 20), 6),
+            "currency": "TRY",
+            "amount_in": amount,
+            "amount_out": 0.0,
+            "profit_has": round(random.uniform(-1, 1), 6),
+            "party_name": f"Benchmark Cari {i % 500}",
+            "party_type": "CUSTOMER",
+            "cash_register_name": "TL Kasa",
+            "description": f"Benchmark kayıt #{i} - \"çeyrek\", 22 ayar",
+            "reference_type": "financial_transactions",
+            "reference_id": f"TX-{i:08d}",
+        })
+        if len(batch) >= 10000:
+            await db.unified_ledger.insert_many(batch, ordered=False)
+            batch = []
+            if i % 100000 < 10000:
+                print(f"  seeded {i + 1:,}")
+    if batch:
+        await db.unified_ledger.insert_many(batch, ordered=False)
+    await db.unified_ledger.create_index([("transaction_date", -1), ("created_at", -1)])
+
+
+async def run_export(db, name: str, writer, count: int):
+    cursor = db.unified_ledger.find({}, {"_id": 0}).sort([
+        ("transaction_date", -1),
+        ("created_at", -1)
+    ]).batch_size(EXPORT_BATCH_SIZE)
+
+    base_rss = rss_mb()
+    peak_rss = base_rss
+    size = 0
+    started = time.perf_counter()
+    async for chunk in writer(cursor, LEDGER_EXPORT_COLUMNS):
+        size += len(chunk)
+        current = rss_mb()
+        if current is not None and current > peak_rss:
+            peak_rss = current
+    elapsed = time.perf_counter() - started
+    return {
+        "format": name,
+        "seconds": round(elapsed, 1),
+        "rows_per_sec": round(count / elapsed) if elapsed else 0,
+        "size_mb": round(size / (1024 * 1024), 1),
+        "rss_growth_mb": round(peak_rss - base_rss, 1) if base_rss is not None else None,
+    }
+
+
+async def page_latency(db, page: int) -> float:
+    """Eski yöntem: skip/limit sayfa + count_documents"""
+    started = time.perf_counter()
+    await db.unified_ledger.count_documents({})
+    await db.unified_ledger.find({}, {"_id": 0}).sort([
+        ("transaction_date", -1),
+        ("created_at", -1)
+    ]).skip((page - 1) * PAGE_SIZE).limit(PAGE_SIZE).to_list(PAGE_SIZE)
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def main(count: int):
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[BENCH_DB_NAME]
+    await client.drop_database(BENCH_DB_NAME)
+
+    print(f"🔄 Seeding {count:,} ledger entries into {BENCH_DB_NAME}")
+    started = time.perf_counter()
+    await seed(db, count)
+    print(f"  done in {time.perf_counter() - started:.1f}s")
+
+    results = [
+        await run_export(db, "csv", stream_csv, count),
+        await run_export(db, "xlsx", stream_xlsx, count),
+    ]
+
+    last_page = (count + PAGE_SIZE - 1) // PAGE_SIZE
+    first_ms = await page_latency(db, 1)
+    last_ms = await page_latency(db, last_page)
+
+    print()
+    print(f"{'Format':<8}{'Sec':>8}{'Rows/s':>10}{'MB':>9}{'RSS +MB':>10}")
+    for r in results:
+        print(f"{r['format']:<8}{r['seconds']:>8}{r['rows_per_sec']:>10}{r['size_mb']:>9}{str(r['rss_growth_mb']):>10}")
+    print()
+    print(f"Paged ({PAGE_SIZE}/page, {last_page:,} requests): page 1 {first_ms}ms, page {last_page:,} {last_ms}ms")
+    if count > 1048575:
+        print("Note: XLSX output stops at the Excel row limit (1,048,575 rows)")
+
+    await client.drop_database(BENCH_DB_NAME)
+    client.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 1000000))
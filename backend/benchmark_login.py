@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Login Throughput Benchmark
+==========================
+Çalışan sunucuya eşzamanlı login patlaması gönderir (sabah tüm personelin
+aynı anda giriş yapması) ve aynı anda hafif bir endpoint'i
+(GET /lookups/karats, cache'ten) sürekli yoklar.
+
+bcrypt event loop'u bloklarsa login'ler sırasında probe gecikmesi
+login süresi kadar uzar; bcrypt thread havuzundaysa probe gecikmesi
+düşük kalır. PASSWORD_HASH_CONCURRENCY farklı değerlerle sunucu
+yeniden başlatılarak karşılaştırılabilir.
+
+Kullanım:
+    python benchmark_login.py [login_sayısı] [eşzamanlılık]
+
+BENCH_USERNAME / BENCH_PASSWORD (varsayılan admin@kuyumcu.com / admin123)
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+BASE_URL = os.environ.get("BENCH_BASE_URL", "http://localhost:8001/api")
+USERNAME = os.environ.get("BENCH_USERNAME", "admin@kuyumcu.com")
+PASSWORD = os.environ.get("BENCH_PASSWORD", "admin123")
+PROBE_INTERVAL = 0.02
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[max(0, int(len(values) * pct) - 1)], 1)
+
+
+async def main(logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    login_latencies = []
+    probe_latencies = []
+    errors = 0
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60.0) as client:
+        # Isınma: bağlantı + lookup cache
+        await client.get("/lookups/karats")
+
+        async def one_login():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                resp = await client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD})
+                if resp.status_code == 200:
+                    login_latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/lookups/karats")
+                probe_latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(PROBE_INTERVAL)
+
+        print(f"🔄 {logins} logins, concurrency {concurrency}, {BASE_URL}")
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    print(f"⏱️  {elapsed:.2f}s, {len(login_latencies) / elapsed:.1f} logins/s, errors: {errors}")
+    if login_latencies:
+        print(f"🔐 Login   p50 {statistics.median(login_latencies):.1f} ms, "
+              f"p95 {percentile(login_latencies, 0.95)} ms")
+    if probe_latencies:
+        print(f"📡 Probe   p50 {statistics.median(probe_latencies):.1f} ms, "
+              f"p95 {percentile(probe_latencies, 0.95)} ms, max {max(probe_latencies):.1f} ms "
+              f"({len(probe_latencies)} requests)")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        int(args[0]) if len(args) > 0 else 50,
+        int(args[1]) if len(args) > 1 else 20
+    ))
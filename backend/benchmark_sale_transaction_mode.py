@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+SALE Transaction Mode Benchmark
+===============================
+create_sale_transaction'ı bağımsız yazım (atomic=False) ve Mongo
+transaction modu (atomic=True) ile karşılaştırır.
+
+Transaction modu replica set gerektirir. Lokal tek node replica set:
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+
+Kullanım:
+    MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0" \\
+        python benchmark_sale_transaction_mode.py [satış_sayısı] [eşzamanlılık]
+
+Ayrı bir DB'de (BENCH_DB_NAME, varsayılan sarraf_sale_bench) çalışır ve
+sonunda DB'yi siler.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/?replicaSet=rs0')
+BENCH_DB_NAME = os.environ.get('BENCH_DB_NAME', 'sarraf_sale_bench')
+
+from models.transaction import FinancialTransactionCreate
+from services.sale_service import create_sale_transaction
+from init_unified_ledger import set_database as set_ledger_db
+from cash_management import set_database as set_cash_db
+from database import set_db
+
+
+async def seed(db, count: int, label: str):
+    """Müşteri, kasa ve count adet UNIQUE ürün oluştur"""
+    now = datetime.now(timezone.utc)
+    party_id = f"BENCH-PARTY-{label}"
+    await db.parties.insert_one({
+        "id": party_id, "name": "Benchmark Müşteri", "party_type_id": 1,
+        "is_active": True, "has_balance": 0.0, "currency_balances": {"USD": 0.0, "EUR": 0.0}
+    })
+    register_id = f"BENCH-CASH-{label}"
+    await db.cash_registers.insert_one({
+        "id": register_id, "name": "Benchmark Kasa", "currency": "TRY",
+        "is_active": True, "current_balance": 0.0
+    })
+    await db.price_snapshots.insert_one({
+        "as_of": now, "source": "BENCHMARK", "has_buy_tl": 3000.0, "has_sell_tl": 3010.0,
+        "usd_buy_tl": 34.0, "usd_sell_tl": 34.1, "eur_buy_tl": 37.0, "eur_sell_tl": 37.1,
+        "created_at": now
+    })
+
+    products = [{
+        "id": f"BENCH-{label}-{i}-{uuid.uuid4().hex[:6]}",
+        "barcode": f"BENCH-{label}-{i}",
+        "track_type": "UNIQUE",
+        "stock_status_id": 1,
+        "karat_id": 1,
+        "weight_gram": 5.0,
+        "total_cost_has": 4.5,
+        "sale_has_value": 4.8,
+        "created_at": now.isoformat()
+    } for i in range(count)]
+    await db.products.insert_many(products)
+    return party_id, register_id, [p["id"] for p in products]
+
+
+async def run_mode(db, atomic: bool, count: int, concurrency: int):
+    label = "TXN" if atomic else "PLAIN"
+    party_id, register_id, product_ids = await seed(db, count, label)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one_sale(product_id: str):
+        nonlocal errors
+        data = FinancialTransactionCreate(
+            type_code="SALE",
+            party_id=party_id,
+            transaction_date=datetime.now(timezone.utc).isoformat(),
+            currency="TRY",
+            total_amount_currency=14448.0,
+            lines=[{"product_id": product_id, "quantity": 1, "line_amount_currency": 14448.0}],
+            customer_debt_has=0.5,
+            cash_register_id=register_id
+        )
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await create_sale_transaction(data, "benchmark", db, atomic=atomic)
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                errors += 1
+                print(f"  ❌ {label} sale failed: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_sale(pid) for pid in product_ids))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "mode": "transaction" if atomic else "independent writes",
+        "sales": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1) if latencies else None,
+    }
+
+
+async def main(count: int, concurrency: int):
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[BENCH_DB_NAME]
+    await client.drop_database(BENCH_DB_NAME)
+
+    set_db(db)
+    set_ledger_db(db)
+    set_cash_db(db)
+
+    # Transaction içinde collection oluşturmamak için önceden oluştur
+    for name in ("financial_transactions", "audit_logs", "cash_movements", "unified_ledger"):
+        await db.create_collection(name)
+    await db.financial_transactions.create_index("code", unique=True)
+    await db.financial_transactions.create_index("idempotency_key", unique=True, sparse=True)
+
+    print(f"🔄 {count} sales per mode, concurrency {concurrency}, DB {BENCH_DB_NAME}")
+    results = []
+    for atomic in (False, True):
+        results.append(await run_mode(db, atomic, count, concurrency))
+
+    print()
+    print(f"{'Mode':<22}{'Sales':>8}{'Errors':>8}{'Sec':>8}{'Sales/s':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for r in results:
+        print(f"{r['mode']:<22}{r['sales']:>8}{r['errors']:>8}{r['seconds']:>8}"
+              f"{r['throughput']:>10}{r['p50_ms']:>9}{r['p95_ms']:>9}")
+
+    await client.drop_database(BENCH_DB_NAME)
+    client.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        int(args[0]) if len(args) > 0 else 500,
+        int(args[1]) if len(args) > 1 else 20
+    ))
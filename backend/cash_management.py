@@ -9,7 +9,10 @@ import uuid
 import logging
 
 # Unified Ledger imports
-from init_unified_ledger import create_ledger_entry, create_void_entry
+from init_unified_ledger import create_ledger_entry, create_void_entry, ledger_unit_of_work
+
+from utils.export import EXPORT_BATCH_SIZE, export_response
+from utils.pagination import InvalidCursorError, page_count, paginate
 
 logger = logging.getLogger(__name__)
 
@@ -66,17 +69,18 @@ async def get_current_user_from_request(request):
     """Get current user from request state (set by dependency)"""
     return getattr(request.state, 'user', None)
 
-async def update_cash_register_balance(cash_register_id: str, amount_change: float):
+async def update_cash_register_balance(cash_register_id: str, amount_change: float, session=None):
     """Update cash register balance after a movement"""
     result = await db.cash_registers.update_one(
         {"id": cash_register_id},
-        {"$inc": {"current_balance": amount_change}}
+        {"$inc": {"current_balance": amount_change}},
+        session=session
     )
     return result.modified_count > 0
 
-async def get_cash_register_balance(cash_register_id: str) -> float:
+async def get_cash_register_balance(cash_register_id: str, session=None) -> float:
     """Get current balance of a cash register"""
-    register = await db.cash_registers.find_one({"id": cash_register_id}, {"current_balance": 1})
+    register = await db.cash_registers.find_one({"id": cash_register_id}, {"current_balance": 1}, session=session)
     return register.get("current_balance", 0) if register else 0
 
 async def create_cash_movement_internal(
@@ -88,18 +92,22 @@ async def create_cash_movement_internal(
     reference_id: Optional[str] = None,
     description: Optional[str] = None,
     created_by: Optional[str] = None,
-    transaction_date: Optional[datetime] = None
+    transaction_date: Optional[datetime] = None,
+    session=None
 ) -> dict:
-    """Internal function to create cash movement - can be called from other modules"""
+    """
+    Internal function to create cash movement - can be called from other modules
+    session: Mongo transaction içinde çağrılıyorsa (atomik satış)
+    """
     
     # Calculate amount change (positive for IN, negative for OUT)
     amount_change = amount if movement_type == "IN" else -amount
     
     # Update balance first
-    await update_cash_register_balance(cash_register_id, amount_change)
+    await update_cash_register_balance(cash_register_id, amount_change, session=session)
     
     # Get new balance
-    new_balance = await get_cash_register_balance(cash_register_id)
+    new_balance = await get_cash_register_balance(cash_register_id, session=session)
     
     # Use provided transaction_date or current time
     tx_date = transaction_date or datetime.now(timezone.utc)
@@ -122,7 +130,7 @@ async def create_cash_movement_internal(
         "created_by": created_by
     }
     
-    await db.cash_movements.insert_one(movement)
+    await db.cash_movements.insert_one(movement, session=session)
     
     return movement
 
@@ -303,17 +311,12 @@ async def delete_cash_register(register_id: str):
 
 # ==================== CASH MOVEMENT ENDPOINTS ====================
 
-@cash_router.get("/cash-movements")
-async def get_cash_movements(
-    cash_register_id: Optional[str] = None,
-    type: Optional[str] = None,
-    reference_type: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    page: int = 1,
-    per_page: int = 20
-):
-    """Get cash movements with filters and pagination"""
+# transaction_date DESC + created_at DESC + id DESC (id tekil - keyset cursor)
+MOVEMENT_SORT = [("transaction_date", -1), ("created_at", -1), ("id", -1)]
+
+
+def _cash_movement_query(cash_register_id, type, reference_type, start_date, end_date) -> dict:
+    """Kasa hareketi liste ve export filtreleri"""
     query = {}
     
     if cash_register_id:
@@ -340,19 +343,32 @@ async def get_cash_movements(
                 query["created_at"] = {"$lte": end_dt}
         except ValueError:
             pass
+    return query
+
+
+@cash_router.get("/cash-movements")
+async def get_cash_movements(
+    cash_register_id: Optional[str] = None,
+    type: Optional[str] = None,
+    reference_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page: int = 1,
+    per_page: int = 20,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
+):
+    """Get cash movements with filters and pagination (page or cursor)"""
+    query = _cash_movement_query(cash_register_id, type, reference_type, start_date, end_date)
     
-    # Get total count
-    total_count = await db.cash_movements.count_documents(query)
-    total_pages = (total_count + per_page - 1) // per_page if total_count > 0 else 1
-    
-    # Get movements with pagination - EN SON YAPILAN EN ÜSTTE
-    # transaction_date DESC + created_at DESC + id DESC
-    skip = (page - 1) * per_page
-    movements = await db.cash_movements.find(query, {"_id": 0}).sort([
-        ("transaction_date", -1),
-        ("created_at", -1),
-        ("id", -1)
-    ]).skip(skip).limit(per_page).to_list(per_page)
+    # EN SON YAPILAN EN ÜSTTE - cursor varsa keyset, toplam sayı cache'li
+    try:
+        movements, page_info = await paginate(
+            db.cash_movements, query, MOVEMENT_SORT, page=page, per_page=per_page,
+            cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     # Enrich with cash register info
     for movement in movements:
@@ -367,11 +383,53 @@ async def get_cash_movements(
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total_pages": total_pages,
-            "total_records": total_count
+            "total_pages": page_count(page_info["total"], per_page, minimum=1),
+            "total_records": page_info["total"],
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
+@cash_router.get("/cash-movements/export")
+async def export_cash_movements(
+    cash_register_id: Optional[str] = None,
+    type: Optional[str] = None,
+    reference_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    format: str = "csv"
+):
+    """Kasa hareketlerini liste ile aynı filtrelerle CSV/XLSX olarak indir (akış halinde)"""
+    query = _cash_movement_query(cash_register_id, type, reference_type, start_date, end_date)
+    
+    # Kasa sayısı az - adlar bir kez okunur
+    registers = {
+        r["id"]: r for r in await db.cash_registers.find(
+            {}, {"_id": 0, "id": 1, "name": 1, "code": 1}
+        ).to_list(1000)
+    }
+    
+    def register_name(movement):
+        return (registers.get(movement.get("cash_register_id")) or {}).get("name")
+    
+    columns = [
+        ("Tarih", "transaction_date"),
+        ("Kasa", register_name),
+        ("Tip", "type"),
+        ("Tutar", "amount"),
+        ("Para Birimi", "currency"),
+        ("Bakiye", "balance_after"),
+        ("Açıklama", "description"),
+        ("Referans Tipi", "reference_type"),
+        ("Referans", "reference_id"),
+        ("Oluşturma", "created_at"),
+        ("Hareket ID", "id"),
+    ]
+    cursor = db.cash_movements.find(query, {"_id": 0}).sort(MOVEMENT_SORT).batch_size(EXPORT_BATCH_SIZE)
+    
+    filename = f"kasa-hareketleri-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M')}"
+    return export_response(cursor, columns, format, filename)
+
 @cash_router.post("/cash-movements", status_code=201)
 async def create_cash_movement(data: CashMovementCreate):
     """Create a manual cash movement"""
@@ -440,79 +498,81 @@ async def create_opening_balance(data: OpeningBalanceCreate):
     """Create opening balance entries for multiple cash registers"""
     results = []
     
-    for balance_item in data.balances:
-        if balance_item.amount <= 0:
-            continue
-        
-        # Verify cash register exists
-        register = await db.cash_registers.find_one({"id": balance_item.cash_register_id})
-        
-        if not register:
-            results.append({
+    # Tüm kasaların OPENING_BALANCE ledger kayıtları tek insert_many ile yazılır
+    async with ledger_unit_of_work():
+        for balance_item in data.balances:
+            if balance_item.amount <= 0:
+                continue
+            
+            # Verify cash register exists
+            register = await db.cash_registers.find_one({"id": balance_item.cash_register_id})
+            
+            if not register:
+                results.append({
+                    "cash_register_id": balance_item.cash_register_id,
+                    "success": False,
+                    "error": "Kasa bulunamadı"
+                })
+                continue
+            
+            # Check if opening balance already exists for this register
+            existing_opening = await db.cash_movements.find_one({
                 "cash_register_id": balance_item.cash_register_id,
-                "success": False,
-                "error": "Kasa bulunamadı"
+                "reference_type": "OPENING"
             })
-            continue
-        
-        # Check if opening balance already exists for this register
-        existing_opening = await db.cash_movements.find_one({
-            "cash_register_id": balance_item.cash_register_id,
-            "reference_type": "OPENING"
-        })
-        
-        if existing_opening:
+            
+            if existing_opening:
+                results.append({
+                    "cash_register_id": balance_item.cash_register_id,
+                    "cash_register_name": register.get("name"),
+                    "success": False,
+                    "error": "Bu kasa için açılış bakiyesi zaten girilmiş"
+                })
+                continue
+            
+            # Create opening balance movement
+            movement = await create_cash_movement_internal(
+                cash_register_id=balance_item.cash_register_id,
+                movement_type="IN",
+                amount=balance_item.amount,
+                currency=register.get("currency", "TRY"),
+                reference_type="OPENING",
+                description=f"Açılış bakiyesi - {data.date}"
+            )
+            
+            # ==================== UNIFIED LEDGER KAYDI (OPENING_BALANCE) ====================
+            try:
+                await create_ledger_entry(
+                    entry_type="OPENING_BALANCE",
+                    transaction_date=datetime.now(timezone.utc),
+                    
+                    has_in=0,
+                    has_out=0,
+                    
+                    currency=register.get("currency", "TRY"),
+                    amount_in=balance_item.amount,
+                    amount_out=0,
+                    
+                    cash_register_id=balance_item.cash_register_id,
+                    cash_register_name=register.get("name"),
+                    
+                    reference_type="cash_movements",
+                    reference_id=movement.get("id"),
+                    
+                    description=f"Açılış bakiyesi: {register.get('name')} ({balance_item.amount:.2f} {register.get('currency', 'TRY')})",
+                    created_by=None
+                )
+                logger.info(f"Opening balance ledger entry created: {movement.get('id')}")
+            except Exception as e:
+                logger.error(f"Failed to create opening balance ledger entry: {e}")
+            
             results.append({
                 "cash_register_id": balance_item.cash_register_id,
                 "cash_register_name": register.get("name"),
-                "success": False,
-                "error": "Bu kasa için açılış bakiyesi zaten girilmiş"
+                "success": True,
+                "amount": balance_item.amount,
+                "movement_id": movement.get("id")
             })
-            continue
-        
-        # Create opening balance movement
-        movement = await create_cash_movement_internal(
-            cash_register_id=balance_item.cash_register_id,
-            movement_type="IN",
-            amount=balance_item.amount,
-            currency=register.get("currency", "TRY"),
-            reference_type="OPENING",
-            description=f"Açılış bakiyesi - {data.date}"
-        )
-        
-        # ==================== UNIFIED LEDGER KAYDI (OPENING_BALANCE) ====================
-        try:
-            await create_ledger_entry(
-                entry_type="OPENING_BALANCE",
-                transaction_date=datetime.now(timezone.utc),
-                
-                has_in=0,
-                has_out=0,
-                
-                currency=register.get("currency", "TRY"),
-                amount_in=balance_item.amount,
-                amount_out=0,
-                
-                cash_register_id=balance_item.cash_register_id,
-                cash_register_name=register.get("name"),
-                
-                reference_type="cash_movements",
-                reference_id=movement.get("id"),
-                
-                description=f"Açılış bakiyesi: {register.get('name')} ({balance_item.amount:.2f} {register.get('currency', 'TRY')})",
-                created_by=None
-            )
-            logger.info(f"Opening balance ledger entry created: {movement.get('id')}")
-        except Exception as e:
-            logger.error(f"Failed to create opening balance ledger entry: {e}")
-        
-        results.append({
-            "cash_register_id": balance_item.cash_register_id,
-            "cash_register_name": register.get("name"),
-            "success": True,
-            "amount": balance_item.amount,
-            "movement_id": movement.get("id")
-        })
     
     return {
         "date": data.date,
@@ -621,9 +681,11 @@ async def create_transfer(data: TransferCreate):
 async def get_register_movements(
     register_id: str,
     page: int = 1,
-    per_page: int = 20
+    per_page: int = 20,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
 ):
-    """Get movements for a specific cash register"""
+    """Get movements for a specific cash register (page or cursor)"""
     register = await db.cash_registers.find_one({"id": register_id}, {"_id": 0})
     
     if not register:
@@ -631,11 +693,13 @@ async def get_register_movements(
     
     # Get movements
     query = {"cash_register_id": register_id}
-    total_count = await db.cash_movements.count_documents(query)
-    total_pages = (total_count + per_page - 1) // per_page
-    
-    skip = (page - 1) * per_page
-    movements = await db.cash_movements.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(per_page).to_list(per_page)
+    try:
+        movements, page_info = await paginate(
+            db.cash_movements, query, [("created_at", -1), ("id", -1)], page=page, per_page=per_page,
+            cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "register": register,
@@ -643,8 +707,10 @@ async def get_register_movements(
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total_pages": total_pages,
-            "total_records": total_count
+            "total_pages": page_count(page_info["total"], per_page),
+            "total_records": page_info["total"],
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tekrarlanan BACKFILL price snapshot'larını gün başına tek kayda indirir ve
+financial_transactions.price_snapshot_id referanslarını yönlendirir.
+
+Kullanım:
+    python compact_backfill_snapshots.py            # Uygula
+    python compact_backfill_snapshots.py --dry-run  # Sadece say
+"""
+import asyncio
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'kuyumcu_db')
+
+from price_snapshot_service import compact_backfill_snapshots
+
+
+async def main(dry_run: bool):
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    
+    print(f"🔄 Compacting BACKFILL snapshots in {DB_NAME}{' (dry run)' if dry_run else ''}...")
+    
+    stats = await compact_backfill_snapshots(db, dry_run=dry_run)
+    
+    print(f"📊 Days: {stats['days']}")
+    print(f"🗑️  Duplicates removed: {stats['removed']}")
+    print(f"🔗 Transactions repointed: {stats['repointed_transactions']}")
+    
+    client.close()
+    print("✅ Compaction completed!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main("--dry-run" in sys.argv[1:]))
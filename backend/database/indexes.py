@@ -8,11 +8,13 @@ FELSEFE:
 - Sadece gerçekten kullanılan sorgular için index
 - Veri büyüdükçe ihtiyaç oldukça eklenir
 
-TOPLAM: ~27 index
+TOPLAM: ~35 index
 """
 
 import logging
 
+from market_storage import MARKET_RAW_RETENTION_DAYS
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,12 +39,18 @@ async def init_database_indexes(db):
         await db.products.create_index("barcode", unique=True, sparse=True)
         await db.products.create_index([("stock_status_id", 1), ("product_type_id", 1)])
         await db.products.create_index("supplier_party_id", sparse=True)  # Yeni eklendi
-        logger.info("✅ PRODUCTS: 4 index")
+        # get_stock_pool_info $group: covering (match + sum alanları index'te)
+        await db.products.create_index([
+            ("product_type_id", 1), ("karat_id", 1), ("stock_status_id", 1),
+            ("weight_gram", 1), ("total_cost_has", 1)
+        ])
+        logger.info("✅ PRODUCTS: 5 index")
         
         # ==================== FINANCIAL_TRANSACTIONS ====================
         await db.financial_transactions.create_index("code", unique=True)
         await db.financial_transactions.create_index([("party_id", 1), ("transaction_date", -1)])
-        await db.financial_transactions.create_index([("transaction_date", -1)])
+        # Liste sıralaması + keyset tiebreaker (code tekil)
+        await db.financial_transactions.create_index([("transaction_date", -1), ("code", -1)])
         await db.financial_transactions.create_index("idempotency_key", unique=True, sparse=True)
         await db.financial_transactions.create_index("type_code")  # Yeni eklendi
         logger.info("✅ FINANCIAL_TRANSACTIONS: 5 index")
@@ -51,17 +59,103 @@ async def init_database_indexes(db):
         await db.unified_ledger.create_index("id", unique=True)
         await db.unified_ledger.create_index([("transaction_date", -1), ("type", 1)])
         await db.unified_ledger.create_index([("party_id", 1), ("transaction_date", -1)])
-        logger.info("✅ UNIFIED_LEDGER: 3 index")
+        # Ledger listeleri / export: sıralama + keyset tiebreaker (id tekil)
+        await db.unified_ledger.create_index([("transaction_date", -1), ("created_at", -1), ("id", -1)])
+        logger.info("✅ UNIFIED_LEDGER: 4 index")
+        
+        # ==================== LEDGER_CHECKPOINTS ====================
+        # Dönem başına (scope, key) tek kayıt; okuma scope + key + dönem aralığı
+        # stale: sadece invalidation sonrası birkaç kayıt (partial)
+        await db.ledger_checkpoints.create_index([("period_code", 1), ("scope", 1), ("key", 1)], unique=True)
+        await db.ledger_checkpoints.create_index([("scope", 1), ("key", 1), ("period_start", 1)])
+        await db.ledger_checkpoints.create_index("period_code", partialFilterExpression={"stale": True})
+        logger.info("✅ LEDGER_CHECKPOINTS: 3 index")
+        
+        # ==================== PROFIT_LOSS_DAILY ====================
+        # Gün + kategori başına tek rollup satırı ($inc upsert), rapor aralığı date ile
+        await db.profit_loss_daily.create_index([("date", 1), ("category", 1)], unique=True)
+        logger.info("✅ PROFIT_LOSS_DAILY: 1 index")
+        
+        # ==================== REPORT_JOBS ====================
+        # expire_at TTL: biten işler ve sonuçları REPORT_JOB_TTL_HOURS sonra silinir
+        await db.report_jobs.create_index("id", unique=True)
+        await db.report_jobs.create_index([("created_by", 1), ("created_at", -1)])
+        await db.report_jobs.create_index("expire_at", expireAfterSeconds=0)
+        logger.info("✅ REPORT_JOBS: 3 index")
         
         # ==================== CASH ====================
         await db.cash_registers.create_index("id", unique=True)
-        await db.cash_movements.create_index([("cash_register_id", 1), ("created_at", -1)])
-        await db.cash_movements.create_index([("transaction_date", -1)])  # Yeni eklendi
+        await db.cash_movements.create_index([("cash_register_id", 1), ("created_at", -1), ("id", -1)])
+        # Liste sıralaması + keyset tiebreaker (id tekil)
+        await db.cash_movements.create_index([("transaction_date", -1), ("created_at", -1), ("id", -1)])
         logger.info("✅ CASH: 3 index")
         
+        # ==================== PRICE_SNAPSHOTS ====================
+        # get_or_create_price_snapshot: as_of <= t sort as_of desc (geçmiş tarih fallback)
+        # market_websocket debounce: source + as_of desc
+        await db.price_snapshots.create_index([("as_of", -1)])
+        await db.price_snapshots.create_index([("source", 1), ("as_of", -1)])
+        # BACKFILL: gün başına tek snapshot (idempotent upsert)
+        # as_of_bucket'sız eski kayıtlar partial filter dışında kalır;
+        # onları birleştirmek için compact_backfill_snapshots.py
+        try:
+            await db.price_snapshots.create_index(
+                [("source", 1), ("as_of_bucket", 1)],
+                unique=True,
+                partialFilterExpression={"source": "BACKFILL", "as_of_bucket": {"$exists": True}}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ PRICE_SNAPSHOTS backfill index oluşturulamadı (compact_backfill_snapshots.py çalıştırın): {e}")
+        logger.info("✅ PRICE_SNAPSHOTS: 3 index")
+        
+        # ==================== MARKET DATA ====================
+        # market_bars: (resolution, bucket_start) upsert + aralık sorguları
+        # expire_at sadece 1m bar'larda var (1h/1d kalıcı)
+        # market_data: ham tick retention (recorded_at TTL)
+        await db.market_bars.create_index([("resolution", 1), ("bucket_start", -1)], unique=True)
+        await db.market_bars.create_index("expire_at", expireAfterSeconds=0)
+        try:
+            await db.market_data.create_index(
+                "recorded_at", expireAfterSeconds=MARKET_RAW_RETENTION_DAYS * 86400
+            )
+        except Exception as e:
+            # Retention süresi değiştiyse TTL index yeniden oluşturulmalı (collMod)
+            logger.warning(f"⚠️ MARKET_DATA TTL index oluşturulamadı: {e}")
+        logger.info("✅ MARKET DATA: 3 index")
+        
+        # ==================== STOCK_POOLS ====================
+        # Atomik upsert (add_to_stock_pool) için tekil havuz
+        await db.stock_pools.create_index("id", unique=True)
+        logger.info("✅ STOCK_POOLS: 1 index")
+        
+        # ==================== STOCK_LOTS ====================
+        # FIFO lot kuyruğu yükleme: type + karat + ACTIVE, purchase_date sırası
+        await db.stock_lots.create_index("id", unique=True)
+        await db.stock_lots.create_index([
+            ("product_type_id", 1), ("karat_id", 1), ("status", 1), ("purchase_date", 1)
+        ])
+        logger.info("✅ STOCK_LOTS: 2 index")
+        
         # ==================== USERS ====================
         await db.users.create_index("email", unique=True)
-        logger.info("✅ USERS: 1 index")
+        # get_current_user cache miss: id ile tek kayıt (collection scan olmasın)
+        try:
+            await db.users.create_index("id", unique=True)
+        except Exception as e:
+            logger.warning(f"users.id unique index oluşturulamadı: {e}")
+        logger.info("✅ USERS: 2 index")
+        
+        # ==================== STOCK_COUNT_ITEMS ====================
+        # Sayım kalemleri listesi: count_id + liste sıralaması (keyset)
+        await db.stock_count_items.create_index([
+            ("count_id", 1), ("category", 1), ("product_type", 1), ("karat", 1), ("barcode", 1), ("id", 1)
+        ])
+        logger.info("✅ STOCK_COUNT_ITEMS: 1 index")
+        
+        # ==================== ACTIVITY_LOGS ====================
+        # Log listesi: created_at DESC + id (keyset)
+        await db.activity_logs.create_index([("created_at", -1), ("id", -1)])
+        logger.info("✅ ACTIVITY_LOGS: 1 index")
         
         # ==================== LOOKUP TABLOLARI ====================
         lookups = [
@@ -90,7 +184,7 @@ async def init_database_indexes(db):
         logger.info(f"✅ DİĞER: {len(small_tables)} index")
         
         # ==================== ÖZET ====================
-        total_indexes = 2 + 4 + 5 + 3 + 3 + 1 + len(lookups) + len(small_tables)
+        total_indexes = 2 + 5 + 5 + 4 + 3 + 1 + 3 + 3 + 3 + 3 + 1 + 2 + 2 + 1 + 1 + len(lookups) + len(small_tables)
         logger.info(f"📊 TOPLAM: {total_indexes} index oluşturuldu (minimal strateji)")
         
     except Exception as e:
@@ -0,0 +1,144 @@
+"""
+Mongo multi-document transaction helpers
+
+Servis fonksiyonları db'yi parametre olarak alır ve db.<collection>.<op>()
+çağırır. SessionDatabase bu çağrılara otomatik session=... ekler; böylece
+aynı servis kodu transaction içinde değişmeden çalışır.
+
+Transaction'lar replica set (veya sharded cluster) gerektirir.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# session parametresi alan collection metodları
+_SESSION_METHODS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write", "aggregate", "count_documents", "distinct",
+}
+
+
+class SessionCollection:
+    """Collection proxy: desteklenen metodlara session ekler"""
+
+    def __init__(self, collection, session):
+        self._collection = collection
+        self._session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in _SESSION_METHODS and callable(attr):
+            def with_session(*args, **kwargs):
+                kwargs.setdefault("session", self._session)
+                return attr(*args, **kwargs)
+            return with_session
+        return attr
+
+
+class SessionDatabase:
+    """Database proxy: tüm collection erişimleri aynı session'a bağlı"""
+
+    def __init__(self, database, session):
+        self.database = database
+        self.session = session
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return SessionCollection(getattr(self.database, name), self.session)
+
+    def __getitem__(self, name):
+        return SessionCollection(self.database[name], self.session)
+
+
+def unwrap_session(db) -> Tuple[Any, Any]:
+    """(ham database, session) - SessionDatabase değilse session None"""
+    if isinstance(db, SessionDatabase):
+        return db.database, db.session
+    return db, None
+
+
+# id(session) -> commit sonrası çalışacak callback'ler (run_in_transaction yönetir)
+_after_commit: Dict[int, List[Callable[[], Awaitable[Any]]]] = {}
+
+
+def defer_until_commit(session, callback: Callable[[], Awaitable[Any]]) -> bool:
+    """
+    callback'i transaction commit olduktan sonra (session'sız) çalıştır
+
+    Türetilmiş toplamlar (rollup, sayaç) için: transaction içinde aynı
+    dokümanı güncelleyen eşzamanlı satışlar write conflict'e düşmez, abort
+    olan transaction'ın etkisi hiç yazılmaz. Session run_in_transaction'a ait
+    değilse False döner (caller kendisi yazmalı).
+    """
+    callbacks = _after_commit.get(id(session))
+    if callbacks is None:
+        return False
+    callbacks.append(callback)
+    return True
+
+
+async def _run_after_commit(callbacks):
+    for callback in callbacks:
+        try:
+            await callback()
+        except Exception as e:
+            # Transaction commit oldu; türetilmiş veri yeniden hesaplanarak düzeltilebilir
+            logger.error(f"After-commit callback failed: {e}")
+
+
+def _has_label(exc: Exception, label: str) -> bool:
+    return isinstance(exc, PyMongoError) and exc.has_error_label(label)
+
+
+async def run_in_transaction(db, operation: Callable[[SessionDatabase], Awaitable[Any]],
+                             max_retries: int = 3, retry_delay: float = 0.05):
+    """
+    operation(session_db)'yi tek Mongo transaction içinde çalıştır
+
+    - TransientTransactionError: tüm operasyon baştan tekrar denenir
+      (write conflict, primary değişimi vb.) - max_retries kez
+    - UnknownTransactionCommitResult: sadece commit tekrar denenir
+    - Diğer hatalar: transaction abort edilir, hata yukarı fırlatılır
+    """
+    attempt = 0
+    async with await db.client.start_session() as session:
+        while True:
+            attempt += 1
+            session.start_transaction()
+            _after_commit[id(session)] = []
+            try:
+                result = await operation(SessionDatabase(db, session))
+            except Exception as e:
+                _after_commit.pop(id(session), None)
+                if session.in_transaction:
+                    await session.abort_transaction()
+                if _has_label(e, "TransientTransactionError") and attempt <= max_retries:
+                    logger.warning(f"Transient transaction error (attempt {attempt}), retrying: {e}")
+                    await asyncio.sleep(retry_delay * attempt)
+                    continue
+                raise
+
+            commit_attempt = 0
+            while True:
+                commit_attempt += 1
+                try:
+                    await session.commit_transaction()
+                except PyMongoError as e:
+                    if _has_label(e, "UnknownTransactionCommitResult") and commit_attempt <= max_retries:
+                        logger.warning(f"Unknown commit result, retrying commit: {e}")
+                        continue
+                    _after_commit.pop(id(session), None)
+                    if _has_label(e, "TransientTransactionError") and attempt <= max_retries:
+                        break  # Tüm operasyonu tekrar dene
+                    raise
+                await _run_after_commit(_after_commit.pop(id(session), []))
+                return result
+
+            logger.warning(f"Transient commit error (attempt {attempt}), retrying transaction")
+            await asyncio.sleep(retry_delay * attempt)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Eski market_data tick'lerini market_bars (1m / 1h / 1d OHLC) düzenine taşır,
+retention dışındaki ham tick'leri siler ve price_snapshots.raw_payload'ı
+kullanılan sembollere indirir. Tekrar çalıştırılabilir: taşınan tick'lere
+recorded_at yazıldığı için ikinci çalıştırmada bar'lara yeniden eklenmez.
+
+Kullanım:
+    python downsample_market_data.py
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'kuyumcu_db')
+
+from market_storage import compact_market_storage, MARKET_RAW_RETENTION_DAYS
+
+
+async def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    
+    print(f"🔄 Downsampling market_data in {DB_NAME} (raw retention: {MARKET_RAW_RETENTION_DAYS} days)...")
+    
+    stats = await compact_market_storage(db)
+    
+    print(f"📈 Ticks aggregated: {stats['ticks']}")
+    print(f"🧱 Bar upserts: {stats['bar_upserts']}")
+    print(f"🗑️  Old ticks deleted: {stats['deleted']}")
+    print(f"✂️  Snapshot payloads trimmed: {stats['snapshots_trimmed']}")
+    
+    client.close()
+    print("✅ Downsampling completed!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
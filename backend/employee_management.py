@@ -12,6 +12,8 @@ import logging
 # Import unified ledger for dual-write
 from init_unified_ledger import create_ledger_entry, create_void_entry
 
+from utils.pagination import InvalidCursorError, page_count, paginate
+
 logger = logging.getLogger(__name__)
 
 # Router
@@ -295,9 +297,11 @@ async def get_salary_movements(
     period: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    type: Optional[str] = None
+    type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
 ):
-    """Get salary movements with pagination and filters"""
+    """Get salary movements with pagination (page or cursor) and filters"""
     query = {}
     
     if employee_id:
@@ -314,23 +318,24 @@ async def get_salary_movements(
         else:
             query["movement_date"] = {"$lte": end_date}
     
-    # Count total
-    total = await db.salary_movements.count_documents(query)
-    
     # Get movements sorted by movement_date DESC
-    movements = await db.salary_movements.find(query, {"_id": 0}).sort([
-        ("movement_date", -1),
-        ("created_at", -1),
-        ("id", -1)
-    ]).skip((page - 1) * per_page).limit(per_page).to_list(per_page)
+    try:
+        movements, page_info = await paginate(
+            db.salary_movements, query, [("movement_date", -1), ("created_at", -1), ("id", -1)],
+            page=page, per_page=per_page, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "movements": movements,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": ceil(total / per_page) if total > 0 else 1
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page, minimum=1),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -497,9 +502,11 @@ async def get_employee_debts(
     employee_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    type: Optional[str] = None
+    type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
 ):
-    """Get employee debt movements with pagination and filters"""
+    """Get employee debt movements with pagination (page or cursor) and filters"""
     query = {}
     
     if employee_id:
@@ -514,23 +521,24 @@ async def get_employee_debts(
         else:
             query["movement_date"] = {"$lte": end_date}
     
-    # Count total
-    total = await db.employee_debts.count_documents(query)
-    
     # Get movements sorted by movement_date DESC
-    movements = await db.employee_debts.find(query, {"_id": 0}).sort([
-        ("movement_date", -1),
-        ("created_at", -1),
-        ("id", -1)
-    ]).skip((page - 1) * per_page).limit(per_page).to_list(per_page)
+    try:
+        movements, page_info = await paginate(
+            db.employee_debts, query, [("movement_date", -1), ("created_at", -1), ("id", -1)],
+            page=page, per_page=per_page, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "movements": movements,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": ceil(total / per_page) if total > 0 else 1
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page, minimum=1),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -5,6 +5,12 @@ from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 import uuid
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from price_snapshot_service import (
+    find_price_snapshot_as_of, find_latest_price_snapshot, backfill_bucket
+)
 
 def round_has(value: float) -> float:
     """HAS değerlerini 6 ondalığa yuvarla"""
@@ -28,33 +34,29 @@ async def get_or_create_price_snapshot(db, transaction_date: datetime) -> dict:
     
     Mantık:
     1. as_of <= transaction_date olan en yakın snapshot'ı ara
+       (önce bellekteki price snapshot cache, geçmiş tarihler için indexli DB)
     2. Bulamazsan:
        - Son snapshot'ı al
-       - as_of=transaction_date ile yeni BACKFILL snapshot oluştur
+       - O gün için tek bir BACKFILL snapshot oluştur veya mevcut olanı kullan
+         (source + as_of_bucket unique, upsert ile idempotent)
     """
     
     # Snapshot ara
-    snapshot = await db.price_snapshots.find_one(
-        {"as_of": {"$lte": transaction_date}},
-        sort=[("as_of", -1)]
-    )
+    snapshot = await find_price_snapshot_as_of(db, transaction_date)
     
     if snapshot:
         return snapshot
     
     # Snapshot yok, son snapshot'tan backfill oluştur
-    latest_snapshot = await db.price_snapshots.find_one(
-        {},
-        sort=[("as_of", -1)]
-    )
+    latest_snapshot = await find_latest_price_snapshot(db)
     
     if not latest_snapshot:
         raise ValueError("No price snapshot available. Please initialize price snapshots or run Harem socket service.")
     
-    # Backfill snapshot oluştur
+    # Backfill snapshot: gün başına tek kayıt (as_of = günün başı)
+    bucket, day_start = backfill_bucket(transaction_date)
     backfill = {
-        "as_of": transaction_date,
-        "source": "BACKFILL",
+        "as_of": day_start,
         "has_buy_tl": latest_snapshot["has_buy_tl"],
         "has_sell_tl": latest_snapshot["has_sell_tl"],
         "usd_buy_tl": latest_snapshot.get("usd_buy_tl"),
@@ -66,10 +68,17 @@ async def get_or_create_price_snapshot(db, transaction_date: datetime) -> dict:
         "created_by": "system"
     }
     
-    result = await db.price_snapshots.insert_one(backfill)
-    backfill["_id"] = result.inserted_id
-    
-    return backfill
+    key = {"source": "BACKFILL", "as_of_bucket": bucket}
+    try:
+        return await db.price_snapshots.find_one_and_update(
+            key,
+            {"$setOnInsert": backfill},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Eşzamanlı upsert yarışı - diğer istek oluşturdu
+        return await db.price_snapshots.find_one(key)
 
 def calculate_material_has(
     line_data: dict,
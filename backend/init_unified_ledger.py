@@ -13,10 +13,19 @@ Para İşaret Kuralları:
 - amount_net = amount_in - amount_out
 """
 
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
+from typing import Optional
+import time
 import uuid
 import logging
 
+from ledger_checkpoints import mark_entries_written
+from profit_loss_rollups import apply_profit_loss_rollups
+from report_cache import bump_report_sequence
+from database.transactions import defer_until_commit
+
 logger = logging.getLogger("unified_ledger")
 
 # Database reference
@@ -69,6 +78,171 @@ LEDGER_TYPES = [
     "VOID",              # İptal kaydı (silme tersi)
 ]
 
+# ==================== WRITE BUFFER (UNIT OF WORK) ====================
+# Bir iş operasyonu (satış, transfer, maaş ödemesi...) sırasında oluşan tüm
+# ledger kayıtları bellekte toplanır ve blok sonunda tek ordered insert_many
+# ile yazılır. Buffer contextvar'da tutulur; create_ledger_entry /
+# create_adjustment_entry / create_void_entry aktif buffer varsa ona ekler,
+# yoksa eskisi gibi insert_one yapar.
+
+ledger_write_stats = {
+    "flushes": 0,
+    "entries_flushed": 0,
+    "direct_inserts": 0,     # Buffer dışında yazılan kayıtlar
+    "last_flush_size": 0,
+    "max_flush_size": 0,
+    "last_flush_ms": 0.0,
+    "total_flush_ms": 0.0,
+    "failed_flushes": 0,
+}
+
+
+class LedgerWriteBuffer:
+    """Tek iş operasyonunun ledger kayıtları"""
+
+    def __init__(self, session=None):
+        self.session = session
+        self.entries = []
+
+    def add(self, entry: dict):
+        self.entries.append(entry)
+
+    def find_by_reference(self, reference_type: str, reference_id: str, exclude_adjustments: bool = True):
+        """Henüz yazılmamış kayıtlar arasında referans ara (son eklenen önce)"""
+        for entry in reversed(self.entries):
+            if entry.get("reference_type") != reference_type or entry.get("reference_id") != reference_id:
+                continue
+            if exclude_adjustments and entry.get("is_adjustment"):
+                continue
+            return entry
+        return None
+
+    async def flush(self):
+        """Toplanan kayıtları tek ordered insert_many ile yaz"""
+        if not self.entries:
+            return
+
+        batch = self.entries
+        self.entries = []
+
+        started = time.perf_counter()
+        try:
+            await db.unified_ledger.insert_many(batch, ordered=True, session=self.session)
+        except Exception as e:
+            ledger_write_stats["failed_flushes"] += 1
+            # Transaction içindeyse iş yazımları da abort olmalı - hatayı yukarı ilet
+            if self.session is not None:
+                raise
+            # Session yoksa iş kayıtları zaten yazıldı; hata döndürmek client
+            # retry'ında işlemi tekrar ettirir (eski per-service try/except gibi logla)
+            logger.error(
+                f"Ledger flush failed, {len(batch)} entries not written "
+                f"({', '.join(str(entry.get('reference_id')) for entry in batch)}): {e}"
+            )
+            return
+        finally:
+            # insert_many dokümanlara _id ekler; dönen kayıtlar _id'siz kalsın
+            for entry in batch:
+                entry.pop("_id", None)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ledger_write_stats["flushes"] += 1
+        ledger_write_stats["entries_flushed"] += len(batch)
+        ledger_write_stats["last_flush_size"] = len(batch)
+        ledger_write_stats["max_flush_size"] = max(ledger_write_stats["max_flush_size"], len(batch))
+        ledger_write_stats["last_flush_ms"] = round(elapsed_ms, 2)
+        ledger_write_stats["total_flush_ms"] = round(ledger_write_stats["total_flush_ms"] + elapsed_ms, 2)
+        logger.info(f"Ledger flush: {len(batch)} entries ({', '.join(e['type'] for e in batch)}) in {elapsed_ms:.1f}ms")
+
+        await _after_ledger_write(batch, self.session)
+
+
+_current_buffer: ContextVar[Optional[LedgerWriteBuffer]] = ContextVar("ledger_write_buffer", default=None)
+
+
+@asynccontextmanager
+async def ledger_unit_of_work(session=None):
+    """
+    Blok içindeki tüm ledger kayıtlarını tek insert_many ile yaz
+
+    session: Verilirse flush bu session ile (caller'ın transaction'ı içinde)
+    yapılır; blok hata ile biterse kayıtlar yazılmaz (transaction abort olur).
+    Session yoksa hata durumunda da o ana kadar toplanan kayıtlar yazılır -
+    diğer koleksiyonlara yazılmış belgeler ledger'sız kalmasın (eski
+    insert_one davranışıyla aynı sonuç). Bu modda flush hatası loglanır,
+    isteğe yansıtılmaz (iş kayıtları commit edilmiş durumda).
+
+    İç içe kullanımda aynı session'a sahip dış buffer kullanılır, flush dış
+    blokta olur. Farklı session ile açılan iç blok (ör. transaction modunda
+    satış) kendi buffer'ını kullanır ve kendi transaction'ında flush eder.
+    """
+    outer = _current_buffer.get()
+    if outer is not None and (session is None or outer.session is session):
+        yield outer
+        return
+
+    buffer = LedgerWriteBuffer(session)
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    except BaseException:
+        _current_buffer.reset(token)
+        if session is None:
+            await buffer.flush()
+        raise
+    _current_buffer.reset(token)
+    await buffer.flush()
+
+
+def get_ledger_write_stats() -> dict:
+    """Ledger yazım metrikleri"""
+    flushes = ledger_write_stats["flushes"]
+    return {
+        **ledger_write_stats,
+        "avg_entries_per_flush": round(ledger_write_stats["entries_flushed"] / flushes, 2) if flushes else 0,
+        "avg_flush_ms": round(ledger_write_stats["total_flush_ms"] / flushes, 2) if flushes else 0,
+    }
+
+
+async def _after_ledger_write(entries: list, session=None):
+    """
+    Türetilmiş toplamları güncelle: günlük Kar/Zarar rollup'ları, kapalı
+    döneme düşen kayıtlar için checkpoint invalidation ve rapor cache sayacı
+
+    Transaction içindeyse commit sonrasına ertelenir (aynı gün/kategori
+    satırlarında write conflict olmasın, abort olan kayıt sayılmasın).
+    """
+    if session is not None and defer_until_commit(session, lambda: _after_ledger_write(entries)):
+        return
+    try:
+        await apply_profit_loss_rollups(db, entries, session=session)
+        await mark_entries_written(db, entries, session=session)
+        await bump_report_sequence(db, "ledger", session=session)
+    except Exception as e:
+        # Transaction içindeyse türetilmiş yazımlar da abort olmalı - hatayı yukarı ilet
+        if session is not None:
+            raise
+        logger.error(f"Ledger derived totals update failed: {e}")
+
+
+async def write_ledger_entry(entry: dict):
+    """
+    Hazır ledger kaydını yaz: aktif buffer varsa ekle, yoksa doğrudan yaz
+
+    create_ledger_entry'nin alan şemasına uymayan kayıtlar (ör. ürün girişi)
+    için; rollup / checkpoint / rapor sayacı güncellemeleri aynı yoldan geçer.
+    """
+    buffer = _current_buffer.get()
+    if buffer is not None:
+        buffer.add(entry)
+        return
+
+    await db.unified_ledger.insert_one(entry)
+    entry.pop("_id", None)
+    ledger_write_stats["direct_inserts"] += 1
+    await _after_ledger_write([entry])
+
+
 def generate_ledger_id():
     """Generate unique ledger entry ID"""
     date_str = datetime.now().strftime("%Y%m%d")
@@ -200,11 +374,9 @@ async def create_ledger_entry(
         "notes": notes
     }
     
-    await db.unified_ledger.insert_one(ledger_entry)
-    logger.info(f"Ledger entry created: {ledger_entry['id']} - {entry_type} - party: {party_name}")
+    await write_ledger_entry(ledger_entry)
+    logger.debug(f"Ledger entry created: {ledger_entry['id']} - {entry_type} - party: {party_name}")
     
-    # Return without _id
-    ledger_entry.pop("_id", None)
     return ledger_entry
 
 async def init_unified_ledger_indexes():
@@ -227,7 +399,8 @@ async def init_unified_ledger_indexes():
         
         # Composite indexler (sık kullanılan sorgular için)
         await db.unified_ledger.create_index([("transaction_date", -1), ("type", 1)])
-        await db.unified_ledger.create_index([("party_id", 1), ("transaction_date", -1)])
+        # Ekstre keyset sayfalama ve açılış bakiyesi: party + (tarih, id) sırası
+        await db.unified_ledger.create_index([("party_id", 1), ("transaction_date", -1), ("id", -1)])
         await db.unified_ledger.create_index([("type", 1), ("transaction_date", -1)])
         
         logger.info("✅ Unified ledger indexes created")
@@ -242,6 +415,14 @@ async def find_ledger_entry_by_reference(reference_type: str, reference_id: str,
     """Referans bilgisine göre orijinal ledger kaydını bul"""
     if db is None:
         return None
+    
+    # Aynı operasyonda henüz flush edilmemiş kayıt olabilir
+    buffer = _current_buffer.get()
+    if buffer is not None:
+        pending = buffer.find_by_reference(reference_type, reference_id, exclude_adjustments)
+        if pending is not None:
+            return dict(pending)
+    
     query = {"reference_type": reference_type, "reference_id": reference_id}
     if exclude_adjustments:
         query["is_adjustment"] = {"$ne": True}
@@ -293,9 +474,8 @@ async def create_adjustment_entry(
         "description": f"DÜZELTME: {adjustment_reason}"
     }
     
-    await db.unified_ledger.insert_one(entry)
-    logger.info(f"ADJUSTMENT created: {entry['id']}")
-    entry.pop("_id", None)
+    await write_ledger_entry(entry)
+    logger.debug(f"ADJUSTMENT created: {entry['id']}")
     return entry
 
 
@@ -389,7 +569,6 @@ async def create_void_entry(
         "description": f"İPTAL: {void_reason}"
     }
     
-    await db.unified_ledger.insert_one(entry)
-    logger.info(f"VOID created: {entry['id']}")
-    entry.pop("_id", None)
+    await write_ledger_entry(entry)
+    logger.debug(f"VOID created: {entry['id']}")
     return entry
@@ -4,6 +4,9 @@ from typing import List, Optional
 from datetime import datetime, timezone
 import logging
 
+from services.party_lookup_service import resolve_party_docs
+from lookup_cache import lookup_cache, get_setting
+
 logger = logging.getLogger(__name__)
 label_router = APIRouter(prefix="/api/labels", tags=["Labels"])
 db = None
@@ -19,14 +22,6 @@ class LabelGenerateRequest(BaseModel):
 class ShopNameRequest(BaseModel):
     shop_name: str
 
-async def get_supplier_name(supplier_party_id: str) -> str:
-    if not supplier_party_id:
-        return ""
-    party = await db.parties.find_one({"id": supplier_party_id}, {"name": 1, "_id": 0})
-    if party:
-        return party.get("name", "")[:8]
-    return ""
-
 def generate_jewelry_label_zpl(product: dict, shop_name: str, supplier_name: str, quantity: int = 1) -> str:
     # Urun bilgileri
     barcode = product.get("barcode", product.get("id", ""))
@@ -88,9 +83,12 @@ def generate_jewelry_label_zpl(product: dict, shop_name: str, supplier_name: str
     return zpl.strip()
 
 async def generate_multiple_labels_zpl(products: List[dict], shop_name: str, quantity_each: int = 1) -> str:
+    # Tedarikci adlari tek sorguda
+    suppliers = await resolve_party_docs(db, (p.get("supplier_party_id") for p in products), {"name": 1})
     zpl_parts = []
     for product in products:
-        supplier_name = await get_supplier_name(product.get("supplier_party_id", ""))
+        supplier = suppliers.get(product.get("supplier_party_id"))
+        supplier_name = (supplier.get("name") or "")[:8] if supplier else ""
         zpl = generate_jewelry_label_zpl(product, shop_name, supplier_name, quantity_each)
         zpl_parts.append(zpl)
     return "\n\n".join(zpl_parts)
@@ -102,14 +100,12 @@ async def generate_labels(request: LabelGenerateRequest):
     if request.quantity_each < 1 or request.quantity_each > 99:
         raise HTTPException(status_code=400, detail="Adet 1-99 arasinda olmalidir")
     
-    settings = await db.settings.find_one({"key": "shop_name"})
-    shop_name = settings.get("value", "TKGold") if settings else "TKGold"
+    shop_name = await get_setting(db, "shop_name", "TKGold")
     
-    products = []
-    for pid in request.product_ids:
-        product = await db.products.find_one({"id": pid}, {"_id": 0})
-        if product:
-            products.append(product)
+    # Urunleri tek sorguda getir, istek sirasini koru
+    found = await db.products.find({"id": {"$in": request.product_ids}}, {"_id": 0}).to_list(len(request.product_ids))
+    by_id = {p["id"]: p for p in found}
+    products = [by_id[pid] for pid in request.product_ids if pid in by_id]
     
     if not products:
         raise HTTPException(status_code=404, detail="Urun bulunamadi")
@@ -131,8 +127,7 @@ async def preview_label(product_id: str):
     if not product:
         raise HTTPException(status_code=404, detail="Urun bulunamadi")
     
-    settings = await db.settings.find_one({"key": "shop_name"})
-    shop_name = settings.get("value", "TKGold") if settings else "TKGold"
+    shop_name = await get_setting(db, "shop_name", "TKGold")
     
     karat_id = product.get("karat_id")
     karat_display = ""
@@ -161,8 +156,7 @@ async def preview_label(product_id: str):
 
 @label_router.get("/settings/shop-name")
 async def get_shop_name():
-    settings = await db.settings.find_one({"key": "shop_name"})
-    return {"shop_name": settings.get("value", "TKGold") if settings else "TKGold"}
+    return {"shop_name": await get_setting(db, "shop_name", "TKGold")}
 
 @label_router.put("/settings/shop-name")
 async def update_shop_name(request: ShopNameRequest):
@@ -174,5 +168,6 @@ async def update_shop_name(request: ShopNameRequest):
         {"$set": {"key": "shop_name", "value": shop_name, "updated_at": datetime.now(timezone.utc).isoformat()}},
         upsert=True
     )
+    await lookup_cache.refresh(db, "settings")
     logger.info(f"Shop name updated to: {shop_name}")
     return {"shop_name": shop_name, "message": "Dukkan adi guncellendi"}
\ No newline at end of file
@@ -0,0 +1,348 @@
+"""
+Ledger Checkpoints - Closed-period totals for the unified ledger
+
+Bakiye tipi sorgular (cari ekstre açılışı, ledger özeti) ledger'ı her
+seferinde en baştan topluyordu. Kapatılan her tahakkuk dönemi (ay) için
+toplamlar ledger_checkpoints koleksiyonuna yazılır:
+- scope "party" (party_id), "cash_register" (cash_register_id), "type" (type)
+- scope "period": dönemin genel toplamı + "bu ay checkpoint'li" işareti
+
+Bir aralığın toplamı = aralığa tamamen giren checkpoint'ler + kalan günlerin
+ledger aggregation'ı (delta).
+
+Kapalı bir aya sonradan kayıt yazılırsa (VOID/ADJUSTMENT, geriye tarihli
+kayıt) sadece etkilenen anahtarların checkpoint'leri stale işaretlenir ve
+yeniden hesaplanır. Transaction içindeki yazımlarda yeniden hesaplama ilk
+okumaya bırakılır (işaret transaction ile birlikte commit/abort olur).
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+SCOPE_FIELDS = {
+    "party": "party_id",
+    "cash_register": "cash_register_id",
+    "type": "type",
+}
+PERIOD_SCOPE = "period"
+
+TOTAL_FIELDS = (
+    "has_in", "has_out", "has_net",
+    "amount_in", "amount_out", "amount_net",
+    "cost_has", "profit_has",
+)
+
+# Bu process'te checkpoint'i olan dönemler (sadece içinde bulunulan ay için
+# kullanılır; geçmiş aylar her yazımda DB'den kontrol edilir)
+_known_periods = set()
+
+
+def month_code(value) -> Optional[str]:
+    """transaction_date (ISO string veya datetime) -> "YYYY-MM" """
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m")
+    if isinstance(value, str) and len(value) >= 7:
+        return value[:7]
+    return None
+
+
+def month_range(code: str) -> Tuple[str, str]:
+    """"YYYY-MM" -> (ayın ilk günü, sonraki ayın ilk günü) - bitiş hariç"""
+    year, month = int(code[:4]), int(code[5:7])
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+
+def empty_totals() -> Dict[str, float]:
+    totals = {field: 0.0 for field in TOTAL_FIELDS}
+    totals["count"] = 0
+    return totals
+
+
+def _add_totals(target: dict, source: dict):
+    for field in TOTAL_FIELDS:
+        target[field] += source.get(field) or 0
+    target["count"] += source.get("count") or 0
+
+
+def _group_stage(key_expr) -> dict:
+    group = {"_id": key_expr, "count": {"$sum": 1}}
+    for field in TOTAL_FIELDS:
+        group[field] = {"$sum": {"$ifNull": [f"${field}", 0]}}
+    return {"$group": group}
+
+
+def _checkpoint_doc(code: str, scope: str, key, row: dict, now: str) -> dict:
+    start, next_start = month_range(code)
+    doc = {
+        "period_code": code,
+        "period_start": start,
+        "period_end": next_start,
+        "scope": scope,
+        "key": key,
+        "stale": False,
+        "built_at": now,
+        "count": row.get("count", 0),
+    }
+    for field in TOTAL_FIELDS:
+        doc[field] = row.get(field) or 0
+    return doc
+
+
+# ==================== BUILD / DROP ====================
+
+async def build_period_checkpoints(db, code: str) -> dict:
+    """
+    Dönemin tüm checkpoint'lerini tek $facet aggregation ile (yeniden) oluştur
+
+    Dönem işareti en son yazılır: yazım sürerken okuyan sorgu ayı
+    checkpoint'siz görür ve ledger'dan toplar.
+    """
+    start, next_start = month_range(code)
+    facets = {scope: [_group_stage(f"${field}")] for scope, field in SCOPE_FIELDS.items()}
+    facets[PERIOD_SCOPE] = [_group_stage(None)]
+
+    result = await db.unified_ledger.aggregate([
+        {"$match": {"transaction_date": {"$gte": start, "$lt": next_start}}},
+        {"$facet": facets}
+    ]).to_list(1)
+    rows = result[0] if result else {}
+
+    now = datetime.now(timezone.utc).isoformat()
+    docs = []
+    for scope in SCOPE_FIELDS:
+        for row in rows.get(scope, []):
+            if row["_id"] is not None:
+                docs.append(_checkpoint_doc(code, scope, row["_id"], row, now))
+    period_rows = rows.get(PERIOD_SCOPE) or [{}]
+    docs.append(_checkpoint_doc(code, PERIOD_SCOPE, code, period_rows[0], now))
+
+    await drop_period_checkpoints(db, code)
+    await db.ledger_checkpoints.insert_many(docs, ordered=True)
+    _known_periods.add(code)
+
+    logger.info(f"Ledger checkpoints built for {code}: {len(docs) - 1} keys")
+    return {"period_code": code, "checkpoints": len(docs) - 1, "entry_count": docs[-1]["count"]}
+
+
+async def drop_period_checkpoints(db, code: str):
+    """Dönem checkpoint'lerini sil (önce işaret - okuyanlar hemen ledger'a döner)"""
+    _known_periods.discard(code)
+    await db.ledger_checkpoints.delete_one({"scope": PERIOD_SCOPE, "key": code})
+    await db.ledger_checkpoints.delete_many({"period_code": code})
+
+
+async def init_ledger_checkpoints(db):
+    """Startup: checkpoint'li dönemleri belleğe al"""
+    try:
+        codes = await db.ledger_checkpoints.distinct("key", {"scope": PERIOD_SCOPE})
+        _known_periods.update(codes)
+        logger.info(f"Ledger checkpoints: {len(codes)} periods")
+    except Exception as e:
+        logger.error(f"Ledger checkpoint init failed: {e}")
+
+
+# ==================== INVALIDATION ====================
+
+async def _is_checkpointed(db, code: str, session=None) -> bool:
+    if code == datetime.now(timezone.utc).strftime("%Y-%m"):
+        return code in _known_periods
+    marker = await db.ledger_checkpoints.find_one(
+        {"scope": PERIOD_SCOPE, "key": code}, {"_id": 0, "key": 1}, session=session
+    )
+    return marker is not None
+
+
+async def mark_entries_written(db, entries: Iterable[dict], session=None):
+    """
+    Yeni yazılan ledger kayıtları checkpoint'li bir aya düşüyorsa etkilenen
+    (party, kasa, tip) checkpoint'lerini stale işaretle
+
+    Session yoksa hemen yeniden hesaplanır; varsa işaret transaction ile
+    commit olur ve ilk okumada yeniden hesaplanır.
+    """
+    by_month: Dict[str, List[dict]] = {}
+    for entry in entries:
+        code = month_code(entry.get("transaction_date"))
+        if code:
+            by_month.setdefault(code, []).append(entry)
+
+    for code, month_entries in by_month.items():
+        if not await _is_checkpointed(db, code, session=session):
+            continue
+
+        start, next_start = month_range(code)
+        ops = [UpdateOne(
+            {"scope": PERIOD_SCOPE, "key": code},
+            {"$set": {"stale": True}}
+        )]
+        for scope, field in SCOPE_FIELDS.items():
+            for key in {e.get(field) for e in month_entries if e.get(field) is not None}:
+                ops.append(UpdateOne(
+                    {"period_code": code, "scope": scope, "key": key},
+                    {"$set": {"stale": True},
+                     "$setOnInsert": {"period_start": start, "period_end": next_start}},
+                    upsert=True
+                ))
+        await db.ledger_checkpoints.bulk_write(ops, ordered=False, session=session)
+        logger.info(f"Ledger checkpoints {code}: {len(ops) - 1} keys marked stale")
+
+        if session is None:
+            await rebuild_stale_checkpoints(db, code)
+
+
+async def rebuild_stale_checkpoints(db, code: Optional[str] = None) -> int:
+    """Stale checkpoint'leri sadece ilgili anahtarlar için yeniden hesapla"""
+    query = {"stale": True}
+    if code:
+        query["period_code"] = code
+    stale_docs = await db.ledger_checkpoints.find(
+        query, {"_id": 0, "period_code": 1, "scope": 1, "key": 1}
+    ).to_list(None)
+    # Dönem işaretinin period_code'u yok (key = dönem kodu)
+    marker_query = {"scope": PERIOD_SCOPE, "stale": True}
+    if code:
+        marker_query["key"] = code
+    stale_markers = await db.ledger_checkpoints.distinct("key", marker_query)
+
+    grouped: Dict[Tuple[str, str], List[Any]] = {}
+    for doc in stale_docs:
+        grouped.setdefault((doc["period_code"], doc["scope"]), []).append(doc["key"])
+
+    now = datetime.now(timezone.utc).isoformat()
+    rebuilt = 0
+    for (period_code, scope), keys in grouped.items():
+        field = SCOPE_FIELDS.get(scope)
+        if field is None:
+            continue
+        start, next_start = month_range(period_code)
+        rows = await db.unified_ledger.aggregate([
+            {"$match": {"transaction_date": {"$gte": start, "$lt": next_start}, field: {"$in": keys}}},
+            _group_stage(f"${field}")
+        ]).to_list(None)
+        found = {row["_id"]: row for row in rows}
+
+        ops = []
+        for key in keys:
+            doc = _checkpoint_doc(period_code, scope, key, found.get(key, {}), now)
+            ops.append(UpdateOne(
+                {"period_code": period_code, "scope": scope, "key": key},
+                {"$set": doc}
+            ))
+        await db.ledger_checkpoints.bulk_write(ops, ordered=False)
+        rebuilt += len(ops)
+
+    for period_code in stale_markers:
+        start, next_start = month_range(period_code)
+        rows = await db.unified_ledger.aggregate([
+            {"$match": {"transaction_date": {"$gte": start, "$lt": next_start}}},
+            _group_stage(None)
+        ]).to_list(1)
+        doc = _checkpoint_doc(period_code, PERIOD_SCOPE, period_code, rows[0] if rows else {}, now)
+        await db.ledger_checkpoints.update_one({"scope": PERIOD_SCOPE, "key": period_code}, {"$set": doc})
+
+    if rebuilt or stale_markers:
+        logger.info(f"Ledger checkpoints rebuilt: {rebuilt} keys, {len(stale_markers)} periods")
+    return rebuilt
+
+
+# ==================== READ ====================
+
+def _merge_ranges(codes: Iterable[str]) -> List[Tuple[str, str]]:
+    """Ardışık ayları tek [start, end) aralığında birleştir"""
+    ranges: List[Tuple[str, str]] = []
+    for code in sorted(codes):
+        start, next_start = month_range(code)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], next_start)
+        else:
+            ranges.append((start, next_start))
+    return ranges
+
+
+async def ledger_totals(
+    db,
+    scope: str,
+    key=None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    until_inclusive: bool = False,
+    extra_match: Optional[dict] = None
+) -> Dict[Any, dict]:
+    """
+    [since, until) aralığının anahtar bazında toplamları: checkpoint + delta
+
+    scope: "party" | "cash_register" | "type"; key verilmezse tüm anahtarlar.
+    until_inclusive: until dahil ($lte) - mevcut rapor sorgularıyla aynı sınır.
+    extra_match: delta sorgusuna eklenir; aralığa tamamen giren aylar için
+    de sağlanıyor olmalı (ör. cursor'dan önceki kayıtlar).
+
+    Returns: {key: {has_in, ..., profit_has, count}}
+    """
+    field = SCOPE_FIELDS[scope]
+
+    # Aralığa tamamen giren checkpoint'li aylar
+    marker_query: Dict[str, Any] = {"scope": PERIOD_SCOPE}
+    if since:
+        marker_query["period_start"] = {"$gte": since}
+    if until:
+        marker_query["period_end"] = {"$lte": until}
+    markers = await db.ledger_checkpoints.find(marker_query, {"_id": 0, "key": 1, "stale": 1}).to_list(None)
+    covered = [m["key"] for m in markers]
+    for code in {m["key"] for m in markers if m.get("stale")}:
+        await rebuild_stale_checkpoints(db, code)
+
+    totals: Dict[Any, dict] = {}
+    if covered:
+        checkpoint_query: Dict[str, Any] = {"scope": scope, "period_code": {"$in": covered}}
+        if key is not None:
+            checkpoint_query["key"] = key
+        async for doc in db.ledger_checkpoints.find(checkpoint_query, {"_id": 0}):
+            _add_totals(totals.setdefault(doc["key"], empty_totals()), doc)
+
+    # Delta: checkpoint'siz kalan günler
+    date_range: Dict[str, str] = {}
+    if since:
+        date_range["$gte"] = since
+    if until:
+        date_range["$lte" if until_inclusive else "$lt"] = until
+
+    conditions: List[dict] = [{field: key} if key is not None else {field: {"$ne": None}}]
+    if date_range:
+        conditions.append({"transaction_date": date_range})
+    ranges = _merge_ranges(covered)
+    if ranges:
+        conditions.append({"$nor": [
+            {"transaction_date": {"$gte": start, "$lt": end}} for start, end in ranges
+        ]})
+    if extra_match:
+        conditions.append(extra_match)
+
+    rows = await db.unified_ledger.aggregate([
+        {"$match": {"$and": conditions}},
+        _group_stage(f"${field}")
+    ]).to_list(None)
+    for row in rows:
+        _add_totals(totals.setdefault(row["_id"], empty_totals()), row)
+
+    return totals
+
+
+async def get_checkpoint_stats(db) -> dict:
+    """Checkpoint'li dönemler ve stale anahtar sayısı"""
+    periods = await db.ledger_checkpoints.find(
+        {"scope": PERIOD_SCOPE}, {"_id": 0, "key": 1, "count": 1, "stale": 1, "built_at": 1}
+    ).sort("key", 1).to_list(None)
+    stale = await db.ledger_checkpoints.count_documents({"stale": True})
+    return {
+        "periods": [
+            {"period_code": p["key"], "entry_count": p.get("count", 0),
+             "stale": p.get("stale", False), "built_at": p.get("built_at")}
+            for p in periods
+        ],
+        "stale_checkpoints": stale
+    }
@@ -0,0 +1,140 @@
+"""
+Lookup Cache - Process-wide cache for small, rarely-changing lookup tables
+
+karats, product_types, labor_types, payment_methods, settings vb. her
+satış/alış satırında ve her dropdown render'ında tekrar okunuyordu:
+- Startup'ta tüm tablolar bir kez yüklenir
+- routers/lookups.py ve label_management yazımlardan sonra ilgili tabloyu
+  refresh() ile yeniden yükler
+- Her tablonun içerik hash'i (version) ETag olarak kullanılır
+
+Başka bir process'in (init script, diğer worker) yazımları LOOKUP_CACHE_TTL
+saniye sonra tablo tekrar okunduğunda görülür.
+"""
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CACHE_TTL = int(os.environ.get("LOOKUP_CACHE_TTL", "300"))
+
+CACHED_COLLECTIONS = (
+    "karats",
+    "product_types",
+    "labor_types",
+    "payment_methods",
+    "currencies",
+    "party_types",
+    "stock_statuses",
+    "transaction_types",
+    "asset_types",
+    "transaction_directions",
+    "settings",
+)
+
+# Lookup tabloları küçük; bu sınırı aşan tablo cache'lenmemeli
+MAX_TABLE_SIZE = 1000
+
+
+def _content_version(items: List[dict]) -> str:
+    payload = json.dumps(items, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+class LookupCache:
+    """Tablo adı -> doküman listesi (+ id index ve içerik versiyonu)"""
+
+    def __init__(self, ttl: int = LOOKUP_CACHE_TTL):
+        self.ttl = ttl
+        self._tables: Dict[str, List[dict]] = {}
+        self._by_id: Dict[str, Dict[Any, dict]] = {}
+        self._versions: Dict[str, str] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self, db, names=CACHED_COLLECTIONS):
+        """Tabloları DB'den yükle (startup)"""
+        for name in names:
+            await self.refresh(db, name)
+        logger.info(f"Lookup cache loaded: {', '.join(f'{n}={len(self._tables[n])}' for n in names)}")
+
+    async def refresh(self, db, name: str):
+        """Tabloyu yeniden oku - bu process'teki her yazımdan sonra çağrılır"""
+        items = await db[name].find({}, {"_id": 0}).sort("id", 1).to_list(MAX_TABLE_SIZE)
+        if len(items) >= MAX_TABLE_SIZE:
+            logger.warning(f"Lookup table {name} has {len(items)}+ rows, cache truncated")
+
+        self._tables[name] = items
+        self._by_id[name] = {item["id"]: item for item in items if item.get("id") is not None}
+        self._versions[name] = _content_version(items)
+        self._loaded_at[name] = time.monotonic()
+
+    def invalidate(self, name: Optional[str] = None):
+        """Bir sonraki erişimde yeniden yükle"""
+        if name is None:
+            self._loaded_at.clear()
+        else:
+            self._loaded_at.pop(name, None)
+
+    async def _ensure(self, db, name: str):
+        loaded_at = self._loaded_at.get(name)
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.misses += 1
+            await self.refresh(db, name)
+        else:
+            self.hits += 1
+
+    async def table(self, db, name: str) -> List[dict]:
+        """Tablonun tüm kayıtları (kopya)"""
+        await self._ensure(db, name)
+        return [dict(item) for item in self._tables[name]]
+
+    async def get(self, db, name: str, item_id) -> Optional[dict]:
+        """id ile tek kayıt"""
+        await self._ensure(db, name)
+        item = self._by_id[name].get(item_id)
+        return dict(item) if item is not None else None
+
+    async def find_one(self, db, name: str, **match) -> Optional[dict]:
+        """Alan eşitliği ile ilk kayıt (ör. code="GOLD_SCRAP")"""
+        await self._ensure(db, name)
+        for item in self._tables[name]:
+            if all(item.get(field) == value for field, value in match.items()):
+                return dict(item)
+        return None
+
+    async def version(self, db, name: str) -> str:
+        await self._ensure(db, name)
+        return self._versions[name]
+
+    def stats(self) -> dict:
+        return {
+            "tables": {name: len(items) for name, items in self._tables.items()},
+            "versions": dict(self._versions),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Process-wide cache
+lookup_cache = LookupCache()
+
+
+async def init_lookup_cache(db):
+    """Startup'ta tüm lookup tablolarını yükle"""
+    try:
+        await lookup_cache.load(db)
+    except Exception as e:
+        logger.error(f"Lookup cache load failed: {e}")
+
+
+async def get_setting(db, key: str, default=None):
+    """settings koleksiyonundan {"key", "value"} kaydı"""
+    setting = await lookup_cache.find_one(db, "settings", key=key)
+    return setting.get("value", default) if setting else default
@@ -0,0 +1,266 @@
+"""
+Market Feeds - Pluggable price sources for the tick pipeline
+
+Tüm kaynaklar Harem formatında payload üretir ({"data": {"ALTIN": {"alis",
+"satis"}, ...}}) ve aynı emit fonksiyonuna (market_websocket.enqueue_tick)
+verir; parse, cache, bar ve snapshot yazımı kaynaktan bağımsızdır.
+
+MARKET_FEED:
+- harem     : socket.haremaltin.com (varsayılan)
+- replay    : MARKET_FEED_REPLAY_FILE'daki kayıtlı payload'ları oynatır
+              (MARKET_FEED_REPLAY_SPEED=1 orijinal hız, 10 = 10x, 0 = beklemeden)
+- synthetic : Random walk fiyat üretici (offline load test)
+- none      : Feed başlatılmaz
+
+MARKET_FEED_RECORD=<dosya> ile harem feed'i payload'ları JSONL olarak
+kaydeder; replay bu dosyayı okur.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+MARKET_FEED = os.environ.get("MARKET_FEED", "harem").lower()
+
+HAREM_SOCKET_URL = "https://socket.haremaltin.com"
+HAREM_SNAPSHOT_SOURCE = "HAREM_SOCKET"
+
+
+class MarketFeed(abc.ABC):
+    """Feed arayüzü: run(emit) payload'ları emit'e verir, iptal edilene kadar çalışır"""
+
+    name = "base"
+    # price_snapshots kaynağı; None = snapshot yazılmaz (replay/synthetic
+    # fiyatları işlem değerlemesine - find_price_snapshot_as_of - girmesin)
+    snapshot_source: Optional[str] = None
+
+    @abc.abstractmethod
+    async def run(self, emit: Callable[[dict], None]):
+        """Payload'ları emit'e ver; iptal edilene (CancelledError) kadar dön"""
+
+
+# ==================== HAREM SOCKET.IO ====================
+
+class HaremSocketFeed(MarketFeed):
+    """socket.haremaltin.com canlı fiyat akışı"""
+
+    name = "harem"
+    snapshot_source = HAREM_SNAPSHOT_SOURCE
+
+    def __init__(self, url: str = HAREM_SOCKET_URL, record_path: Optional[str] = None):
+        self.url = url
+        self.record_path = record_path
+        self._record_file = None
+
+    def _record(self, data):
+        if self._record_file is None:
+            return
+        try:
+            self._record_file.write(json.dumps({
+                "ts": datetime.now(timezone.utc).isoformat(),
+                "payload": data
+            }, default=str) + "\n")
+            self._record_file.flush()
+        except Exception as e:
+            logger.error(f"Market feed record failed: {e}")
+
+    async def run(self, emit):
+        import socketio
+
+        if self.record_path:
+            self._record_file = open(self.record_path, "a", encoding="utf-8")
+            logger.info(f"Recording market payloads to {self.record_path}")
+
+        sio = socketio.AsyncClient(logger=False, engineio_logger=False)
+
+        def handle(data):
+            self._record(data)
+            emit(data)
+
+        @sio.event
+        async def connect():
+            logger.info('Connected to market WebSocket')
+
+        @sio.event
+        async def disconnect():
+            logger.info('Disconnected from market WebSocket')
+
+        @sio.event
+        async def message(data):
+            """Handle message events"""
+            logger.debug(f"Received message: {str(data)[:200]}")
+            handle(data)
+
+        # Listen to specific events that might contain price data
+        @sio.on('price_changed')
+        async def on_price_changed(data):
+            """Handle price_changed events"""
+            logger.debug(f"Price changed event received: {str(data)[:200]}")
+            handle(data)
+
+        # Listen to all events
+        @sio.on('*')
+        async def catch_all(event, *args):
+            """Catch all events from the WebSocket"""
+            if event != 'price_changed' and args:
+                logger.debug(f"Received event '{event}' with {len(args)} args")
+                handle(args[0])
+
+        try:
+            while True:
+                try:
+                    logger.info("Attempting to connect to market WebSocket...")
+                    await sio.connect(
+                        self.url,
+                        transports=['websocket'],
+                        wait_timeout=10,
+                        headers={
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                            'Origin': 'https://www.haremaltin.com',
+                            'Referer': 'https://www.haremaltin.com/'
+                        }
+                    )
+                    await sio.wait()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"WebSocket connection error: {e}")
+                    await asyncio.sleep(10)  # Wait before reconnecting
+        finally:
+            if self._record_file is not None:
+                self._record_file.close()
+                self._record_file = None
+
+
+# ==================== FILE REPLAY ====================
+
+class FileReplayFeed(MarketFeed):
+    """
+    Kayıtlı payload'ları oynatır
+
+    Dosya JSONL: her satır {"ts": ISO, "payload": {...}} (MARKET_FEED_RECORD
+    çıktısı) veya doğrudan payload. ts yoksa satırlar arası 1sn kabul edilir.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+    @staticmethod
+    def _parse_line(line: str):
+        record = json.loads(line)
+        if isinstance(record, dict) and "payload" in record:
+            ts = record.get("ts")
+            try:
+                ts = datetime.fromisoformat(ts.replace("Z", "+00:00")) if ts else None
+            except (AttributeError, ValueError):
+                ts = None
+            return ts, record["payload"]
+        return None, record
+
+    async def run(self, emit):
+        while True:
+            count = 0
+            previous_ts = None
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        ts, payload = self._parse_line(line)
+                    except ValueError:
+                        continue
+
+                    if self.speed > 0:
+                        gap = 1.0
+                        if ts is not None and previous_ts is not None:
+                            gap = max(0.0, (ts - previous_ts).total_seconds())
+                        if count:
+                            await asyncio.sleep(gap / self.speed)
+                    elif count % 100 == 0:
+                        # Beklemeden oynatırken event loop'u bırak
+                        await asyncio.sleep(0)
+
+                    previous_ts = ts
+                    emit(payload)
+                    count += 1
+
+            logger.info(f"Market replay finished: {count} payloads from {self.path}")
+            if not self.loop:
+                return
+
+
+# ==================== SYNTHETIC RANDOM WALK ====================
+
+class SyntheticFeed(MarketFeed):
+    """
+    Random walk fiyat üretici
+
+    Her interval'da ALTIN/USDTRY/EURTRY alış fiyatları volatility oranında
+    rastgele yürür; satış = alış * (1 + spread).
+    """
+
+    name = "synthetic"
+
+    def __init__(self, interval: float = 1.0, volatility: float = 0.0005,
+                 spread: float = 0.002, seed: Optional[int] = None):
+        self.interval = interval
+        self.volatility = volatility
+        self.spread = spread
+        self.random = random.Random(seed)
+        self.prices = {"ALTIN": 3000.0, "USDTRY": 34.0, "EURTRY": 37.0}
+
+    def next_payload(self) -> dict:
+        data = {}
+        for symbol, price in self.prices.items():
+            price *= 1 + self.random.gauss(0, self.volatility)
+            self.prices[symbol] = price
+            data[symbol] = {
+                "alis": f"{price:.4f}",
+                "satis": f"{price * (1 + self.spread):.4f}"
+            }
+        return {"data": data}
+
+    async def run(self, emit):
+        while True:
+            emit(self.next_payload())
+            await asyncio.sleep(self.interval)
+
+
+def build_market_feed(kind: str = MARKET_FEED) -> Optional[MarketFeed]:
+    """MARKET_FEED ayarına göre feed oluştur (none: None)"""
+    if kind == "none":
+        return None
+
+    if kind == "replay":
+        path = os.environ.get("MARKET_FEED_REPLAY_FILE")
+        if not path:
+            raise ValueError("MARKET_FEED=replay requires MARKET_FEED_REPLAY_FILE")
+        return FileReplayFeed(
+            path,
+            speed=float(os.environ.get("MARKET_FEED_REPLAY_SPEED", "1")),
+            loop=os.environ.get("MARKET_FEED_REPLAY_LOOP", "false").lower() == "true"
+        )
+
+    if kind == "synthetic":
+        seed = os.environ.get("MARKET_FEED_SEED")
+        return SyntheticFeed(
+            interval=float(os.environ.get("MARKET_FEED_INTERVAL", "1")),
+            volatility=float(os.environ.get("MARKET_FEED_VOLATILITY", "0.0005")),
+            seed=int(seed) if seed else None
+        )
+
+    if kind == "harem":
+        return HaremSocketFeed(record_path=os.environ.get("MARKET_FEED_RECORD"))
+
+    raise ValueError(f"Unknown MARKET_FEED: {kind}")
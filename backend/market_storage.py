@@ -0,0 +1,234 @@
+"""
+Market Storage - Bucketed OHLC bars, raw tick retention and payload trimming
+
+market_data (ham tick) ve price_snapshots sınırsız büyümesin diye:
+- market_bars: resolution başına (1m / 1h / 1d) bucket dokümanı, her fiyat
+  alanı için OHLC (open/high/low/close) ve tick sayısı. Tick pipeline flush
+  sırasında tüm çözünürlükler tek bulk_write upsert ile güncellenir
+  (downsampling incremental, ayrı job gerekmez).
+- Ham tick retention: market_data.recorded_at üzerinde TTL index
+  (MARKET_RAW_RETENTION_DAYS). 1m bar'lar MARKET_MINUTE_RETENTION_DAYS sonra
+  silinir, 1h/1d bar'lar kalıcıdır.
+- raw_payload: Sadece kullandığımız semboller (ALTIN, USDTRY, EURTRY) saklanır.
+
+MARKET_STORE_RAW_TICKS=false ile ham tick yazımı tamamen kapatılabilir.
+"""
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional
+import logging
+import os
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+MARKET_STORE_RAW_TICKS = os.environ.get("MARKET_STORE_RAW_TICKS", "true").lower() == "true"
+MARKET_RAW_RETENTION_DAYS = int(os.environ.get("MARKET_RAW_RETENTION_DAYS", "7"))
+MARKET_MINUTE_RETENTION_DAYS = int(os.environ.get("MARKET_MINUTE_RETENTION_DAYS", "90"))
+
+# Harem payload'ında kullandığımız semboller
+CONSUMED_SYMBOLS = ("ALTIN", "USDTRY", "EURTRY")
+
+# Bar'larda tutulan fiyat alanları (market_data_cache ile aynı)
+PRICE_FIELDS = ("has_gold_buy", "has_gold_sell", "usd_buy", "usd_sell", "eur_buy", "eur_sell")
+
+RESOLUTIONS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+
+def trim_payload(data):
+    """Payload'dan sadece kullanılan sembolleri tut"""
+    if not isinstance(data, dict):
+        return None
+    market_data = data.get("data")
+    if not isinstance(market_data, dict):
+        return None
+    return {"data": {s: market_data[s] for s in CONSUMED_SYMBOLS if s in market_data}}
+
+
+def bucket_start(ts: datetime, resolution: str) -> datetime:
+    """Zamanı bucket başlangıcına yuvarla (UTC)"""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    if resolution == "1m":
+        return ts.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if resolution == "1d":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unsupported resolution: {resolution}")
+
+
+def aggregate_ticks(ticks: Iterable[dict]) -> Dict[tuple, dict]:
+    """
+    Tick state'lerini bellekte (resolution, bucket_start) başına OHLC'ye indir
+
+    ticks: {"recorded_at": datetime, "has_gold_buy": .., ...} (zaman sıralı)
+    """
+    bars: Dict[tuple, dict] = {}
+    for tick in ticks:
+        ts = tick.get("recorded_at")
+        if not isinstance(ts, datetime):
+            continue
+        for resolution in RESOLUTIONS:
+            key = (resolution, bucket_start(ts, resolution))
+            bar = bars.setdefault(key, {"ticks": 0, "fields": {}})
+            bar["ticks"] += 1
+            for field in PRICE_FIELDS:
+                value = tick.get(field)
+                if value is None:
+                    continue
+                ohlc = bar["fields"].get(field)
+                if ohlc is None:
+                    bar["fields"][field] = {"open": value, "high": value, "low": value, "close": value}
+                else:
+                    ohlc["high"] = max(ohlc["high"], value)
+                    ohlc["low"] = min(ohlc["low"], value)
+                    ohlc["close"] = value
+    return bars
+
+
+def build_bar_upserts(bars: Dict[tuple, dict]) -> List[UpdateOne]:
+    """
+    Bellekteki bar'lar için market_bars upsert operasyonları
+
+    Pipeline update: open her alan için ayrı $ifNull ile yazılır - bucket'a
+    sonradan gelen alan da (ör. ilk tick'lerde olmayan eur_buy) open alır.
+    """
+    now = datetime.now(timezone.utc)
+    ops = []
+    for (resolution, start), bar in bars.items():
+        stage = {
+            "created_at": {"$ifNull": ["$created_at", now]},
+            "updated_at": now,
+            "ticks": {"$add": [{"$ifNull": ["$ticks", 0]}, bar["ticks"]]},
+        }
+        if resolution == "1m":
+            stage["expire_at"] = {"$ifNull": ["$expire_at", start + timedelta(days=MARKET_MINUTE_RETENTION_DAYS)]}
+
+        for field, ohlc in bar["fields"].items():
+            # $min/$max eksik alanı yok sayar: ilk yazımda bu parçanın değeri kalır
+            stage[f"{field}.open"] = {"$ifNull": [f"${field}.open", ohlc["open"]]}
+            stage[f"{field}.low"] = {"$min": [f"${field}.low", ohlc["low"]]}
+            stage[f"{field}.high"] = {"$max": [f"${field}.high", ohlc["high"]]}
+            stage[f"{field}.close"] = ohlc["close"]
+
+        ops.append(UpdateOne(
+            {"resolution": resolution, "bucket_start": start},
+            [{"$set": stage}],
+            upsert=True
+        ))
+    return ops
+
+
+async def write_bars(db, ticks: List[dict]) -> int:
+    """Tick batch'inden OHLC bar'ları güncelle (tek bulk_write)"""
+    ops = build_bar_upserts(aggregate_ticks(ticks))
+    if not ops:
+        return 0
+    await db.market_bars.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+async def get_bars(db, resolution: str, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, limit: int = 1000) -> List[dict]:
+    """Belirli aralıktaki OHLC bar'ları getir"""
+    query = {"resolution": resolution}
+    if start or end:
+        query["bucket_start"] = {}
+        if start:
+            query["bucket_start"]["$gte"] = start
+        if end:
+            query["bucket_start"]["$lte"] = end
+
+    return await db.market_bars.find(
+        query, {"_id": 0, "expire_at": 0}
+    ).sort("bucket_start", 1).limit(limit).to_list(limit)
+
+
+async def get_price_at(db, field: str, as_of: Optional[datetime] = None) -> Optional[float]:
+    """
+    as_of anındaki (veya öncesindeki son) fiyat - bar close değeri
+
+    Önce 1m, yoksa (retention dışı) 1h, sonra 1d bar'a bakılır.
+    as_of None ise en güncel fiyat.
+    """
+    for resolution in RESOLUTIONS:
+        query = {"resolution": resolution, f"{field}.close": {"$ne": None}}
+        if as_of is not None:
+            query["bucket_start"] = {"$lte": as_of}
+        bar = await db.market_bars.find_one(
+            query, {"_id": 0, field: 1}, sort=[("bucket_start", -1)]
+        )
+        if bar and bar.get(field):
+            return bar[field].get("close")
+    return None
+
+
+async def compact_market_storage(db, batch_size: int = 5000) -> dict:
+    """
+    Mevcut veriyi yeni düzene taşı (tekrar çalıştırılabilir)
+
+    1. recorded_at'siz eski market_data tick'lerinden OHLC bar üret
+       (eski dokümanlarda ISO string timestamp var). Bar'a işlenen her
+       batch'e recorded_at yazılır: sonraki çalıştırmada tekrar sayılmaz,
+       TTL index retention'ı bunlara da uygular.
+    2. Retention dışındaki eski tick'leri sil (timestamp'i okunamayan,
+       recorded_at alamayan dokümanlar dahil)
+    3. price_snapshots.raw_payload'ı kullanılan sembollere indir
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=MARKET_RAW_RETENTION_DAYS)
+    stats = {"ticks": 0, "bar_upserts": 0, "deleted": 0, "snapshots_trimmed": 0}
+
+    batch = []
+    cursor = db.market_data.find(
+        {"recorded_at": {"$exists": False}, "timestamp": {"$ne": None}}
+    ).sort("timestamp", 1)
+
+    async def migrate(docs):
+        stats["bar_upserts"] += await write_bars(db, docs)
+        stats["ticks"] += len(docs)
+        await db.market_data.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"recorded_at": doc["recorded_at"]}})
+            for doc in docs
+        ], ordered=False)
+
+    async for doc in cursor:
+        try:
+            recorded_at = datetime.fromisoformat(str(doc["timestamp"]).replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        if recorded_at.tzinfo is None:
+            recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+        doc["recorded_at"] = recorded_at
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await migrate(batch)
+            batch = []
+
+    if batch:
+        await migrate(batch)
+
+    result = await db.market_data.delete_many({"$or": [
+        {"recorded_at": {"$lt": cutoff}},
+        {"recorded_at": {"$exists": False}, "timestamp": {"$lt": cutoff.isoformat()}}
+    ]})
+    stats["deleted"] = result.deleted_count
+
+    # raw_payload.data içinde kullanılmayan semboller varsa sadece kullanılanları bırak
+    # (pipeline update; eksik semboller $$REMOVE ile yazılmaz)
+    result = await db.price_snapshots.update_many(
+        {"raw_payload.data": {"$type": "object"}},
+        [{"$set": {"raw_payload": {"data": {
+            symbol: {"$ifNull": [f"$raw_payload.data.{symbol}", "$$REMOVE"]}
+            for symbol in CONSUMED_SYMBOLS
+        }}}}]
+    )
+    stats["snapshots_trimmed"] = result.modified_count
+
+    logger.info(f"Market storage compacted: {stats}")
+    return stats
@@ -0,0 +1,101 @@
+"""
+Market Stream - Fan-out hub for pushing market cache updates to clients
+
+Her frontend sekmesi /market-data/latest'i poll etmek yerine
+/market-data/stream (SSE) üzerinden abone olur:
+- process_market_data cache'i güncelledikçe hub.publish() çağrılır
+- Her client'ın kendi küçük queue'su var; yavaş client diğerlerini bekletmez
+- Queue doluysa client'ın en eski mesajı düşer (fiyatta sadece son değer önemli)
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MARKET_STREAM_CLIENT_QUEUE = int(os.environ.get("MARKET_STREAM_CLIENT_QUEUE", "10"))
+MARKET_STREAM_KEEPALIVE_SECONDS = float(os.environ.get("MARKET_STREAM_KEEPALIVE_SECONDS", "15"))
+
+
+class MarketStreamHub:
+    """Tek publisher, çok subscriber; client başına bounded queue"""
+
+    def __init__(self, client_queue_size: int = MARKET_STREAM_CLIENT_QUEUE):
+        self.client_queue_size = client_queue_size
+        self._subscribers = set()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.peak_clients = 0
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.client_queue_size)
+        self._subscribers.add(queue)
+        self.peak_clients = max(self.peak_clients, len(self._subscribers))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, data: dict):
+        """Tüm abonelere gönder (bloklamaz)"""
+        self.published += 1
+        for queue in self._subscribers:
+            if queue.full():
+                # Backpressure: bu client'ın en eski mesajını at
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+                self.dropped += 1
+            queue.put_nowait(data)
+            self.delivered += 1
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._subscribers),
+            "peak_clients": self.peak_clients,
+            "client_queue_size": self.client_queue_size,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+# Process-wide hub
+market_stream_hub = MarketStreamHub()
+
+
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    """SSE mesaj formatı"""
+    message = f"data: {json.dumps(data, default=str)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+
+async def sse_market_stream(request, initial: Optional[dict] = None):
+    """
+    Bir client için SSE generator
+
+    Bağlanınca mevcut cache gönderilir, sonra her güncelleme; sessiz
+    dönemlerde proxy'ler bağlantıyı kapatmasın diye keepalive yorumu.
+    """
+    queue = market_stream_hub.subscribe()
+    try:
+        if initial is not None:
+            yield format_sse(initial, event="market")
+
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                data = await asyncio.wait_for(queue.get(), timeout=MARKET_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(data, event="market")
+    finally:
+        market_stream_hub.unsubscribe(queue)
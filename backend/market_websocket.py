@@ -1,11 +1,17 @@
-"""Market WebSocket client for real-time price data"""
-import socketio
+"""Market data tick pipeline - fed by the configured market feed (market_feeds)"""
 import asyncio
 import json
+import os
+import time
 import uuid
 import logging
 from datetime import datetime, timezone
 
+from price_snapshot_service import price_snapshot_cache
+from market_storage import MARKET_STORE_RAW_TICKS, RESOLUTIONS, trim_payload, write_bars
+from market_stream import market_stream_hub
+from market_feeds import HAREM_SNAPSHOT_SOURCE, build_market_feed
+
 logger = logging.getLogger(__name__)
 
 # Global market data cache
@@ -22,6 +28,41 @@ market_data_cache = {
 # Database reference (set during initialization)
 _db = None
 
+# ==================== TICK PIPELINE ====================
+# Socket event'leri doğrudan DB'ye yazılmaz:
+# - Handler'lar ham payload'ı bounded asyncio queue'ya atar (doluysa en eski düşer)
+# - Tek consumer task parse eder, cache'i günceller, değişen state'leri buffer'lar
+# - Buffer MARKET_FLUSH_INTERVAL saniyede bir yazılır: market_bars OHLC upsert'leri
+#   (tek bulk_write) + MARKET_STORE_RAW_TICKS açıksa ham tick insert_many
+# - Snapshot debounce (60sn) bellekteki son snapshot zamanıyla yapılır, DB okuması yok
+
+MARKET_TICK_QUEUE_SIZE = int(os.environ.get("MARKET_TICK_QUEUE_SIZE", "1000"))
+MARKET_FLUSH_INTERVAL = float(os.environ.get("MARKET_FLUSH_INTERVAL", "5"))
+MARKET_FLUSH_MAX_BATCH = int(os.environ.get("MARKET_FLUSH_MAX_BATCH", "500"))
+SNAPSHOT_DEBOUNCE_SECONDS = 60
+
+_tick_queue = None
+_pipeline_task = None
+_pending_market_docs = []
+_last_flush_at = None
+_last_snapshot_as_of = None
+_last_snapshot_loaded = False
+_snapshot_source = None  # Aktif feed'in snapshot kaynağı (None: snapshot yazılmaz)
+
+tick_stats = {
+    "received": 0,          # Queue'ya gelen tick
+    "processed": 0,         # Consumer'ın işlediği tick
+    "dropped": 0,           # Queue dolu olduğu için düşen tick
+    "unchanged": 0,         # Değişiklik içermeyen (yazılmayan) tick
+    "market_data_written": 0,
+    "bar_upserts": 0,
+    "bar_updates_merged": 0,  # Aynı bucket'a düşüp tek upsert'te birleşen bar güncellemeleri
+    "snapshots_written": 0,
+    "flushes": 0,
+    "last_flush_size": 0,
+    "last_flush_ms": 0.0,
+}
+
 def set_database(db):
     """Set database reference for WebSocket module"""
     global _db
@@ -31,197 +72,326 @@ def get_market_data_cache():
     """Get current market data cache"""
     return market_data_cache.copy()
 
-async def connect_to_market_websocket():
-    """Connect to the market data WebSocket and store data in MongoDB"""
-    global _db
+def get_tick_pipeline_stats():
+    """Tick pipeline sayaçları"""
+    return {
+        **tick_stats,
+        "queue_size": _tick_queue.qsize() if _tick_queue is not None else 0,
+        "pending_market_docs": len(_pending_market_docs),
+        "last_snapshot_as_of": _last_snapshot_as_of.isoformat() if _last_snapshot_as_of else None,
+    }
+
+
+def enqueue_tick(data):
+    """Socket handler'larından gelen payload'ı queue'ya at (bloklamaz)"""
+    tick_stats["received"] += 1
     
-    sio = socketio.AsyncClient(logger=False, engineio_logger=False)
+    if _tick_queue is None:
+        tick_stats["dropped"] += 1
+        return
     
-    @sio.event
-    async def connect():
-        logger.info('Connected to market WebSocket')
+    try:
+        _tick_queue.put_nowait(data)
+    except asyncio.QueueFull:
+        # En eski tick'i düşür - fiyatlarda sadece en güncel değer önemli
+        try:
+            _tick_queue.get_nowait()
+            _tick_queue.task_done()
+        except asyncio.QueueEmpty:
+            pass
+        tick_stats["dropped"] += 1
+        _tick_queue.put_nowait(data)
+
+
+def _parse_price(section: dict, key: str):
+    try:
+        return float(section[key])
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def parse_market_payload(data) -> dict:
+    """Harem payload'ından cache alanlarını çıkar"""
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except:
+            return {}
     
-    @sio.event
-    async def disconnect():
-        logger.info('Disconnected from market WebSocket')
+    if not isinstance(data, dict):
+        return {}
     
-    @sio.event
-    async def message(data):
-        """Handle message events"""
-        try:
-            logger.info(f"Received message: {str(data)[:200]}")
-            await process_market_data(data)
-        except Exception as e:
-            logger.error(f"Error processing message: {e}")
+    new_data = {}
     
-    # Listen to specific events that might contain price data
-    @sio.on('price_changed')
-    async def on_price_changed(data):
-        """Handle price_changed events"""
-        try:
-            logger.info(f"Price changed event received")
-            logger.info(f"Data keys: {list(data.keys()) if isinstance(data, dict) else 'not a dict'}")
-            logger.info(f"Sample data: {str(data)[:500]}")
-            await process_market_data(data)
-        except Exception as e:
-            logger.error(f"Error in price_changed: {e}")
+    # Extract data from the nested structure
+    market_data = data.get('data', {})
+    if not isinstance(market_data, dict):
+        return {}
     
-    # Listen to all events
-    @sio.on('*')
-    async def catch_all(event, *args):
-        """Catch all events from the WebSocket"""
-        try:
-            if event != 'price_changed':  # Don't duplicate price_changed logs
-                logger.info(f"Received event '{event}' with {len(args)} args")
-            
-            if args and len(args) > 0 and event != 'price_changed':
-                data = args[0]
-                await process_market_data(data)
+    symbol_fields = (
+        ('ALTIN', 'has_gold_buy', 'has_gold_sell'),
+        ('USDTRY', 'usd_buy', 'usd_sell'),
+        ('EURTRY', 'eur_buy', 'eur_sell'),
+    )
+    
+    for symbol, buy_key, sell_key in symbol_fields:
+        section = market_data.get(symbol)
+        if not isinstance(section, dict):
+            continue
+        buy = _parse_price(section, 'alis')
+        sell = _parse_price(section, 'satis')
+        if buy is not None:
+            new_data[buy_key] = buy
+        if sell is not None:
+            new_data[sell_key] = sell
+    
+    return new_data
+
+
+async def warm_market_data_cache():
+    """
+    Startup: cache'i son market_data kaydıyla doldur
+    İlk tick gelene kadar /market-data/latest boş dönmesin (sonra DB okunmaz)
+    """
+    if _db is None or market_data_cache.get("timestamp"):
+        return
+    
+    try:
+        last = await _db.market_data.find_one({}, {"_id": 0, "recorded_at": 0}, sort=[("timestamp", -1)])
+    except Exception as e:
+        logger.error(f"Market data cache warm failed: {e}")
+        return
+    
+    if last:
+        logger.info("Market data cache warmed from last market_data record")
+        for key in market_data_cache:
+            if last.get(key) is not None:
+                market_data_cache[key] = last[key]
+
+
+async def _load_last_snapshot_as_of():
+    """Debounce için son feed snapshot zamanını bir kez yükle"""
+    global _last_snapshot_as_of, _last_snapshot_loaded
+    
+    if _last_snapshot_loaded or _db is None:
+        return
+    
+    last_snapshot = await _db.price_snapshots.find_one(
+        {"source": HAREM_SNAPSHOT_SOURCE},
+        {"as_of": 1},
+        sort=[("as_of", -1)]
+    )
+    if last_snapshot and isinstance(last_snapshot.get("as_of"), datetime):
+        last_as_of = last_snapshot["as_of"]
+        # Ensure both datetimes are timezone-aware
+        if last_as_of.tzinfo is None:
+            last_as_of = last_as_of.replace(tzinfo=timezone.utc)
+        _last_snapshot_as_of = last_as_of
+    _last_snapshot_loaded = True
+
+
+async def _maybe_write_price_snapshot(new_data: dict, data):
+    """Snapshot yaz - son snapshot'tan 60sn geçmediyse atla (bellekte debounce)"""
+    global _last_snapshot_as_of
+    
+    if _snapshot_source is None:
+        return
+    if 'has_gold_buy' not in new_data or 'has_gold_sell' not in new_data:
+        return
+    
+    now = datetime.now(timezone.utc)
+    if _last_snapshot_as_of and (now - _last_snapshot_as_of).total_seconds() < SNAPSHOT_DEBOUNCE_SECONDS:
+        return
+    
+    # Get USD rates from market_data_cache if not in new_data
+    usd_buy = new_data.get('usd_buy') or market_data_cache.get('usd_buy')
+    usd_sell = new_data.get('usd_sell') or market_data_cache.get('usd_sell')
+    eur_buy = new_data.get('eur_buy') or market_data_cache.get('eur_buy')
+    eur_sell = new_data.get('eur_sell') or market_data_cache.get('eur_sell')
+    
+    snapshot_doc = {
+        "as_of": now,
+        "source": _snapshot_source,
+        "has_buy_tl": round(new_data['has_gold_buy'], 6),
+        "has_sell_tl": round(new_data['has_gold_sell'], 6),
+        "usd_buy_tl": round(usd_buy, 4) if usd_buy else None,
+        "usd_sell_tl": round(usd_sell, 4) if usd_sell else None,
+        "eur_buy_tl": round(eur_buy, 4) if eur_buy else None,
+        "eur_sell_tl": round(eur_sell, 4) if eur_sell else None,
+        "raw_payload": trim_payload(data),
+        "created_at": now,
+        "created_by": "system"
+    }
+    
+    # Zamanı önce ayarla: insert hata verse de her tick'te tekrar denenmesin
+    _last_snapshot_as_of = now
+    await _db.price_snapshots.insert_one(snapshot_doc)
+    price_snapshot_cache.add(snapshot_doc)
+    tick_stats["snapshots_written"] += 1
+    logger.info(f"💰 Price snapshot saved: HAS Buy={snapshot_doc['has_buy_tl']}, Sell={snapshot_doc['has_sell_tl']}")
+
+
+async def process_market_data(data):
+    """Process one tick: update cache, buffer market_data, maybe write snapshot"""
+    try:
+        new_data = parse_market_payload(data)
+        
+        # Only update if we got some data and it's different
+        if not new_data:
+            tick_stats["unchanged"] += 1
+            return
+        
+        is_different = any(market_data_cache.get(key) != value for key, value in new_data.items())
+        if not is_different:
+            tick_stats["unchanged"] += 1
+            return
+        
+        now = datetime.now(timezone.utc)
+        market_data_cache.update(new_data)
+        market_data_cache['timestamp'] = now.isoformat()
+        logger.debug(f"Updated market data: {new_data}")
         
+        # SSE abonelerine yayınla (bloklamaz, client başına backpressure)
+        market_stream_hub.publish(get_market_data_cache())
+        
+        if _db is None:
+            return
+        
+        # market_data: buffer'a ekle, periyodik olarak bar + ham tick yazılır
+        # recorded_at: TTL retention ve bar bucket'ı için Date alanı
+        _pending_market_docs.append({
+            **market_data_cache,
+            "_id": str(uuid.uuid4()),
+            "recorded_at": now
+        })
+        if len(_pending_market_docs) >= MARKET_FLUSH_MAX_BATCH:
+            await flush_market_data()
+        
+        # Store price snapshot for financial_transactions V2
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except:
+                pass
+        await _maybe_write_price_snapshot(new_data, data)
+    
+    except Exception as e:
+        logger.error(f"Error processing market data: {e}")
+
+
+async def flush_market_data():
+    """Buffer'daki tick'leri yaz: OHLC bar upsert (bulk_write) + ham tick insert_many"""
+    global _pending_market_docs, _last_flush_at
+    
+    _last_flush_at = time.monotonic()
+    if not _pending_market_docs or _db is None:
+        return
+    
+    batch = _pending_market_docs
+    _pending_market_docs = []
+    
+    started = time.perf_counter()
+    try:
+        upserts = await write_bars(_db, batch)
+        tick_stats["bar_upserts"] += upserts
+        # Her tick her çözünürlükte bir bar güncellemesi; fazlası bulk upsert'te birleşti
+        tick_stats["bar_updates_merged"] += len(batch) * len(RESOLUTIONS) - upserts
+    except Exception as e:
+        logger.error(f"market_bars flush failed ({len(batch)} ticks): {e}")
+    
+    if MARKET_STORE_RAW_TICKS:
+        try:
+            await _db.market_data.insert_many(batch, ordered=False)
+            tick_stats["market_data_written"] += len(batch)
         except Exception as e:
-            logger.error(f"Error in catch_all: {e}")
+            logger.error(f"market_data flush failed ({len(batch)} docs): {e}")
+    
+    tick_stats["flushes"] += 1
+    tick_stats["last_flush_size"] = len(batch)
+    tick_stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+
+async def run_tick_pipeline():
+    """Consumer: queue'dan tick al, işle, flush aralığında buffer'ı yaz"""
+    global _last_flush_at
+    
+    try:
+        await _load_last_snapshot_as_of()
+    except Exception as e:
+        logger.error(f"Failed to load last snapshot time: {e}")
     
-    async def process_market_data(data):
-        """Process and store market data"""
-        global _db
+    _last_flush_at = time.monotonic()
+    
+    while True:
+        timeout = max(0.0, MARKET_FLUSH_INTERVAL - (time.monotonic() - _last_flush_at))
+        try:
+            data = await asyncio.wait_for(_tick_queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await flush_market_data()
+            continue
         
         try:
-            # Parse market data
-            if isinstance(data, str):
-                try:
-                    data = json.loads(data)
-                except:
-                    pass
-            
-            if isinstance(data, dict):
-                new_data = {}
-                timestamp = datetime.now(timezone.utc).isoformat()
-                
-                # Extract data from the nested structure
-                market_data = data.get('data', {})
-                
-                # Extract gold prices (ALTIN)
-                if 'ALTIN' in market_data:
-                    altin = market_data['ALTIN']
-                    if 'alis' in altin:
-                        try:
-                            new_data['has_gold_buy'] = float(altin['alis'])
-                        except (ValueError, TypeError):
-                            pass
-                    if 'satis' in altin:
-                        try:
-                            new_data['has_gold_sell'] = float(altin['satis'])
-                        except (ValueError, TypeError):
-                            pass
-                
-                # Extract USD prices (USDTRY)
-                if 'USDTRY' in market_data:
-                    usd = market_data['USDTRY']
-                    if 'alis' in usd:
-                        try:
-                            new_data['usd_buy'] = float(usd['alis'])
-                        except (ValueError, TypeError):
-                            pass
-                    if 'satis' in usd:
-                        try:
-                            new_data['usd_sell'] = float(usd['satis'])
-                        except (ValueError, TypeError):
-                            pass
-                
-                # Extract EUR prices (EURTRY)
-                if 'EURTRY' in market_data:
-                    eur = market_data['EURTRY']
-                    if 'alis' in eur:
-                        try:
-                            new_data['eur_buy'] = float(eur['alis'])
-                        except (ValueError, TypeError):
-                            pass
-                    if 'satis' in eur:
-                        try:
-                            new_data['eur_sell'] = float(eur['satis'])
-                        except (ValueError, TypeError):
-                            pass
-                
-                # Only update if we got some data and it's different
-                if new_data:
-                    is_different = False
-                    for key, value in new_data.items():
-                        if market_data_cache.get(key) != value:
-                            is_different = True
-                            break
-                    
-                    if is_different:
-                        market_data_cache.update(new_data)
-                        market_data_cache['timestamp'] = timestamp
-                        
-                        # Store in MongoDB (market_data)
-                        if _db is not None:
-                            await _db.market_data.insert_one({
-                                **market_data_cache,
-                                "_id": str(uuid.uuid4())
-                            })
-                            
-                            # Store price snapshot for financial_transactions V2
-                            if 'has_gold_buy' in new_data and 'has_gold_sell' in new_data:
-                                # Get USD rates from market_data_cache if not in new_data
-                                usd_buy = new_data.get('usd_buy') or market_data_cache.get('usd_buy')
-                                usd_sell = new_data.get('usd_sell') or market_data_cache.get('usd_sell')
-                                eur_buy = new_data.get('eur_buy') or market_data_cache.get('eur_buy')
-                                eur_sell = new_data.get('eur_sell') or market_data_cache.get('eur_sell')
-                                
-                                snapshot_doc = {
-                                    "as_of": datetime.now(timezone.utc),
-                                    "source": "HAREM_SOCKET",
-                                    "has_buy_tl": round(new_data['has_gold_buy'], 6),
-                                    "has_sell_tl": round(new_data['has_gold_sell'], 6),
-                                    "usd_buy_tl": round(usd_buy, 4) if usd_buy else None,
-                                    "usd_sell_tl": round(usd_sell, 4) if usd_sell else None,
-                                    "eur_buy_tl": round(eur_buy, 4) if eur_buy else None,
-                                    "eur_sell_tl": round(eur_sell, 4) if eur_sell else None,
-                                    "raw_payload": data,
-                                    "created_at": datetime.now(timezone.utc),
-                                    "created_by": "system"
-                                }
-                                
-                                # Check if similar snapshot exists in last 60 seconds (debounce)
-                                last_snapshot = await _db.price_snapshots.find_one(
-                                    {"source": "HAREM_SOCKET"},
-                                    sort=[("as_of", -1)]
-                                )
-                                
-                                should_insert = True
-                                if last_snapshot and last_snapshot.get("as_of"):
-                                    last_as_of = last_snapshot["as_of"]
-                                    # Ensure both datetimes are timezone-aware
-                                    if last_as_of.tzinfo is None:
-                                        last_as_of = last_as_of.replace(tzinfo=timezone.utc)
-                                    time_diff = (snapshot_doc["as_of"] - last_as_of).total_seconds()
-                                    if time_diff < 60:  # Less than 60 seconds
-                                        should_insert = False
-                                
-                                if should_insert:
-                                    await _db.price_snapshots.insert_one(snapshot_doc)
-                                    logger.info(f"Ã„Å¸Ã…Â¸Ã¢â‚¬â„¢Ã‚Â° Price snapshot saved: HAS Buy={snapshot_doc['has_buy_tl']}, Sell={snapshot_doc['has_sell_tl']}")
-                        
-                        logger.info(f"Updated market data: {new_data}")
+            await process_market_data(data)
+            tick_stats["processed"] += 1
+        finally:
+            _tick_queue.task_done()
         
-        except Exception as e:
-            logger.error(f"Error processing market data: {e}")
+        if time.monotonic() - _last_flush_at >= MARKET_FLUSH_INTERVAL:
+            await flush_market_data()
+
+
+def start_tick_pipeline():
+    """Queue ve consumer task'ı başlat (idempotent)"""
+    global _tick_queue, _pipeline_task
     
-    while True:
+    if _tick_queue is None:
+        _tick_queue = asyncio.Queue(maxsize=MARKET_TICK_QUEUE_SIZE)
+    if _pipeline_task is None or _pipeline_task.done():
+        _pipeline_task = asyncio.create_task(run_tick_pipeline())
+    return _pipeline_task
+
+
+async def stop_tick_pipeline():
+    """Consumer'ı durdur ve kalan buffer'ı yaz (shutdown)"""
+    global _pipeline_task
+    
+    if _pipeline_task is not None:
+        _pipeline_task.cancel()
         try:
-            logger.info("Attempting to connect to market WebSocket...")
-            await sio.connect(
-                'https://socket.haremaltin.com',
-                transports=['websocket'],
-                wait_timeout=10,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'Origin': 'https://www.haremaltin.com',
-                    'Referer': 'https://www.haremaltin.com/'
-                }
-            )
-            await sio.wait()
-        except Exception as e:
-            logger.error(f"WebSocket connection error: {e}")
-            await asyncio.sleep(10)  # Wait before reconnecting
+            await _pipeline_task
+        except asyncio.CancelledError:
+            pass
+        _pipeline_task = None
+    
+    # Queue'da kalanları işle, sonra flush
+    while _tick_queue is not None and not _tick_queue.empty():
+        await process_market_data(_tick_queue.get_nowait())
+        _tick_queue.task_done()
+    await flush_market_data()
+
+
+async def connect_to_market_websocket():
+    """Start the tick pipeline and run the configured market feed (MARKET_FEED)"""
+    global _snapshot_source
+    start_tick_pipeline()
+    
+    try:
+        feed = build_market_feed()
+    except ValueError as e:
+        logger.error(f"Market feed configuration error: {e}")
+        return
+    
+    if feed is None:
+        logger.info("Market feed disabled (MARKET_FEED=none)")
+        return
+    
+    _snapshot_source = feed.snapshot_source
+    if _snapshot_source is None:
+        logger.info(f"Market feed '{feed.name}' does not write price snapshots")
+    logger.info(f"Starting market feed: {feed.name}")
+    try:
+        await feed.run(enqueue_tick)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Market feed '{feed.name}' stopped: {e}")
@@ -10,6 +10,8 @@ from .user import (
 
 from .market import MarketData
 
+from .report import ReportJobCreate
+
 from .lookups import (
     PartyType,
     AssetType,
@@ -54,6 +56,8 @@ __all__ = [
     "UserResponse",
     # Market models
     "MarketData",
+    # Report models
+    "ReportJobCreate",
     # Lookup models
     "PartyType",
     "AssetType",
@@ -0,0 +1,9 @@
+"""Report job Pydantic models"""
+from pydantic import BaseModel, Field
+from typing import Any, Dict
+
+
+class ReportJobCreate(BaseModel):
+    report: str = Field(..., description="profit-loss, gold-movements, stock-count-report ...")
+    params: Dict[str, Any] = Field(default_factory=dict)
+    format: str = Field("json", description="json veya csv")
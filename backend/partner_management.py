@@ -5,13 +5,14 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, timezone
-from math import ceil
 import uuid
 import logging
 
 # Import unified ledger for dual-write
 from init_unified_ledger import create_ledger_entry, create_void_entry
 
+from utils.pagination import InvalidCursorError, page_count, paginate
+
 logger = logging.getLogger(__name__)
 
 # Router
@@ -70,29 +71,33 @@ def generate_capital_movement_id():
 async def get_partners(
     page: int = 1,
     per_page: int = 20,
-    is_active: Optional[bool] = None
+    is_active: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
 ):
-    """Get all partners with pagination"""
+    """Get all partners with pagination (page or cursor)"""
     query = {}
     if is_active is not None:
         query["is_active"] = is_active
     
-    # Count total
-    total = await db.partners.count_documents(query)
-    
     # Get partners sorted by created_at DESC (en son eklenen en üstte)
-    partners = await db.partners.find(query, {"_id": 0}).sort([
-        ("created_at", -1),
-        ("id", -1)
-    ]).skip((page - 1) * per_page).limit(per_page).to_list(per_page)
+    try:
+        partners, page_info = await paginate(
+            db.partners, query, [("created_at", -1), ("id", -1)],
+            page=page, per_page=per_page, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "partners": partners,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": ceil(total / per_page) if total > 0 else 1
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page, minimum=1),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -186,9 +191,11 @@ async def get_capital_movements(
     partner_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    type: Optional[str] = None
+    type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
 ):
-    """Get capital movements with pagination and filters"""
+    """Get capital movements with pagination (page or cursor) and filters"""
     query = {}
     
     if partner_id:
@@ -205,23 +212,24 @@ async def get_capital_movements(
         else:
             query["movement_date"] = {"$lte": end_date}
     
-    # Count total
-    total = await db.capital_movements.count_documents(query)
-    
     # Get movements sorted by movement_date DESC, created_at DESC (en son hareket en üstte)
-    movements = await db.capital_movements.find(query, {"_id": 0}).sort([
-        ("movement_date", -1),
-        ("created_at", -1),
-        ("id", -1)
-    ]).skip((page - 1) * per_page).limit(per_page).to_list(per_page)
+    try:
+        movements, page_info = await paginate(
+            db.capital_movements, query, [("movement_date", -1), ("created_at", -1), ("id", -1)],
+            page=page, per_page=per_page, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "movements": movements,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": ceil(total / per_page) if total > 0 else 1
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page, minimum=1),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
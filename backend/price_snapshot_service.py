@@ -0,0 +1,228 @@
+"""
+Price Snapshot Service - In-process snapshot cache with as-of lookup
+
+Son N price snapshot'ı as_of sırasına göre bellekte tutar:
+- Startup'ta DB'den son N snapshot yüklenir (warm)
+- market_websocket yeni HAREM_SOCKET snapshot'larını add() ile besler
+- "t anında veya öncesindeki en son snapshot" bisection ile bulunur
+
+Cache en eski elemanından bugüne kadar kesintisizdir; t bu aralıktaysa
+DB'ye gidilmez. Daha eski (geçmiş tarihli) sorgular as_of indexli Mongo
+sorgusuna düşer.
+"""
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PRICE_SNAPSHOT_CACHE_SIZE = int(os.environ.get("PRICE_SNAPSHOT_CACHE_SIZE", "500"))
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Mongo naive datetime döndürür (UTC) - karşılaştırma için aware yap"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def backfill_bucket(as_of: datetime) -> Tuple[str, datetime]:
+    """BACKFILL gün anahtarı: ("YYYY-MM-DD", günün başı UTC)"""
+    as_of = _as_utc(as_of).astimezone(timezone.utc)
+    day_start = as_of.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day_start.strftime("%Y-%m-%d"), day_start
+
+
+class PriceSnapshotCache:
+    """as_of'a göre sıralı, boyutu sınırlı snapshot dizisi"""
+
+    def __init__(self, max_size: int = PRICE_SNAPSHOT_CACHE_SIZE):
+        self.max_size = max_size
+        self._keys: List[datetime] = []
+        self._snapshots: List[dict] = []
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    async def load(self, db):
+        """Son N snapshot'ı DB'den yükle (startup)"""
+        docs = await db.price_snapshots.find(
+            {}, {"raw_payload": 0}
+        ).sort("as_of", -1).limit(self.max_size).to_list(self.max_size)
+
+        self._keys = []
+        self._snapshots = []
+        for doc in reversed(docs):
+            if isinstance(doc.get("as_of"), datetime):
+                self._keys.append(_as_utc(doc["as_of"]))
+                self._snapshots.append(doc)
+
+        self.loaded = True
+        logger.info(f"Price snapshot cache loaded: {len(self._keys)} snapshots")
+
+    def add(self, snapshot: dict):
+        """
+        Yeni snapshot ekle (market_websocket insert sonrası)
+
+        Sadece cache aralığının içine/sonuna düşen snapshot'lar eklenir;
+        daha eskiler cache'in kesintisizliğini bozacağı için atlanır.
+        """
+        if not self.loaded or not isinstance(snapshot.get("as_of"), datetime):
+            return
+
+        key = _as_utc(snapshot["as_of"])
+        if self._keys and key < self._keys[0]:
+            return
+
+        doc = {k: v for k, v in snapshot.items() if k != "raw_payload"}
+        idx = bisect_right(self._keys, key)
+        self._keys.insert(idx, key)
+        self._snapshots.insert(idx, doc)
+
+        # En eskileri at
+        overflow = len(self._keys) - self.max_size
+        if overflow > 0:
+            del self._keys[:overflow]
+            del self._snapshots[:overflow]
+
+    def latest(self) -> Optional[dict]:
+        """En güncel snapshot"""
+        if not self._snapshots:
+            return None
+        return dict(self._snapshots[-1])
+
+    def find_as_of(self, as_of: datetime) -> Optional[dict]:
+        """
+        as_of <= t olan en son snapshot (bisection)
+
+        None: t cache aralığından eski, DB'ye bakılmalı
+        """
+        if not self._keys:
+            return None
+
+        key = _as_utc(as_of)
+        idx = bisect_right(self._keys, key)
+        if idx == 0:
+            return None
+        return dict(self._snapshots[idx - 1])
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._keys),
+            "max_size": self.max_size,
+            "oldest_as_of": self._keys[0].isoformat() if self._keys else None,
+            "newest_as_of": self._keys[-1].isoformat() if self._keys else None,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Process-wide cache
+price_snapshot_cache = PriceSnapshotCache()
+
+
+async def init_price_snapshot_cache(db):
+    """Startup'ta cache'i doldur"""
+    try:
+        await price_snapshot_cache.load(db)
+    except Exception as e:
+        logger.error(f"Price snapshot cache load failed: {e}")
+
+
+async def find_price_snapshot_as_of(db, as_of: datetime) -> Optional[dict]:
+    """
+    as_of <= t olan en son snapshot'ı getir
+
+    1. Bellekteki cache (bisection, DB round trip yok)
+    2. Geçmiş tarih: as_of indexli Mongo sorgusu
+    """
+    snapshot = price_snapshot_cache.find_as_of(as_of)
+    if snapshot is not None:
+        price_snapshot_cache.hits += 1
+        return snapshot
+
+    price_snapshot_cache.misses += 1
+    return await db.price_snapshots.find_one(
+        {"as_of": {"$lte": as_of}},
+        {"raw_payload": 0},
+        sort=[("as_of", -1)]
+    )
+
+
+async def find_latest_price_snapshot(db) -> Optional[dict]:
+    """En güncel snapshot - cache boşsa DB"""
+    snapshot = price_snapshot_cache.latest()
+    if snapshot is not None:
+        return snapshot
+
+    return await db.price_snapshots.find_one(
+        {},
+        {"raw_payload": 0},
+        sort=[("as_of", -1)]
+    )
+
+
+# ==================== BACKFILL COMPACTION ====================
+
+async def compact_backfill_snapshots(db, dry_run: bool = False) -> dict:
+    """
+    Aynı güne ait tekrarlanan BACKFILL snapshot'ları tek kayda indir
+
+    Her gün için ilk oluşturulan kayıt tutulur (as_of = günün başı,
+    as_of_bucket set edilir), diğerlerine işaret eden
+    financial_transactions.price_snapshot_id referansları tutulan kayda
+    yönlendirilir ve tekrarlar silinir.
+    """
+    groups = {}
+    cursor = db.price_snapshots.find(
+        {"source": "BACKFILL"},
+        {"_id": 1, "as_of": 1, "as_of_bucket": 1, "created_at": 1}
+    ).sort([("created_at", 1), ("_id", 1)])
+
+    async for doc in cursor:
+        if not isinstance(doc.get("as_of"), datetime):
+            continue
+        bucket = doc.get("as_of_bucket") or backfill_bucket(doc["as_of"])[0]
+        groups.setdefault(bucket, []).append(doc)
+
+    stats = {"days": len(groups), "removed": 0, "repointed_transactions": 0}
+
+    for bucket, docs in groups.items():
+        # Bucket'ı zaten set edilmiş kayıt varsa (unique index sahibi) onu tut
+        keep = next((d for d in docs if d.get("as_of_bucket") == bucket), docs[0])
+        duplicate_ids = [d["_id"] for d in docs if d["_id"] != keep["_id"]]
+
+        if dry_run:
+            stats["removed"] += len(duplicate_ids)
+            if duplicate_ids:
+                stats["repointed_transactions"] += await db.financial_transactions.count_documents(
+                    {"price_snapshot_id": {"$in": duplicate_ids}}
+                )
+            continue
+
+        if duplicate_ids:
+            result = await db.financial_transactions.update_many(
+                {"price_snapshot_id": {"$in": duplicate_ids}},
+                {"$set": {"price_snapshot_id": keep["_id"]}}
+            )
+            stats["repointed_transactions"] += result.modified_count
+
+            result = await db.price_snapshots.delete_many({"_id": {"$in": duplicate_ids}})
+            stats["removed"] += result.deleted_count
+
+        _, day_start = backfill_bucket(keep["as_of"])
+        await db.price_snapshots.update_one(
+            {"_id": keep["_id"]},
+            {"$set": {"as_of": day_start, "as_of_bucket": bucket}}
+        )
+
+    logger.info(
+        f"BACKFILL compaction{' (dry run)' if dry_run else ''}: {stats['days']} days, "
+        f"{stats['removed']} duplicates removed, {stats['repointed_transactions']} transactions repointed"
+    )
+    return stats
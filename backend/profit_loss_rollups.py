@@ -0,0 +1,237 @@
+"""
+Profit/Loss Rollups - Daily per-category totals for /reports/profit-loss
+
+Kar/Zarar raporu aralıktaki tüm ledger kayıtlarını belleğe alıp tek tek
+sınıflandırıyordu. Her ledger yazımında kaydın etkisi gün + kategori
+bazında profit_loss_daily koleksiyonuna $inc ile eklenir; rapor özeti
+birkaç yüz satırlık bir aggregation'dır.
+
+Sınıflandırma tek yerde (classify_profit_loss): rollup, yeniden
+hesaplama ve detay endpoint'i aynı kuralları kullanır.
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+import logging
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+REVENUE_CATEGORIES = ("sales", "receipts", "purchase_profit", "payment_discount", "exchange_profit")
+EXPENSE_CATEGORIES = ("cogs", "operating_expenses", "salaries", "purchase_loss", "exchange_loss")
+# Bilgi amaçlı (Kar/Zarar'a yansımaz)
+STOCK_CATEGORIES = ("purchases", "sales_has")
+
+# Kar/Zarar etkisi olabilecek ledger tipleri (detay sorgusu)
+PROFIT_LOSS_TYPES = [
+    "SALE", "RECEIPT", "PAYMENT", "PURCHASE_PROFIT", "PURCHASE_PROFIT_LOSS",
+    "EXPENSE", "SALARY_PAYMENT", "PURCHASE_LOSS", "EXCHANGE", "VOID",
+]
+
+
+def _bucket(tl=0.0, has=0.0, count=0) -> dict:
+    return {"tl": tl, "has": has, "count": count}
+
+
+def classify_profit_loss(entry: dict) -> Tuple[Dict[str, dict], Optional[dict]]:
+    """
+    Tek ledger kaydının Kar/Zarar etkisi
+
+    MANTIK:
+    - ALIŞ = Stok girişi (gider DEĞİL!)
+    - SATIŞ = Gelir, satılan ürünün maliyeti (COGS) gider
+    - Tedarikçiden tahsilat ve iskontosuz ödeme bilanço hareketi
+
+    Returns: ({kategori: {"tl", "has", "count"}}, detay satırı veya None)
+    """
+    entry_type = entry.get("type", "")
+
+    amount_in = entry.get("amount_in", 0) or 0
+    amount_out = entry.get("amount_out", 0) or 0
+    has_in = entry.get("has_in", 0) or 0
+    has_out = entry.get("has_out", 0) or 0
+    cost_has = entry.get("cost_has", 0) or 0
+    cost_tl = entry.get("cost_tl", 0) or 0
+    profit_has = entry.get("profit_has", 0) or 0
+    profit_tl = entry.get("profit_tl", 0) or 0
+
+    buckets: Dict[str, dict] = {}
+    detail = {
+        "id": entry.get("id"),
+        "date": (entry.get("transaction_date") or "")[:10],
+        "type": entry_type,
+        "description": entry.get("description", ""),
+        "revenue_tl": 0,
+        "revenue_has": 0,
+        "expense_tl": 0,
+        "expense_has": 0,
+        "profit_tl": 0,
+        "profit_has": 0
+    }
+
+    # SATIŞLAR (GELİR + MALİYET)
+    if entry_type == "SALE":
+        # Satış geliri = amount_in (tahsilat), HAS tarafı net kar
+        buckets["sales"] = _bucket(amount_in, profit_has, 1)
+        detail.update(revenue_tl=amount_in, revenue_has=profit_has, profit_tl=profit_tl, profit_has=profit_has)
+
+        # Satılan ürünün maliyeti (COGS)
+        if cost_has > 0 or cost_tl > 0:
+            buckets["cogs"] = _bucket(cost_tl, cost_has, 1)
+
+        buckets["sales_has"] = _bucket(has=has_out)
+
+    # TAHSİLATLAR - Tedarikçiden tahsilat bilanço hareketi, müşteriden GELİR
+    elif entry_type == "RECEIPT":
+        if entry.get("party_type", "") == "SUPPLIER":
+            return {}, None
+        buckets["receipts"] = _bucket(amount_in, has_in, 1)
+        detail.update(revenue_tl=amount_in, revenue_has=has_in, profit_tl=amount_in, profit_has=has_in)
+
+    # ÖDEMELER - normalde bilanço hareketi, iskonto varsa KAR
+    elif entry_type == "PAYMENT":
+        if profit_has > 0.001 or profit_tl > 0.01:
+            buckets["payment_discount"] = _bucket(profit_tl, profit_has, 1)
+            detail.update(revenue_tl=profit_tl, revenue_has=profit_has, profit_tl=profit_tl, profit_has=profit_has)
+        else:
+            return {}, None
+
+    # ALIŞ KARI (GELİR)
+    elif entry_type in ("PURCHASE_PROFIT", "PURCHASE_PROFIT_LOSS"):
+        profit_amount = entry.get("profit_amount", 0) or amount_in or 0
+        profit_has_val = profit_has or has_in or 0
+        if profit_amount > 0 or profit_has_val > 0:
+            buckets["purchase_profit"] = _bucket(profit_amount, profit_has_val, 1)
+            detail.update(revenue_tl=profit_amount, revenue_has=profit_has_val,
+                          profit_tl=profit_amount, profit_has=profit_has_val)
+
+    # ALIŞLAR - STOK GİRİŞİ (GİDER DEĞİL!), detay listesine eklenmez
+    elif entry_type == "PURCHASE":
+        return {"purchases": _bucket(amount_out, has_in, 1)}, None
+
+    # İŞLETME GİDERLERİ / MAAŞ ÖDEMELERİ (GİDER)
+    # Maaş tahakkuku (SALARY_ACCRUAL) borç kaydıdır, Kar/Zarar'a yansımaz
+    elif entry_type in ("EXPENSE", "SALARY_PAYMENT"):
+        category = "operating_expenses" if entry_type == "EXPENSE" else "salaries"
+        buckets[category] = _bucket(amount_out, 0, 1)
+        detail.update(expense_tl=amount_out, profit_tl=-amount_out)
+
+    # ALIŞ ZARARI (GİDER)
+    elif entry_type == "PURCHASE_LOSS":
+        loss_amount = entry.get("loss_amount", 0) or amount_out or 0
+        loss_has = entry.get("loss_has", 0) or has_out or 0
+        buckets["purchase_loss"] = _bucket(loss_amount, loss_has, 1)
+        detail.update(expense_tl=loss_amount, expense_has=loss_has, profit_tl=-loss_amount, profit_has=-loss_has)
+
+    # DÖVİZ İŞLEMLERİ (Kar veya Zarar)
+    elif entry_type == "EXCHANGE":
+        exchange_profit_has = profit_has or entry.get("has_net", 0) or 0
+        if exchange_profit_has > 0:
+            buckets["exchange_profit"] = _bucket(profit_tl if profit_tl > 0 else 0, exchange_profit_has, 1)
+            detail.update(revenue_has=exchange_profit_has, revenue_tl=profit_tl,
+                          profit_tl=profit_tl, profit_has=exchange_profit_has)
+        elif exchange_profit_has < 0:
+            buckets["exchange_loss"] = _bucket(abs(profit_tl) if profit_tl < 0 else 0, abs(exchange_profit_has), 1)
+            detail.update(expense_has=abs(exchange_profit_has), expense_tl=abs(profit_tl),
+                          profit_tl=profit_tl, profit_has=exchange_profit_has)
+
+    # VOID kayıtları (satış iptali gelirden düşer, adet değişmez)
+    elif entry_type == "VOID":
+        adjustment_reason = entry.get("adjustment_reason", "") or ""
+        original_type = entry.get("reference_type", "") or ""
+        if "SALE" in adjustment_reason.upper() or "SALE" in original_type.upper():
+            buckets["sales"] = _bucket(-amount_out, -has_in, 0)
+            detail.update(revenue_tl=-amount_out, revenue_has=-has_in)
+
+    # Detay listesine sadece kar/zarar etkisi olanlar
+    if not (detail["revenue_tl"] or detail["revenue_has"] or detail["expense_tl"] or detail["expense_has"]):
+        detail = None
+    return buckets, detail
+
+
+def _rollup_ops(entries: Iterable[dict]) -> list:
+    """Kayıtların etkisini (gün, kategori) bazında $inc upsert'lere çevir"""
+    increments: Dict[Tuple[str, str], dict] = {}
+    for entry in entries:
+        transaction_date = entry.get("transaction_date")
+        # Rapor string tarih aralığıyla sorguluyordu; string olmayan tarihler dahil değildi
+        if not isinstance(transaction_date, str):
+            continue
+        buckets, _ = classify_profit_loss(entry)
+        for category, bucket in buckets.items():
+            total = increments.setdefault((transaction_date[:10], category), _bucket())
+            total["tl"] += bucket["tl"]
+            total["has"] += bucket["has"]
+            total["count"] += bucket["count"]
+
+    return [
+        UpdateOne({"date": day, "category": category}, {"$inc": total}, upsert=True)
+        for (day, category), total in increments.items()
+    ]
+
+
+async def apply_profit_loss_rollups(db, entries: Iterable[dict], session=None):
+    """Yeni yazılan ledger kayıtlarını günlük rollup'lara ekle (ledger ile aynı session)"""
+    ops = _rollup_ops(entries)
+    if ops:
+        await db.profit_loss_daily.bulk_write(ops, ordered=False, session=session)
+
+
+async def rebuild_profit_loss_rollups(db, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
+    """
+    Rollup'ları ledger'dan yeniden hesapla (ilk kurulum / düzeltme)
+
+    Gün aralığı verilirse sadece o günler. Hesaplama sürerken aynı günlere
+    yazılan kayıtlar için sonra tekrar çalıştırılmalı.
+    """
+    query = {"transaction_date": {"$type": "string"}}
+    day_query = {}
+    if start_date:
+        query["transaction_date"]["$gte"] = start_date
+        day_query["$gte"] = start_date
+    if end_date:
+        query["transaction_date"]["$lte"] = end_date + "T23:59:59"
+        day_query["$lte"] = end_date
+
+    started = datetime.now(timezone.utc)
+    await db.profit_loss_daily.delete_many({"date": day_query} if day_query else {})
+
+    entries, batch = 0, []
+    async for entry in db.unified_ledger.find(query, {"_id": 0}):
+        batch.append(entry)
+        entries += 1
+        if len(batch) >= 5000:
+            await apply_profit_loss_rollups(db, batch)
+            batch = []
+    await apply_profit_loss_rollups(db, batch)
+
+    days = await db.profit_loss_daily.count_documents({"date": day_query} if day_query else {})
+    elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+    logger.info(f"Profit/loss rollups rebuilt: {entries} entries -> {days} rows in {elapsed:.1f}s")
+    return {"entries": entries, "rollup_rows": days, "elapsed_seconds": round(elapsed, 2)}
+
+
+async def init_profit_loss_rollups(db):
+    """Startup: rollup koleksiyonu boşsa ve ledger doluysa bir kez hesapla"""
+    try:
+        if await db.profit_loss_daily.estimated_document_count() > 0:
+            return
+        if not await db.unified_ledger.find_one({}, {"_id": 1}):
+            return
+        await rebuild_profit_loss_rollups(db)
+    except Exception as e:
+        logger.error(f"Profit/loss rollup init failed: {e}")
+
+
+async def get_profit_loss_totals(db, start_date: str, end_date: str) -> Dict[str, dict]:
+    """[start_date, end_date] günlerinin kategori toplamları"""
+    rows = await db.profit_loss_daily.aggregate([
+        {"$match": {"date": {"$gte": start_date, "$lte": end_date}}},
+        {"$group": {
+            "_id": "$category",
+            "tl": {"$sum": "$tl"},
+            "has": {"$sum": "$has"},
+            "count": {"$sum": "$count"}
+        }}
+    ]).to_list(None)
+    return {row["_id"]: _bucket(row["tl"], row["has"], row["count"]) for row in rows}
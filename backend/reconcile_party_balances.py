@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Party bakiyelerini (has_balance + currency_balances) financial_transactions'dan
+yeniden oluşturur.
+
+Kullanım:
+    python reconcile_party_balances.py              # Tüm party'ler
+    python reconcile_party_balances.py <party_id>   # Sadece verilen party'ler
+"""
+import asyncio
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'kuyumcu_db')
+
+from services.party_balance_service import rebuild_party_balances
+
+
+async def reconcile_party_balances(party_ids=None):
+    """Materialized party bakiyelerini ledger'dan yeniden hesapla"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    
+    print(f"🔄 Reconciling party balances in {DB_NAME}...")
+    
+    changed = await rebuild_party_balances(db, party_ids=party_ids)
+    
+    for item in changed:
+        print(f"  ✏️  {item['name']} ({item['party_id']}): "
+              f"HAS {item['old_balance']} -> {item['new_balance']}, "
+              f"{item['old_currency_balances']} -> {item['new_currency_balances']}")
+    
+    print(f"✅ Reconciliation completed! {len(changed)} party bakiyesi düzeltildi")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_party_balances(sys.argv[1:] or None))
@@ -0,0 +1,127 @@
+"""
+Report Cache - Computed report results keyed by data sequence numbers
+
+Dashboard aynı raporları (kar/zarar, ledger özeti, altın hareketleri, stok
+özeti) aynı tarih aralıklarıyla tekrar tekrar istiyor. Sonuçlar
+(rapor, parametreler, sıra numaraları) anahtarıyla bellekte tutulur:
+- report_sequences koleksiyonunda her veri kaynağı için artan bir sayaç
+  ("ledger": her ledger yazımı, "products": ledger'sız ürün değişiklikleri)
+- Hit için tek find ile sayaçlar okunur; veri değiştiyse anahtar değişir,
+  eski sonuçlar LRU ile düşer
+- Sayaç yazımı ledger ile aynı session'da: abort olan transaction sayacı artırmaz
+
+Sayaç veri yazımından sonra arttığı için en kötü durumda bir sonuç
+REPORT_CACHE_TTL süresi kadar eski kalabilir.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_TTL = int(os.environ.get("REPORT_CACHE_TTL", "300"))
+REPORT_CACHE_MAX_ENTRIES = int(os.environ.get("REPORT_CACHE_MAX_ENTRIES", "256"))
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("REPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+SEQUENCE_COLLECTION = "report_sequences"
+
+
+async def bump_report_sequence(db, name: str = "ledger", session=None):
+    """Veri kaynağı değişti - bu kaynağa bağlı cache anahtarları geçersiz"""
+    await db[SEQUENCE_COLLECTION].update_one(
+        {"_id": name}, {"$inc": {"value": 1}}, upsert=True, session=session
+    )
+
+
+async def current_sequences(db, names: Iterable[str]) -> Tuple[int, ...]:
+    """Sayaçların güncel değerleri (tek sorgu)"""
+    names = list(names)
+    docs = await db[SEQUENCE_COLLECTION].find({"_id": {"$in": names}}).to_list(len(names))
+    values = {doc["_id"]: doc.get("value", 0) for doc in docs}
+    return tuple(values.get(name, 0) for name in names)
+
+
+class ReportCache:
+    """Anahtar -> rapor sonucu (TTL + LRU, giriş sayısı ve toplam boyut sınırlı)"""
+
+    def __init__(self, ttl: int = REPORT_CACHE_TTL, max_entries: int = REPORT_CACHE_MAX_ENTRIES,
+                 max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: tuple, value: Any):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes // 4:
+            # Tek sonuç cache'in çeyreğinden büyükse tutma
+            self.skipped += 1
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic(), size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, report: Optional[str] = None):
+        for key in [k for k in self._entries if report is None or k[0] == report]:
+            self._remove(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        by_report: Dict[str, int] = {}
+        for key in self._entries:
+            by_report[key[0]] = by_report.get(key[0], 0) + 1
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0,
+            "evictions": self.evictions,
+            "skipped_too_large": self.skipped,
+            "by_report": by_report
+        }
+
+
+# Process-wide cache
+report_cache = ReportCache()
+
+
+async def report_cache_key(db, report: str, params: Dict[str, Any],
+                           sequences: Iterable[str] = ("ledger",)) -> tuple:
+    """(rapor, parametreler, sayaçlar) - sayaçlar her çağrıda DB'den okunur"""
+    return (
+        report,
+        json.dumps(params, sort_keys=True, default=str),
+        await current_sequences(db, sequences)
+    )
@@ -0,0 +1,271 @@
+"""
+Report Jobs - Background report runner with downloadable results
+
+Uzun aralıklı raporlar (yıllık kar/zarar, altın hareketleri, sayım raporu)
+HTTP worker'ını rapor süresince meşgul ediyor ve ingress timeout'una
+takılıyordu:
+- POST /reports/jobs işi report_jobs koleksiyonuna yazar ve kuyruğa ekler
+- Sınırlı sayıda asyncio worker kayıtlı rapor fonksiyonunu (mevcut endpoint
+  fonksiyonları) çalıştırır
+- Sonuç gzip'li JSON veya CSV olarak iş dokümanında saklanır
+- expire_at TTL index'i ile eski işler silinir
+
+Kuyruk process içidir: process yeniden başlarsa kuyruktaki/çalışan işler
+REPORT_JOB_TIMEOUT sonunda "failed" görünür.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import csv
+import gzip
+import inspect
+import io
+import json
+import logging
+import os
+import time
+import uuid
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_WORKERS = int(os.environ.get("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_QUEUE_SIZE = int(os.environ.get("REPORT_JOB_QUEUE_SIZE", "100"))
+REPORT_JOB_TIMEOUT = int(os.environ.get("REPORT_JOB_TIMEOUT", "1800"))  # saniye
+REPORT_JOB_TTL_HOURS = int(os.environ.get("REPORT_JOB_TTL_HOURS", "24"))
+
+# BSON doküman sınırı 16MB; sıkıştırılmış sonuç bunun altında kalmalı
+MAX_RESULT_BYTES = 15 * 1024 * 1024
+
+JOB_FORMATS = ("json", "csv")
+CONTENT_TYPES = {"json": "application/json", "csv": "text/csv; charset=utf-8"}
+
+# CSV dönüştürücü: rapor sonucu -> (başlıklar, satırlar)
+CsvRows = Callable[[dict], Tuple[Sequence[str], List[Sequence[Any]]]]
+
+
+class ReportDefinition:
+    def __init__(self, name: str, func: Callable, csv_rows: Optional[CsvRows] = None):
+        self.name = name
+        self.func = func
+        self.csv_rows = csv_rows
+        signature = inspect.signature(func)
+        self.params = [p for p in signature.parameters if p != "current_user"]
+        self.takes_user = "current_user" in signature.parameters
+        self.required = [
+            name for name, p in signature.parameters.items()
+            if name != "current_user" and _is_required(p)
+        ]
+
+
+def _is_required(param: inspect.Parameter) -> bool:
+    """Default'u olmayan veya FastAPI Query(...) ile zorunlu parametre"""
+    default = param.default
+    if default is inspect.Parameter.empty:
+        return True
+    return getattr(default, "default", None) is Ellipsis
+
+
+def _param_default(func: Callable, name: str):
+    default = inspect.signature(func).parameters[name].default
+    # FastAPI Query(...) nesnesi: gerçek default değeri
+    return getattr(default, "default", default)
+
+
+_reports: Dict[str, ReportDefinition] = {}
+
+
+def register_report(name: str, func: Callable, csv_rows: Optional[CsvRows] = None):
+    """Endpoint fonksiyonunu iş gövdesi olarak kaydet"""
+    _reports[name] = ReportDefinition(name, func, csv_rows)
+
+
+def available_reports() -> List[dict]:
+    return [
+        {"report": d.name, "params": d.params, "required": d.required,
+         "formats": ["json", "csv"] if d.csv_rows else ["json"]}
+        for d in sorted(_reports.values(), key=lambda d: d.name)
+    ]
+
+
+# ==================== ENCODING ====================
+
+def encode_result(result: Any, fmt: str, csv_rows: Optional[CsvRows] = None) -> bytes:
+    """Sonucu JSON veya CSV olarak gzip'le"""
+    if fmt == "csv":
+        headers, rows = csv_rows(result)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        writer.writerows(rows)
+        payload = buffer.getvalue().encode("utf-8-sig")  # Excel için BOM
+    else:
+        payload = json.dumps(result, ensure_ascii=False, default=str).encode("utf-8")
+    return gzip.compress(payload, compresslevel=6)
+
+
+# ==================== QUEUE / WORKERS ====================
+
+class ReportJobRunner:
+    """Process içi iş kuyruğu ve sınırlı worker havuzu"""
+
+    def __init__(self, workers: int = REPORT_JOB_WORKERS, queue_size: int = REPORT_JOB_QUEUE_SIZE):
+        self.worker_count = workers
+        self.queue: Optional[asyncio.Queue] = None
+        self.queue_size = queue_size
+        self._workers: List[asyncio.Task] = []
+        self.db = None
+        self.completed = 0
+        self.failed = 0
+
+    def start(self, db):
+        if self._workers:
+            return
+        self.db = db
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+        logger.info(f"Report job runner started: {self.worker_count} workers")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def enqueue(self, job_id: str, current_user):
+        if self.queue is None:
+            raise HTTPException(status_code=503, detail="Rapor kuyruğu çalışmıyor")
+        try:
+            self.queue.put_nowait((job_id, current_user))
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Rapor kuyruğu dolu, daha sonra tekrar deneyin")
+
+    async def _set(self, job_id: str, **fields):
+        fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+        await self.db.report_jobs.update_one({"id": job_id}, {"$set": fields})
+
+    async def _worker(self, index: int):
+        while True:
+            job_id, current_user = await self.queue.get()
+            try:
+                await self._run(job_id, current_user)
+            except Exception as e:
+                logger.error(f"Report job {job_id} worker error: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id: str, current_user):
+        job = await self.db.report_jobs.find_one({"id": job_id}, {"_id": 0, "result": 0})
+        if not job or job.get("status") != "queued":
+            return
+        definition = _reports.get(job["report"])
+
+        started = time.perf_counter()
+        await self._set(job_id, status="running", progress=10, started_at=datetime.now(timezone.utc).isoformat())
+        try:
+            kwargs = {name: _param_default(definition.func, name) for name in definition.params}
+            kwargs.update(job.get("params") or {})
+            if definition.takes_user:
+                kwargs["current_user"] = current_user
+            result = await asyncio.wait_for(definition.func(**kwargs), timeout=REPORT_JOB_TIMEOUT)
+
+            await self._set(job_id, progress=90)
+            payload = await asyncio.get_running_loop().run_in_executor(
+                None, encode_result, result, job["format"], definition.csv_rows
+            )
+            if len(payload) > MAX_RESULT_BYTES:
+                raise ValueError(f"Sonuç çok büyük ({len(payload) // (1024 * 1024)}MB sıkıştırılmış)")
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else (str(e) or type(e).__name__)
+            self.failed += 1
+            logger.warning(f"Report job {job_id} ({job['report']}) failed: {detail}")
+            await self._set(
+                job_id, status="failed", progress=100, error=detail,
+                finished_at=datetime.now(timezone.utc).isoformat(),
+                elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
+            return
+
+        self.completed += 1
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        await self._set(
+            job_id, status="done", progress=100, result=payload,
+            compressed_size=len(payload), content_type=CONTENT_TYPES[job["format"]],
+            finished_at=datetime.now(timezone.utc).isoformat(), elapsed_ms=elapsed_ms
+        )
+        logger.info(f"Report job {job_id} ({job['report']}) done in {elapsed_ms:.0f}ms, {len(payload)} bytes gzip")
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "queued": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+
+# Process-wide runner
+report_job_runner = ReportJobRunner()
+
+
+async def create_report_job(db, report: str, params: dict, fmt: str, current_user) -> dict:
+    """İşi doğrula, kaydet ve kuyruğa ekle"""
+    definition = _reports.get(report)
+    if definition is None:
+        raise HTTPException(status_code=404, detail=f"Bilinmeyen rapor: {report}")
+    if fmt not in JOB_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Geçersiz format: {fmt}")
+    if fmt == "csv" and definition.csv_rows is None:
+        raise HTTPException(status_code=422, detail=f"{report} raporu CSV olarak üretilemez")
+
+    params = params or {}
+    unknown = [p for p in params if p not in definition.params]
+    missing = [p for p in definition.required if params.get(p) in (None, "")]
+    if unknown or missing:
+        raise HTTPException(status_code=422, detail={"unknown_params": unknown, "missing_params": missing})
+
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": str(uuid.uuid4()),
+        "report": report,
+        "params": params,
+        "format": fmt,
+        "status": "queued",
+        "progress": 0,
+        "created_by": getattr(current_user, "id", None),
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+        "timeout_at": (now + timedelta(seconds=REPORT_JOB_TIMEOUT * 2)).isoformat(),
+        "expire_at": now + timedelta(hours=REPORT_JOB_TTL_HOURS)
+    }
+    await db.report_jobs.insert_one(job)
+    job.pop("_id", None)
+    try:
+        report_job_runner.enqueue(job["id"], current_user)
+    except HTTPException:
+        await db.report_jobs.delete_one({"id": job["id"]})
+        raise
+    return job
+
+
+def job_status(job: dict) -> dict:
+    """İş dokümanından API yanıtı (sonuç hariç)"""
+    status = job.get("status")
+    error = job.get("error")
+    # Process yeniden başladıysa iş kuyrukta/çalışır halde kalmış olabilir
+    if status in ("queued", "running") and job.get("timeout_at", "") < datetime.now(timezone.utc).isoformat():
+        status, error = "failed", "İş tamamlanamadı (zaman aşımı veya sunucu yeniden başlatıldı)"
+    response = {
+        key: job.get(key) for key in (
+            "id", "report", "params", "format", "progress", "created_at",
+            "started_at", "finished_at", "elapsed_ms", "compressed_size"
+        )
+    }
+    response["status"] = status
+    response["error"] = error
+    expire_at = job.get("expire_at")
+    response["expires_at"] = expire_at.isoformat() if isinstance(expire_at, datetime) else expire_at
+    response["result_url"] = f"/api/reports/jobs/{job['id']}/result" if status == "done" else None
+    return response
@@ -1,10 +1,11 @@
 """Activity Log Router"""
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from typing import Optional, List
 from datetime import datetime
 from database import get_db
 from models.user import User
 from auth import get_current_user
+from utils.pagination import InvalidCursorError, page_count, paginate
 
 router = APIRouter(prefix="/activity-logs", tags=["Activity Logs"])
 
@@ -18,14 +19,15 @@ async def get_activity_logs(
     entity_type: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Önceki yanıttaki next_cursor (page yerine)"),
+    include_total: Optional[bool] = Query(None, description="Toplam kayıt sayısı (varsayılan: sadece page ile)"),
     current_user: User = Depends(get_current_user)
 ):
-    """Get activity logs with filtering and pagination (ADMIN only)"""
+    """Get activity logs with filtering and pagination (ADMIN only, page or cursor)"""
     db = get_db()
     
     # Only admin can view activity logs
     if current_user.role not in ["ADMIN", "SUPER_ADMIN"]:
-        from fastapi import HTTPException
         raise HTTPException(status_code=403, detail="Admin access required")
     
     # Build filter
@@ -50,31 +52,29 @@ async def get_activity_logs(
             date_filter["$lte"] = end_dt.replace(hour=23, minute=59, second=59)
         filter_query["created_at"] = date_filter
     
-    # Count total
-    total = await db.activity_logs.count_documents(filter_query)
-    
-    # Calculate pagination
-    total_pages = (total + page_size - 1) // page_size
-    skip = (page - 1) * page_size
-    
-    # Get logs
-    cursor = db.activity_logs.find(filter_query).sort("created_at", -1).skip(skip).limit(page_size)
+    # Get logs (created_at DESC, id) - cursor varsa keyset, toplam sayı cache'li
+    try:
+        logs, page_info = await paginate(
+            db.activity_logs, filter_query, [("created_at", -1), ("id", -1)],
+            page=page, per_page=page_size, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    logs = []
-    async for log in cursor:
-        log.pop("_id", None)
+    for log in logs:
         # Convert datetime to string
         if isinstance(log.get("created_at"), datetime):
             log["created_at"] = log["created_at"].isoformat()
-        logs.append(log)
     
     return {
         "logs": logs,
         "pagination": {
             "page": page,
             "page_size": page_size,
-            "total": total,
-            "total_pages": total_pages
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], page_size),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
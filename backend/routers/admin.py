@@ -5,6 +5,12 @@ import logging
 from database import get_db
 from auth import get_current_user
 from models.user import User
+from services.party_balance_service import rebuild_party_balances
+from price_snapshot_service import compact_backfill_snapshots
+from profit_loss_rollups import rebuild_profit_loss_rollups
+from report_cache import bump_report_sequence, report_cache
+from report_jobs import report_job_runner
+from ledger_checkpoints import build_period_checkpoints, get_checkpoint_stats, rebuild_stale_checkpoints
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 logger = logging.getLogger(__name__)
@@ -15,73 +21,130 @@ async def fix_all_party_balances(
     current_user: User = Depends(get_current_user)
 ):
     """
-    TÜM party'lerin has_balance değerlerini transaction'lardan yeniden hesapla.
+    TÜM party'lerin has_balance ve currency_balances değerlerini
+    transaction'lardan yeniden hesapla (reconciliation).
     Bu endpoint mevcut verileri düzeltmek için kullanılır.
     """
     db = get_db()
     
-    fixed_parties = []
-    
-    # Tüm party'leri al
-    parties = await db.parties.find({}).to_list(1000)
-    
-    for party in parties:
-        party_id = party["id"]
-        old_balance = party.get("has_balance", 0)
-        
-        # Bu party'nin COMPLETED transaction'larını al
-        pipeline = [
-            {"$match": {"party_id": party_id, "status": {"$ne": "CANCELLED"}}},
-            {"$group": {
-                "_id": "$type_code",
-                "total": {"$sum": "$total_has_amount"}
-            }}
-        ]
-        
-        results = await db.financial_transactions.aggregate(pipeline).to_list(10)
-        
-        # Transaction tipine göre balance hesapla
-        new_balance = 0
-        breakdown = {}
-        
-        for r in results:
-            type_code = r["_id"]
-            total = r["total"]
-            breakdown[type_code] = total
-            
-            if type_code == "PURCHASE":
-                # Alış: biz borçlandık (pozitif)
-                new_balance += total
-            elif type_code == "PAYMENT":
-                # Ödeme: borcumuzu kapattık (total zaten negatif)
-                new_balance += total  # -57.5 ekleniyor
-            elif type_code == "SALE":
-                # Satış: müşteri borçlandı (total negatif = bize borçlu)
-                # Müşterinin bize borcu = bizim alacağımız = negatif balance
-                new_balance += total  # total zaten negatif
-            elif type_code == "RECEIPT":
-                # Tahsilat: müşteri ödedi (total pozitif = alacağımız azaldı)
-                new_balance += total
-        
-        # Bakiyeyi güncelle
-        await db.parties.update_one(
-            {"id": party_id},
-            {"$set": {"has_balance": new_balance}}
-        )
-        
-        if abs(old_balance - new_balance) > 0.0001:
-            fixed_parties.append({
-                "party_id": party_id,
-                "name": party.get("name"),
-                "old_balance": old_balance,
-                "new_balance": new_balance,
-                "breakdown": breakdown
-            })
-        
-        logger.info(f"Fixed party {party.get('name')}: {old_balance} -> {new_balance}")
+    fixed_parties = await rebuild_party_balances(db)
     
     return {
         "success": True,
         "message": f"{len(fixed_parties)} party bakiyesi düzeltildi",
         "fixed_parties": fixed_parties
     }
+
+
+@router.post("/compact-backfill-snapshots")
+async def compact_backfill_price_snapshots(
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Aynı güne ait tekrarlanan BACKFILL price snapshot'larını birleştir.
+    Transaction'ların price_snapshot_id referansları tutulan kayda yönlendirilir.
+    """
+    db = get_db()
+    
+    stats = await compact_backfill_snapshots(db, dry_run=dry_run)
+    
+    return {
+        "success": True,
+        "dry_run": dry_run,
+        "message": f"{stats['removed']} tekrar BACKFILL snapshot {'silinecek' if dry_run else 'silindi'}",
+        **stats
+    }
+
+
+@router.get("/ledger-checkpoints")
+async def get_ledger_checkpoints(
+    current_user: User = Depends(get_current_user)
+):
+    """Checkpoint'li dönemler ve bekleyen (stale) checkpoint sayısı"""
+    db = get_db()
+    return await get_checkpoint_stats(db)
+
+
+@router.post("/ledger-checkpoints/rebuild")
+async def rebuild_ledger_checkpoints(
+    period_code: str = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Kapalı tahakkuk dönemlerinin checkpoint'lerini yeniden oluştur.
+    period_code verilirse sadece o dönem (kapalı olmalı). Checkpoint
+    özelliğinden önce kapatılmış dönemler için de kullanılır.
+    """
+    db = get_db()
+    
+    query = {"is_closed": True}
+    if period_code:
+        query["code"] = period_code
+    periods = await db.accrual_periods.find(query, {"_id": 0, "code": 1}).sort("code", 1).to_list(None)
+    if period_code and not periods:
+        raise HTTPException(status_code=404, detail="Kapalı dönem bulunamadı")
+    
+    await rebuild_stale_checkpoints(db)
+    results = [await build_period_checkpoints(db, p["code"]) for p in periods]
+    
+    return {
+        "success": True,
+        "message": f"{len(results)} dönem için ledger checkpoint oluşturuldu",
+        "periods": results
+    }
+
+
+@router.post("/profit-loss-rollups/rebuild")
+async def rebuild_profit_loss_daily(
+    start_date: str = None,
+    end_date: str = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Günlük Kar/Zarar rollup'larını ledger'dan yeniden hesapla.
+    Tarih verilmezse tüm ledger (YYYY-MM-DD).
+    """
+    db = get_db()
+    
+    stats = await rebuild_profit_loss_rollups(db, start_date, end_date)
+    await bump_report_sequence(db, "ledger")  # Önbellekteki kar/zarar sonuçları geçersiz
+    
+    return {
+        "success": True,
+        "message": f"{stats['entries']} ledger kaydından {stats['rollup_rows']} rollup satırı oluşturuldu",
+        **stats
+    }
+
+
+@router.get("/report-cache")
+async def get_report_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """Rapor cache'i: giriş sayısı, boyut, hit/miss sayaçları"""
+    return report_cache.stats()
+
+
+@router.post("/report-cache/clear")
+async def clear_report_cache(
+    report: str = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Rapor cache'ini (veya tek raporun girişlerini) temizle"""
+    report_cache.invalidate(report)
+    return {"success": True, **report_cache.stats()}
+
+
+@router.get("/report-jobs")
+async def get_report_job_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """Arka plan rapor kuyruğu: worker, bekleyen ve durum bazında iş sayıları"""
+    db = get_db()
+    by_status = await db.report_jobs.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    return {
+        **report_job_runner.stats(),
+        "jobs_by_status": {row["_id"]: row["count"] for row in by_status}
+    }
@@ -6,7 +6,7 @@ import logging
 
 from database import get_db
 from models.user import UserRegister, UserLogin, User
-from auth import hash_password, verify_password, create_access_token, get_current_user
+from auth import hash_password_async, verify_password_async, create_access_token, build_token_claims, get_current_user
 from utils.activity_logger import log_activity, Actions, EntityTypes
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -27,7 +27,7 @@ async def register(user_data: UserRegister):
     user_dict = {
         "id": str(uuid.uuid4()),
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await hash_password_async(user_data.password),
         "name": user_data.name,
         "role": user_data.role,
         "status": "ACTIVE",
@@ -37,7 +37,7 @@ async def register(user_data: UserRegister):
     await db.users.insert_one(user_dict)
     
     # Create token
-    token = create_access_token({"user_id": user_dict["id"]})
+    token = create_access_token(build_token_claims(user_dict))
     
     # Return user without password
     user_dict.pop("password")
@@ -71,7 +71,7 @@ async def login(credentials: UserLogin, request: Request):
         logger.warning(f"No password hash found for user: {credentials.username}")
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
-    password_valid = verify_password(credentials.password, stored_password)
+    password_valid = await verify_password_async(credentials.password, stored_password)
     logger.info(f"Password valid: {password_valid}")
     
     if not password_valid:
@@ -85,7 +85,7 @@ async def login(credentials: UserLogin, request: Request):
         raise HTTPException(status_code=403, detail="User account is inactive")
     
     # Create token
-    token = create_access_token({"user_id": user["id"]})
+    token = create_access_token(build_token_claims(user))
     logger.info(f"Login successful for user: {credentials.username}")
     
     # Log activity
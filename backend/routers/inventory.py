@@ -6,6 +6,7 @@ import logging
 from database import get_db
 from auth import get_current_user
 from models.user import User
+from lookup_cache import lookup_cache
 
 router = APIRouter(tags=["Inventory"])
 logger = logging.getLogger(__name__)
@@ -73,7 +74,7 @@ async def get_stock_lot_summary_endpoint(
         lot["supplier_name"] = parties.get(lot.get("supplier_party_id"), "Bilinmiyor")
     
     # Get product type info
-    product_type = await db.product_types.find_one({"id": product_type_id}, {"_id": 0})
+    product_type = await lookup_cache.get(db, "product_types", product_type_id)
     if product_type:
         summary["product_type_name"] = product_type.get("name")
         summary["track_type"] = product_type.get("track_type")
@@ -135,12 +136,12 @@ async def get_stock_pool_info(
     pool = await get_pool_info(db, product_type_id, karat_id)
     
     # Get product type name
-    product_type = await db.product_types.find_one({"id": product_type_id})
+    product_type = await lookup_cache.get(db, "product_types", product_type_id)
     if product_type:
         pool["product_type_name"] = product_type.get("name")
     
     # Get karat name
-    karat = await db.karats.find_one({"id": karat_id})
+    karat = await lookup_cache.get(db, "karats", karat_id)
     if karat:
         pool["karat_name"] = f"{karat.get('name', '')} ({karat.get('fineness', '')})"
         pool["fineness"] = karat.get("fineness", 0.916)
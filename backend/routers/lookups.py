@@ -1,11 +1,13 @@
 """Lookup routes - Karats, Currencies, Payment Methods, etc."""
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from datetime import datetime, timezone
 import logging
 
 from database import get_db
 from models.user import User
-from auth import get_current_user
+from auth import get_current_user, get_current_user_claims
+from market_websocket import get_market_data_cache
+from lookup_cache import lookup_cache
 
 router = APIRouter(tags=["Lookups"])
 logger = logging.getLogger(__name__)
@@ -71,17 +73,41 @@ LOOKUP_CONFIG = {
 }
 
 
+async def _cached_lookup(collection: str, request: Request, response: Response):
+    """
+    Lookup tablosunu cache'ten döndür
+
+    ETag = tablo içerik versiyonu; If-None-Match eşleşirse 304 (gövde yok).
+    Cache-Control: no-cache ile tarayıcı her seferinde ETag ile doğrular.
+    """
+    db = get_db()
+    items = await lookup_cache.table(db, collection)
+    etag = f'"{collection}-{await lookup_cache.version(db, collection)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return items
+
+
+@router.get("/lookups/versions")
+async def get_lookup_versions():
+    """Lookup tablolarının versiyon damgaları (değişmişse istemci yeniden çeker)"""
+    db = get_db()
+    return {
+        name: await lookup_cache.version(db, config["collection"])
+        for name, config in LOOKUP_CONFIG.items()
+    }
+
+
 @router.get("/lookups/{lookup_name}")
-async def get_lookup_items(lookup_name: str):
+async def get_lookup_items(lookup_name: str, request: Request, response: Response):
     """Get all items from a lookup table"""
-    db = get_db()
-    
     if lookup_name not in LOOKUP_CONFIG:
         raise HTTPException(status_code=404, detail=f"Lookup '{lookup_name}' not found")
     
     config = LOOKUP_CONFIG[lookup_name]
-    items = await db[config["collection"]].find({}, {"_id": 0}).to_list(1000)
-    return items
+    return await _cached_lookup(config["collection"], request, response)
 
 
 @router.post("/lookups/{lookup_name}", status_code=201)
@@ -127,6 +153,7 @@ async def create_lookup_item(lookup_name: str, item_data: dict, current_user: Us
     
     await collection.insert_one(item_data)
     item_data.pop("_id", None)
+    await lookup_cache.refresh(db, config["collection"])
     
     return item_data
 
@@ -161,6 +188,7 @@ async def update_lookup_item(lookup_name: str, item_id: int, item_data: dict, cu
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await collection.update_one({"id": item_id}, {"$set": update_data})
+    await lookup_cache.refresh(db, config["collection"])
     
     updated = await collection.find_one({"id": item_id}, {"_id": 0})
     return updated
@@ -195,16 +223,15 @@ async def delete_lookup_item(lookup_name: str, item_id: int, current_user: User
             )
     
     await collection.delete_one({"id": item_id})
+    await lookup_cache.refresh(db, config["collection"])
     return {"message": "Item deleted successfully"}
 
 
 # Legacy lookup routes (for backward compatibility)
 @router.get("/karats")
-async def get_karats_shortcut():
+async def get_karats_shortcut(request: Request, response: Response):
     """Get all karats (shortcut for /lookups/karats)"""
-    db = get_db()
-    karats = await db.karats.find({}, {"_id": 0}).to_list(100)
-    return karats
+    return await _cached_lookup("karats", request, response)
 
 
 @router.post("/karats", status_code=201)
@@ -226,6 +253,7 @@ async def create_karat(karat_data: dict, current_user: User = Depends(get_curren
     
     await db.karats.insert_one(karat_doc)
     karat_doc.pop("_id", None)
+    await lookup_cache.refresh(db, "karats")
     return karat_doc
 
 
@@ -245,6 +273,7 @@ async def update_karat(karat_id: int, karat_data: dict, current_user: User = Dep
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Karat not found")
+    await lookup_cache.refresh(db, "karats")
     
     updated = await db.karats.find_one({"id": karat_id}, {"_id": 0})
     return updated
@@ -258,60 +287,46 @@ async def delete_karat(karat_id: int, current_user: User = Depends(get_current_u
     result = await db.karats.delete_one({"id": karat_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Karat not found")
+    await lookup_cache.refresh(db, "karats")
     return {"message": "Karat deleted successfully"}
 
 
 @router.get("/lookups/asset-types")
-async def get_asset_types():
+async def get_asset_types(request: Request, response: Response):
     """Get all asset types"""
-    db = get_db()
-    asset_types = await db.asset_types.find({}, {"_id": 0}).to_list(100)
-    return asset_types
+    return await _cached_lookup("asset_types", request, response)
 
 
 @router.get("/lookups/transaction-directions")
-async def get_transaction_directions():
+async def get_transaction_directions(request: Request, response: Response):
     """Get all transaction directions"""
-    db = get_db()
-    directions = await db.transaction_directions.find({}, {"_id": 0}).to_list(100)
-    return directions
+    return await _cached_lookup("transaction_directions", request, response)
 
 
 # Financial V2 lookups
 @router.get("/financial-v2/lookups/transaction-types")
-async def get_transaction_types(current_user: User = Depends(get_current_user)):
+async def get_transaction_types(request: Request, response: Response, current_user: User = Depends(get_current_user_claims)):
     """Get all transaction types"""
-    db = get_db()
-    types = await db.transaction_types.find({}, {"_id": 0}).to_list(100)
-    return types
+    return await _cached_lookup("transaction_types", request, response)
 
 
 @router.get("/financial-v2/lookups/payment-methods")
-async def get_payment_methods(current_user: User = Depends(get_current_user)):
+async def get_payment_methods(request: Request, response: Response, current_user: User = Depends(get_current_user_claims)):
     """Get all payment methods"""
-    db = get_db()
-    methods = await db.payment_methods.find({}, {"_id": 0}).to_list(100)
-    return methods
+    return await _cached_lookup("payment_methods", request, response)
 
 
 @router.get("/financial-v2/lookups/currencies")
-async def get_currencies(current_user: User = Depends(get_current_user)):
+async def get_currencies(request: Request, response: Response, current_user: User = Depends(get_current_user_claims)):
     """Get all currencies"""
-    db = get_db()
-    currencies = await db.currencies.find({}, {"_id": 0}).to_list(100)
-    return currencies
+    return await _cached_lookup("currencies", request, response)
 
 
 @router.get("/market-data/latest")
-async def get_latest_market_data(current_user: User = Depends(get_current_user)):
-    """Get latest market data"""
-    db = get_db()
-    market_data = await db.market_data.find_one(
-        {},
-        {"_id": 0},
-        sort=[("timestamp", -1)]
-    )
-    if not market_data:
+async def get_latest_market_data(current_user: User = Depends(get_current_user_claims)):
+    """Get latest market data (in-memory cache, no DB hit)"""
+    market_data = get_market_data_cache()
+    if not market_data.get("timestamp"):
         return {
             "has_gold_buy": 0,
             "has_gold_sell": 0,
@@ -1,30 +1,35 @@
 """Market data routes - Price snapshots and related endpoints"""
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime
+from typing import Optional
 import logging
 
 from database import get_db
-from auth import get_current_user
+from auth import (
+    STREAM_TOKEN_TTL_SECONDS, create_stream_token, get_current_user, get_current_user_claims,
+    get_current_user_from_query
+)
 from models.user import User
+from market_websocket import get_tick_pipeline_stats, get_market_data_cache
+from market_stream import market_stream_hub, sse_market_stream
+from market_storage import get_bars
+from price_snapshot_service import price_snapshot_cache
 
 router = APIRouter(tags=["Market"])
 logger = logging.getLogger(__name__)
 
 
 @router.get("/price-snapshots/latest")
-async def get_latest_price_snapshot(current_user: User = Depends(get_current_user)):
-    """Get latest price snapshot"""
-    db = get_db()
-    
-    snapshot = await db.price_snapshots.find_one(
-        {},
-        {"_id": 0},
-        sort=[("as_of", -1)]
-    )
+async def get_latest_price_snapshot(current_user: User = Depends(get_current_user_claims)):
+    """Get latest price snapshot (in-memory cache, no DB hit)"""
+    snapshot = price_snapshot_cache.latest()
     
     if not snapshot:
         raise HTTPException(status_code=404, detail="No price snapshot found")
     
+    snapshot.pop("_id", None)
+    
     # Convert datetime
     if isinstance(snapshot.get("as_of"), datetime):
         snapshot["as_of"] = snapshot["as_of"].isoformat()
@@ -35,17 +40,60 @@ async def get_latest_price_snapshot(current_user: User = Depends(get_current_use
 
 
 @router.get("/market-data/latest")
-async def get_latest_market_data(current_user: User = Depends(get_current_user)):
+async def get_latest_market_data(current_user: User = Depends(get_current_user_claims)):
     """Get latest market data from cache"""
-    db = get_db()
+    market = get_market_data_cache()
     
-    market = await db.market_data.find_one(
-        {},
-        {"_id": 0},
-        sort=[("timestamp", -1)]
-    )
-    
-    if not market:
+    if not market.get("timestamp"):
         raise HTTPException(status_code=404, detail="No market data found")
     
     return market
+
+
+@router.post("/market-data/stream-token")
+async def get_market_stream_token(current_user: User = Depends(get_current_user_claims)):
+    """Short-lived token for /market-data/stream (only checked when the stream opens)"""
+    return {"token": create_stream_token(current_user.id), "expires_in": STREAM_TOKEN_TTL_SECONDS}
+
+
+@router.get("/market-data/stream")
+async def stream_market_data(request: Request, current_user: User = Depends(get_current_user_from_query)):
+    """
+    Server-sent events: market cache updates pushed as they arrive
+    Auth via ?token=<stream token> (EventSource cannot set headers)
+    """
+    return StreamingResponse(
+        sse_market_stream(request, initial=get_market_data_cache()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/market-data/history")
+async def get_market_history(
+    resolution: str = Query("1h", pattern="^(1m|1h|1d)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    current_user: User = Depends(get_current_user_claims)
+):
+    """OHLC bars (1m / 1h / 1d) from compact market_bars buckets"""
+    db = get_db()
+    
+    bars = await get_bars(db, resolution, start, end, limit)
+    for bar in bars:
+        for key in ("bucket_start", "created_at", "updated_at"):
+            if isinstance(bar.get(key), datetime):
+                bar[key] = bar[key].isoformat()
+    
+    return {"resolution": resolution, "count": len(bars), "bars": bars}
+
+
+@router.get("/market-data/pipeline-stats")
+async def get_market_pipeline_stats(current_user: User = Depends(get_current_user)):
+    """Market tick pipeline and price snapshot cache counters"""
+    return {
+        "tick_pipeline": get_tick_pipeline_stats(),
+        "price_snapshot_cache": price_snapshot_cache.stats(),
+        "stream_hub": market_stream_hub.stats()
+    }
@@ -9,6 +9,11 @@ from database import get_db
 from models.user import User
 from models.party import PartyCreate, PartyUpdate, Party, PartyBalance, generate_party_code
 from auth import get_current_user
+from services.party_balance_service import party_balance_from_doc
+from services.party_lookup_service import (
+    resolve_party_balances, BALANCE_SOURCE_MATERIALIZED, BALANCE_SOURCE_LEDGER
+)
+from utils.pagination import InvalidCursorError, page_count, paginate
 
 router = APIRouter(prefix="/parties", tags=["Parties"])
 financial_v2_router = APIRouter(prefix="/financial-v2", tags=["Financial V2"])
@@ -19,48 +24,18 @@ async def calculate_party_balance(party_id: str) -> PartyBalance:
     """
     Calculate balance for a party.
     
-    HAS balance artık parties.has_balance alanından okunur (tek kaynak!).
-    USD/EUR balance hala transaction'lardan hesaplanır.
+    HAS ve USD/EUR bakiyeleri parties dokümanındaki materialized alanlardan
+    okunur (has_balance, currency_balances). Transaction taraması yapılmaz;
+    tutarsızlık şüphesinde /admin/fix-party-balances veya
+    reconcile_party_balances.py ile ledger'dan yeniden oluşturulur.
     """
     db = get_db()
     
-    # HAS balance'ı doğrudan party'den al (tek doğru kaynak)
-    party = await db.parties.find_one({"id": party_id})
-    total_has_balance = party.get("has_balance", 0) if party else 0
-    
-    # USD/EUR balance için transaction'lardan hesapla
-    total_usd_balance = 0.0
-    total_eur_balance = 0.0
-    
-    financial_txns = await db.financial_transactions.find({
-        "party_id": party_id,
-        "status": {"$ne": "CANCELLED"}
-    }).to_list(10000)
-    
-    for txn in financial_txns:
-        type_code = txn.get("type_code", "")
-        currency = txn.get("currency", "TRY")
-        amount_currency = abs(txn.get("total_amount_currency", 0) or 0)
-        
-        if currency == "USD" and amount_currency > 0:
-            if type_code == "RECEIPT":
-                total_usd_balance += amount_currency
-            elif type_code == "PAYMENT":
-                total_usd_balance -= amount_currency
-        
-        if currency == "EUR" and amount_currency > 0:
-            if type_code == "RECEIPT":
-                total_eur_balance += amount_currency
-            elif type_code == "PAYMENT":
-                total_eur_balance -= amount_currency
-    
-    return PartyBalance(
-        party_id=party_id, 
-        has_gold_balance=round(total_has_balance, 6),
-        try_balance=0.0,
-        usd_balance=round(total_usd_balance, 2),
-        eur_balance=round(total_eur_balance, 2)
+    party = await db.parties.find_one(
+        {"id": party_id},
+        {"_id": 0, "id": 1, "has_balance": 1, "currency_balances": 1}
     )
+    return party_balance_from_doc(party, party_id)
 
 
 @router.post("", response_model=Party, status_code=201)
@@ -96,6 +71,7 @@ async def create_party(party_data: PartyCreate, current_user: User = Depends(get
         **party_data.model_dump(),
         "is_active": True,
         "has_balance": 0.0,
+        "currency_balances": {"USD": 0.0, "EUR": 0.0},
         "created_at": now,
         "updated_at": now
     }
@@ -115,9 +91,12 @@ async def get_parties(
     page_size: int = Query(10, ge=1, le=100),
     sort_by: str = Query("created_at"),
     sort_order: str = Query("desc"),
+    balance_source: str = Query(BALANCE_SOURCE_MATERIALIZED, pattern="^(materialized|ledger)$"),
+    cursor: Optional[str] = Query(None, description="Önceki yanıttaki next_cursor (page yerine)"),
+    include_total: Optional[bool] = Query(None, description="Toplam kayıt sayısı (varsayılan: sadece page ile)"),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all parties with optional filters, pagination, and calculated balances"""
+    """Get all parties with optional filters, pagination (page or cursor), and calculated balances"""
     db = get_db()
     query = {}
     
@@ -139,20 +118,26 @@ async def get_parties(
             {"company_name": {"$regex": search, "$options": "i"}}
         ]
     
-    total_items = await db.parties.count_documents(query)
-    total_pages = (total_items + page_size - 1) // page_size
-    
     sort_dir = -1 if sort_order == "desc" else 1
-    skip = (page - 1) * page_size
-    parties = await db.parties.find(query, {"_id": 0}).sort(sort_by, sort_dir).skip(skip).limit(page_size).to_list(page_size)
+    sort = [(sort_by, sort_dir)] + ([("id", sort_dir)] if sort_by != "id" else [])
+    try:
+        parties, page_info = await paginate(
+            db.parties, query, sort, page=page, per_page=page_size,
+            cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Bakiyeler party dokümanında materialized - ek sorgu yok.
+    # balance_source=ledger: sayfadaki tüm party'ler tek $group ile hesaplanır
+    if balance_source == BALANCE_SOURCE_LEDGER:
+        balances = await resolve_party_balances(db, [p["id"] for p in parties], source=BALANCE_SOURCE_LEDGER)
+    else:
+        balances = {p["id"]: party_balance_from_doc(p) for p in parties}
     
     result = []
     for party in parties:
-        balance = await calculate_party_balance(party["id"])
-        if hasattr(balance, 'model_dump'):
-            party["balance"] = balance.model_dump()
-        else:
-            party["balance"] = balance
+        party["balance"] = balances[party["id"]].model_dump()
         result.append(party)
     
     return {
@@ -160,8 +145,10 @@ async def get_parties(
         "pagination": {
             "page": page,
             "page_size": page_size,
-            "total_items": total_items,
-            "total_pages": total_pages
+            "total_items": page_info["total"],
+            "total_pages": page_count(page_info["total"], page_size),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -175,11 +162,7 @@ async def get_party(party_id: str, current_user: User = Depends(get_current_user
     if not party:
         raise HTTPException(status_code=404, detail="Party not found")
     
-    balance = await calculate_party_balance(party_id)
-    if hasattr(balance, 'model_dump'):
-        party["balance"] = balance.model_dump()
-    else:
-        party["balance"] = balance
+    party["balance"] = party_balance_from_doc(party, party_id).model_dump()
     
     return party
 
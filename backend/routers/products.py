@@ -11,9 +11,12 @@ from database import get_db
 from models.user import User
 from models.product import ProductCreate, ProductUpdate, Product, ImageUpload
 from auth import get_current_user
+from lookup_cache import lookup_cache
+from report_cache import bump_report_sequence, report_cache, report_cache_key
+from utils.pagination import InvalidCursorError, page_count, paginate
 
 # Import ledger for adjustments
-from init_unified_ledger import create_ledger_entry, create_adjustment_entry
+from init_unified_ledger import create_ledger_entry, create_adjustment_entry, write_ledger_entry
 
 router = APIRouter(prefix="/products", tags=["Products"])
 logger = logging.getLogger(__name__)
@@ -77,7 +80,7 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
         logger.info(f"Creating product: {product_data.model_dump()}")
         
         # Verify product_type_id
-        product_type = await db.product_types.find_one({"id": product_data.product_type_id})
+        product_type = await lookup_cache.get(db, "product_types", product_data.product_type_id)
         if not product_type:
             raise HTTPException(status_code=400, detail="Invalid product_type_id")
         
@@ -89,7 +92,7 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
                 raise HTTPException(status_code=400, detail="AltÃ„Â±n ÃƒÂ¼rÃƒÂ¼nler iÃƒÂ§in ayar ve gram aÃ„Å¸Ã„Â±rlÃ„Â±k zorunludur")
             
             # Get karat info
-            karat = await db.karats.find_one({"id": product_data.karat_id})
+            karat = await lookup_cache.get(db, "karats", product_data.karat_id)
             if not karat:
                 raise HTTPException(status_code=400, detail="Invalid karat_id")
             fineness = karat["fineness"]
@@ -101,7 +104,7 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
         
         # Validate labor type
         if product_data.labor_type_id:
-            labor_type = await db.labor_types.find_one({"id": product_data.labor_type_id})
+            labor_type = await lookup_cache.get(db, "labor_types", product_data.labor_type_id)
             if not labor_type:
                 raise HTTPException(status_code=400, detail="Invalid labor_type_id")
             
@@ -168,6 +171,7 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
         
         await db.products.insert_one(product_dict)
         product_dict.pop("_id", None)
+        await bump_report_sequence(db, "products")
         
         # ==================== TEDARÃ„Â°KÃƒâ€¡Ã„Â° BORÃƒâ€¡ Ã„Â°Ã…ÂLEMÃ„Â° ====================
         # TedarikÃƒÂ§i seÃƒÂ§ildiyse, tedarikÃƒÂ§inin bakiyesini gÃƒÂ¼ncelle (BORÃƒâ€¡ oluÃ…Å¸tur)
@@ -197,7 +201,8 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
                 "created_at": now,
                 "created_by": current_user.id if hasattr(current_user, 'id') else current_user.get("id", "system")
             }
-            await db.unified_ledger.insert_one(ledger_entry)
+            # Buffer, rollup, checkpoint invalidation ve rapor sayacı create_ledger_entry ile aynı yol
+            await write_ledger_entry(ledger_entry)
             
             logger.info(f"Ã¢Å“â€¦ Supplier {product_data.supplier_party_id} balance updated: +{costs['total_cost_has']} HAS (product entry)")
         
@@ -220,9 +225,11 @@ async def get_products(
     product_type_id: Optional[int] = None,
     stock_status_id: Optional[int] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Önceki yanıttaki next_cursor (page yerine)"),
+    include_total: Optional[bool] = Query(None, description="Toplam kayıt sayısı (varsayılan: sadece page ile)"),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all products with optional filters and pagination"""
+    """Get all products with optional filters and pagination (page or cursor)"""
     db = get_db()
     query = {}
     
@@ -236,24 +243,24 @@ async def get_products(
             {"barcode": {"$regex": search, "$options": "i"}}
         ]
     
-    # Toplam kayÃ„Â±t sayÃ„Â±sÃ„Â±
-    total = await db.products.count_documents(query)
-    total_pages = (total + per_page - 1) // per_page if per_page > 0 else 1
-    
-    # Sayfalama ve sÃ„Â±ralama - EN SON GÃ„Â°RÃ„Â°LEN EN ÃƒÅ“STTE
-    skip = (page - 1) * per_page
-    products = await db.products.find(query, {"_id": 0}).sort([
-        ("created_at", -1),
-        ("id", -1)
-    ]).skip(skip).limit(per_page).to_list(per_page)
+    # EN SON GİRİLEN EN ÜSTTE - cursor varsa keyset, toplam sayı cache'li
+    try:
+        products, page_info = await paginate(
+            db.products, query, [("created_at", -1), ("id", -1)],
+            page=page, per_page=per_page, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "products": products,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": total_pages
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -310,7 +317,7 @@ async def update_product(
         update_data = {}
         
         # Get product type for is_gold_based
-        product_type = await db.product_types.find_one({"id": product["product_type_id"]})
+        product_type = await lookup_cache.get(db, "product_types", product["product_type_id"])
         is_gold_based = product_type["is_gold_based"]
         
         # Update editable fields
@@ -328,7 +335,7 @@ async def update_product(
         
         if product_data.karat_id is not None:
             update_data["karat_id"] = product_data.karat_id
-            karat = await db.karats.find_one({"id": product_data.karat_id})
+            karat = await lookup_cache.get(db, "karats", product_data.karat_id)
             if karat:
                 update_data["fineness"] = karat["fineness"]
             cost_changed = True
@@ -364,7 +371,7 @@ async def update_product(
             merged_data = {**product, **update_data}
             karat = None
             if merged_data.get("karat_id"):
-                karat = await db.karats.find_one({"id": merged_data["karat_id"]})
+                karat = await lookup_cache.get(db, "karats", merged_data["karat_id"])
             
             costs = calculate_product_costs(merged_data, product_type, karat)
             update_data.update(costs)
@@ -379,6 +386,7 @@ async def update_product(
         {"id": product_id},
         {"$set": update_data}
     )
+    await bump_report_sequence(db, "products")
     
     updated_product = await db.products.find_one({"id": product_id}, {"_id": 0})
     
@@ -451,6 +459,7 @@ async def delete_product(product_id: str, current_user: User = Depends(get_curre
     
     # Delete product
     await db.products.delete_one({"id": product_id})
+    await bump_report_sequence(db, "products")
     
     return {"message": "ÃƒÅ“rÃƒÂ¼n baÃ…Å¸arÃ„Â±yla silindi"}
 
@@ -548,12 +557,21 @@ async def get_stock_summary(
     """Get stock summary by product type"""
     db = get_db()
     
+    # Rapor cache: ürün/ledger sayaçları ve lookup versiyonları değişene kadar
+    cache_key = await report_cache_key(db, "stock-summary", {
+        "product_types": await lookup_cache.version(db, "product_types"),
+        "karats": await lookup_cache.version(db, "karats")
+    }, sequences=("ledger", "products"))
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     # Get all product types
-    product_types = await db.product_types.find({}, {"_id": 0}).to_list(100)
+    product_types = await lookup_cache.table(db, "product_types")
     product_type_map = {pt["id"]: pt for pt in product_types}
     
     # Get all karats
-    karats = await db.karats.find({}, {"_id": 0}).to_list(100)
+    karats = await lookup_cache.table(db, "karats")
     karat_map = {k["id"]: k for k in karats}
     
     # Get all IN_STOCK products
@@ -611,7 +629,9 @@ async def get_stock_summary(
         "total_sale_has": round(sum(s["total_sale_has"] for s in type_summary.values()), 6)
     }
     
-    return {
+    result = {
         "by_type": list(type_summary.values()),
         "grand_total": grand_total
     }
+    report_cache.put(cache_key, result)
+    return result
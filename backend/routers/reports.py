@@ -1,16 +1,38 @@
 """Reports routes - Profit/Loss, Account Statements, Gold Movements"""
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from typing import Optional
 from datetime import datetime
+import gzip
 import logging
 
 from database import get_db
 from models.user import User
+from models.report import ReportJobCreate
 from auth import get_current_user
+from market_storage import get_price_at
+from price_snapshot_service import find_latest_price_snapshot
+from ledger_checkpoints import ledger_totals
+from profit_loss_rollups import (
+    EXPENSE_CATEGORIES, PROFIT_LOSS_TYPES, REVENUE_CATEGORIES,
+    classify_profit_loss, get_profit_loss_totals
+)
+from utils.pagination import InvalidCursorError, apply_cursor, cursor_from_doc, page_count, paginate
+from utils.export import EXPORT_BATCH_SIZE, export_response
+from utils.report_categories import REPORT_CATEGORIES, category_expression
+from report_cache import report_cache, report_cache_key
+from report_jobs import available_reports, create_report_job, job_status, register_report
 
 router = APIRouter(prefix="/reports", tags=["Reports"])
 logger = logging.getLogger(__name__)
 
+# Altın hareketleri raporunun ayar etiketleri (karat_id -> "24K" ...)
+# Lookup'taki karats kayıtları farklı id sırası ve int karat değeri taşıyabilir;
+# rapor filtresi ve etiketleri bu sabit eşlemeye bağlı
+LEGACY_KARAT_LABELS = {1: "24K", 2: "22K", 3: "18K", 4: "14K", 5: "8K"}
+
+# Kar/Zarar detay sıralaması (id tekil)
+DETAIL_SORT = [("transaction_date", 1), ("id", 1)]
+
 
 @router.get("/profit-loss")
 async def get_profit_loss_report(
@@ -19,7 +41,8 @@ async def get_profit_loss_report(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Kar/Zarar Raporu - Unified Ledger'dan hesaplanır
+    Kar/Zarar Raporu - Unified Ledger'ın günlük rollup'larından hesaplanır
+    (profit_loss_daily). Satır detayları: GET /reports/profit-loss/details
     
     MANTIK:
     - ALIŞ = Stok girişi (gider DEĞİL!)
@@ -47,274 +70,136 @@ async def get_profit_loss_report(
     except ValueError:
         raise HTTPException(status_code=422, detail="Geçersiz tarih formatı. Format: YYYY-MM-DD")
     
-    # Unified Ledger'dan verileri çek
-    query = {
-        "transaction_date": {"$gte": start_date, "$lte": end_date + "T23:59:59"}
-    }
-    
-    ledger_entries = await db.unified_ledger.find(query, {"_id": 0}).to_list(length=None)
-    
-    # Başlangıç değerleri - GELİRLER
-    revenues = {
-        "sales": {"tl": 0, "has": 0, "count": 0},           # Satış gelirleri
-        "receipts": {"tl": 0, "has": 0, "count": 0},        # Tahsilatlar
-        "purchase_profit": {"tl": 0, "has": 0, "count": 0}, # Alıştan kar (eksik ödeme)
-        "payment_discount": {"tl": 0, "has": 0, "count": 0}, # Ödeme iskontoları
-        "exchange_profit": {"tl": 0, "has": 0, "count": 0}, # Döviz karları
-        "total": {"tl": 0, "has": 0, "count": 0}
-    }
-    
-    # GİDERLER - ALIŞ artık GİDER DEĞİL!
-    expenses = {
-        "cogs": {"tl": 0, "has": 0, "count": 0},            # Satılan Ürünlerin Maliyeti (Cost of Goods Sold)
-        "operating_expenses": {"tl": 0, "has": 0, "count": 0}, # İşletme Giderleri
-        "salaries": {"tl": 0, "has": 0, "count": 0},        # Maaşlar
-        "purchase_loss": {"tl": 0, "has": 0, "count": 0},   # Alıştan zarar (fazla ödeme)
-        "exchange_loss": {"tl": 0, "has": 0, "count": 0},   # Döviz zararları
-        "total": {"tl": 0, "has": 0, "count": 0}
-    }
-    
-    # Stok bilgisi (bilgi amaçlı)
-    stock_info = {
-        "purchases": {"tl": 0, "has": 0, "count": 0},  # Dönem içi alışlar
-        "sales_has": 0  # Dönem içi satılan HAS
-    }
-    
-    details = []
-    
-    for entry in ledger_entries:
-        entry_type = entry.get("type", "")
-        
-        amount_in = entry.get("amount_in", 0) or 0
-        amount_out = entry.get("amount_out", 0) or 0
-        has_in = entry.get("has_in", 0) or 0
-        has_out = entry.get("has_out", 0) or 0
-        cost_has = entry.get("cost_has", 0) or 0
-        cost_tl = entry.get("cost_tl", 0) or 0
-        profit_has = entry.get("profit_has", 0) or 0
-        profit_tl = entry.get("profit_tl", 0) or 0
-        
-        detail_entry = {
-            "id": entry.get("id"),
-            "date": (entry.get("transaction_date") or "")[:10],
-            "type": entry_type,
-            "description": entry.get("description", ""),
-            "revenue_tl": 0,
-            "revenue_has": 0,
-            "expense_tl": 0,
-            "expense_has": 0,
-            "profit_tl": 0,
-            "profit_has": 0
-        }
-        
-        # SATIŞLAR (GELİR + MALİYET)
-        if entry_type == "SALE":
-            # Satış geliri = amount_in (tahsilat)
-            revenues["sales"]["tl"] += amount_in
-            revenues["sales"]["has"] += profit_has  # Net kar HAS
-            revenues["sales"]["count"] += 1
-            detail_entry["revenue_tl"] = amount_in
-            detail_entry["revenue_has"] = profit_has
-            detail_entry["profit_tl"] = profit_tl
-            detail_entry["profit_has"] = profit_has
-            
-            # Satılan ürünün maliyeti (COGS) - artık cost_tl var!
-            if cost_has > 0 or cost_tl > 0:
-                expenses["cogs"]["has"] += cost_has
-                expenses["cogs"]["tl"] += cost_tl
-                expenses["cogs"]["count"] += 1
-            
-            stock_info["sales_has"] += has_out
-        
-        # TAHSİLATLAR - Party tipine göre ayır
-        elif entry_type == "RECEIPT":
-            party_type = entry.get("party_type", "")
-            receipt_tl = amount_in or 0
-            receipt_has = has_in or 0
-            
-            # Tedarikçiden tahsilat = Bilanço hareketi, Kar/Zarar'a yansımaz
-            if party_type == "SUPPLIER":
-                continue  # Detay listesine ekleme
-            else:
-                # Müşteriden tahsilat = GELİR
-                revenues["receipts"]["tl"] += receipt_tl
-                revenues["receipts"]["has"] += receipt_has
-                revenues["receipts"]["count"] += 1
-                detail_entry["revenue_tl"] = receipt_tl
-                detail_entry["revenue_has"] = receipt_has
-                detail_entry["profit_tl"] = receipt_tl
-                detail_entry["profit_has"] = receipt_has
-        
-        # ÖDEMELER - İskonto varsa KAR olarak kaydet
-        elif entry_type == "PAYMENT":
-            # PAYMENT normalde bilanço hareketi, Kar/Zarar'a yansımaz
-            # AMA iskonto varsa bu bir KAR
-            payment_profit_has = entry.get("profit_has", 0) or 0
-            payment_profit_tl = entry.get("profit_tl", 0) or 0
-            
-            if payment_profit_has > 0.001 or payment_profit_tl > 0.01:
-                revenues["payment_discount"]["tl"] += payment_profit_tl
-                revenues["payment_discount"]["has"] += payment_profit_has
-                revenues["payment_discount"]["count"] += 1
-                detail_entry["revenue_tl"] = payment_profit_tl
-                detail_entry["revenue_has"] = payment_profit_has
-                detail_entry["profit_tl"] = payment_profit_tl
-                detail_entry["profit_has"] = payment_profit_has
-            else:
-                # İskonto yok, normal borç kapatma - Kar/Zarar'a yansımaz
-                continue
-        
-        # ALIŞ KARI (GELİR)
-        elif entry_type in ["PURCHASE_PROFIT", "PURCHASE_PROFIT_LOSS"]:
-            profit_amount = entry.get("profit_amount", 0) or amount_in or 0
-            profit_has_val = profit_has or has_in or 0
-            if profit_amount > 0 or profit_has_val > 0:
-                revenues["purchase_profit"]["tl"] += profit_amount
-                revenues["purchase_profit"]["has"] += profit_has_val
-                revenues["purchase_profit"]["count"] += 1
-                detail_entry["revenue_tl"] = profit_amount
-                detail_entry["revenue_has"] = profit_has_val
-                detail_entry["profit_tl"] = profit_amount
-                detail_entry["profit_has"] = profit_has_val
+    # Sonuç rapor cache'inde (ledger sayacı değişene kadar); fiyat bağımlı
+    # HAS karşılığı her istekte güncel fiyatla hesaplanır
+    cache_key = await report_cache_key(db, "profit-loss", {"start_date": start_date, "end_date": end_date})
+    report = report_cache.get(cache_key)
+    if report is None:
+        # Günlük rollup'lardan kategori toplamları (profit_loss_rollups)
+        totals = await get_profit_loss_totals(db, start_date, end_date)
         
-        # ALIŞLAR - STOK GİRİŞİ (GİDER DEĞİL!)
-        elif entry_type == "PURCHASE":
-            # Sadece stok bilgisi olarak tut
-            stock_info["purchases"]["tl"] += amount_out
-            stock_info["purchases"]["has"] += has_in
-            stock_info["purchases"]["count"] += 1
-            # Bu detail'e eklenmez çünkü kar/zarar etkisi yok
-            continue  # Detay listesine ekleme
+        def bucket(category):
+            return totals.get(category) or {"tl": 0, "has": 0, "count": 0}
         
-        # İŞLETME GİDERLERİ (GİDER)
-        elif entry_type == "EXPENSE":
-            expenses["operating_expenses"]["tl"] += amount_out
-            expenses["operating_expenses"]["count"] += 1
-            detail_entry["expense_tl"] = amount_out
-            detail_entry["profit_tl"] = -amount_out  # Gider = negatif kar
+        # GELİRLER
+        revenues = {category: bucket(category) for category in REVENUE_CATEGORIES}
+        revenues["total"] = {"tl": 0, "has": 0, "count": 0}
         
-        # MAAŞLAR (GİDER) - SADECE ÖDEME, TAHAKKUK DEĞİL!
-        elif entry_type == "SALARY_PAYMENT":
-            expenses["salaries"]["tl"] += amount_out
-            expenses["salaries"]["count"] += 1
-            detail_entry["expense_tl"] = amount_out
-            detail_entry["profit_tl"] = -amount_out  # Gider = negatif kar
+        # GİDERLER - ALIŞ artık GİDER DEĞİL!
+        expenses = {category: bucket(category) for category in EXPENSE_CATEGORIES}
+        expenses["total"] = {"tl": 0, "has": 0, "count": 0}
         
-        # MAAŞ TAHAKKUKU - Kar/Zarar'a YANSIMAZ (borç kaydı)
-        elif entry_type == "SALARY_ACCRUAL":
-            # Tahakkuk bir borç kaydıdır, gider değildir
-            # Sadece personele borç oluşur, kasa hareketi yok
-            detail_entry["expense_tl"] = 0  # Gider değil
-            detail_entry["profit_tl"] = 0   # Kar/Zarar'a yansımaz
+        # Stok bilgisi (bilgi amaçlı)
+        stock_info = {
+            "purchases": bucket("purchases"),  # Dönem içi alışlar
+            "sales_has": bucket("sales_has")["has"]  # Dönem içi satılan HAS
+        }
         
-        # ALIŞ ZARARI (GİDER)
-        elif entry_type == "PURCHASE_LOSS":
-            loss_amount = entry.get("loss_amount", 0) or amount_out or 0
-            loss_has = entry.get("loss_has", 0) or has_out or 0
-            expenses["purchase_loss"]["tl"] += loss_amount
-            expenses["purchase_loss"]["has"] += loss_has
-            expenses["purchase_loss"]["count"] += 1
-            detail_entry["expense_tl"] = loss_amount
-            detail_entry["expense_has"] = loss_has
-            detail_entry["profit_tl"] = -loss_amount
-            detail_entry["profit_has"] = -loss_has
+        # Toplamları hesapla
+        revenues["total"]["tl"] = sum(v["tl"] for k, v in revenues.items() if k != "total")
+        revenues["total"]["has"] = sum(v["has"] for k, v in revenues.items() if k != "total")
+        revenues["total"]["count"] = sum(v["count"] for k, v in revenues.items() if k != "total")
         
-        # DÖVİZ İŞLEMLERİ (Kar veya Zarar) - artık profit_tl var!
-        elif entry_type == "EXCHANGE":
-            exchange_profit_tl = profit_tl  # Yeni alan
-            exchange_profit_has = profit_has or entry.get("has_net", 0) or 0
-            
-            if exchange_profit_has > 0:
-                revenues["exchange_profit"]["has"] += exchange_profit_has
-                revenues["exchange_profit"]["tl"] += exchange_profit_tl if exchange_profit_tl > 0 else 0
-                revenues["exchange_profit"]["count"] += 1
-                detail_entry["revenue_has"] = exchange_profit_has
-                detail_entry["revenue_tl"] = exchange_profit_tl
-                detail_entry["profit_tl"] = exchange_profit_tl
-                detail_entry["profit_has"] = exchange_profit_has
-            elif exchange_profit_has < 0:
-                expenses["exchange_loss"]["has"] += abs(exchange_profit_has)
-                expenses["exchange_loss"]["tl"] += abs(exchange_profit_tl) if exchange_profit_tl < 0 else 0
-                expenses["exchange_loss"]["count"] += 1
-                detail_entry["expense_has"] = abs(exchange_profit_has)
-                detail_entry["expense_tl"] = abs(exchange_profit_tl)
-                detail_entry["profit_tl"] = exchange_profit_tl  # negatif
-                detail_entry["profit_has"] = exchange_profit_has  # negatif
+        expenses["total"]["tl"] = sum(v["tl"] for k, v in expenses.items() if k != "total")
+        expenses["total"]["has"] = sum(v["has"] for k, v in expenses.items() if k != "total")
+        expenses["total"]["count"] = sum(v["count"] for k, v in expenses.items() if k != "total")
         
-        # VOID kayıtları (iptal)
-        elif entry_type == "VOID":
-            adjustment_reason = entry.get("adjustment_reason", "") or ""
-            original_type = entry.get("reference_type", "") or ""
-            
-            if "SALE" in adjustment_reason.upper() or "SALE" in original_type.upper():
-                revenues["sales"]["tl"] -= amount_out
-                revenues["sales"]["has"] -= has_in
-                detail_entry["revenue_tl"] = -amount_out
-                detail_entry["revenue_has"] = -has_in
+        # Net kar/zarar TL
+        net_profit_tl = revenues["total"]["tl"] - expenses["total"]["tl"]
         
-        # Detay listesine ekle (sadece kar/zarar etkisi olanlar)
-        if detail_entry["revenue_tl"] != 0 or detail_entry["revenue_has"] != 0 or detail_entry["expense_tl"] != 0 or detail_entry["expense_has"] != 0:
-            details.append(detail_entry)
-    
-    # Toplamları hesapla
-    revenues["total"]["tl"] = sum(v["tl"] for k, v in revenues.items() if k != "total")
-    revenues["total"]["has"] = sum(v["has"] for k, v in revenues.items() if k != "total")
-    revenues["total"]["count"] = sum(v["count"] for k, v in revenues.items() if k != "total")
-    
-    expenses["total"]["tl"] = sum(v["tl"] for k, v in expenses.items() if k != "total")
-    expenses["total"]["has"] = sum(v["has"] for k, v in expenses.items() if k != "total")
-    expenses["total"]["count"] = sum(v["count"] for k, v in expenses.items() if k != "total")
-    
-    # Net kar/zarar TL
-    net_profit_tl = revenues["total"]["tl"] - expenses["total"]["tl"]
+        report = {
+            "period": {
+                "start_date": start_date,
+                "end_date": end_date
+            },
+            "summary": {
+                "total_revenue_tl": round(revenues["total"]["tl"], 2),
+                "total_revenue_has": round(revenues["total"]["has"], 6),
+                "total_expense_tl": round(expenses["total"]["tl"], 2),
+                "total_expense_has": round(expenses["total"]["has"], 6),
+                "net_profit_tl": round(net_profit_tl, 2)
+            },
+            "revenues": revenues,
+            "expenses": expenses,
+            "stock_info": stock_info  # Bilgi amaçlı stok verisi
+        }
+        report_cache.put(cache_key, report)
     
     # Net kar/zarar HAS = Kar TL / HAS Satış Fiyatı
-    # Güncel HAS satış fiyatını al
-    price_snapshot = await db.price_snapshots.find_one(
-        {}, sort=[("captured_at", -1)]
-    )
-    has_sell_price = price_snapshot.get("has_sell_tl", 6000) if price_snapshot else 6000
+    # Güncel HAS satış fiyatını al: son OHLC bar close, yoksa son snapshot
+    has_sell_price = await get_price_at(db, "has_gold_sell")
+    if not has_sell_price:
+        price_snapshot = await find_latest_price_snapshot(db)
+        has_sell_price = price_snapshot.get("has_sell_tl", 6000) if price_snapshot else 6000
     
     # Net kar'ın HAS karşılığını hesapla
+    net_profit_tl = report["summary"]["net_profit_tl"]
     if has_sell_price and has_sell_price > 0:
         net_profit_has = net_profit_tl / has_sell_price
     else:
         net_profit_has = 0
     
     return {
-        "period": {
-            "start_date": start_date,
-            "end_date": end_date
-        },
-        "summary": {
-            "total_revenue_tl": round(revenues["total"]["tl"], 2),
-            "total_revenue_has": round(revenues["total"]["has"], 6),
-            "total_expense_tl": round(expenses["total"]["tl"], 2),
-            "total_expense_has": round(expenses["total"]["has"], 6),
-            "net_profit_tl": round(net_profit_tl, 2),
-            "net_profit_has": round(net_profit_has, 6)
-        },
-        "revenues": revenues,
-        "expenses": expenses,
-        "stock_info": stock_info,  # Bilgi amaçlı stok verisi
-        "details": details
+        **report,
+        "summary": {**report["summary"], "net_profit_has": round(net_profit_has, 6)}
     }
 
 
-@router.get("/unified-ledger")
-async def get_unified_ledger(
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    type: Optional[str] = None,
-    party_id: Optional[str] = None,
-    party_type: Optional[str] = None,
-    cash_register_id: Optional[str] = None,
-    page: int = 1,
-    per_page: int = 50,
+@router.get("/profit-loss/details")
+async def get_profit_loss_details(
+    start_date: str = Query(..., description="Başlangıç tarihi (YYYY-MM-DD)"),
+    end_date: str = Query(..., description="Bitiş tarihi (YYYY-MM-DD)"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
     current_user: User = Depends(get_current_user)
 ):
-    """Get unified ledger entries with filters"""
+    """
+    Kar/Zarar detay satırları - cursor pagination
+
+    Sadece kar/zarar etkisi olan kayıtlar (özetle aynı sınıflandırma),
+    transaction_date, id sırasıyla.
+    """
     db = get_db()
+    
+    try:
+        datetime.strptime(start_date, "%Y-%m-%d")
+        datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Geçersiz tarih formatı. Format: YYYY-MM-DD")
+    
+    query = {
+        "transaction_date": {"$gte": start_date, "$lte": end_date + "T23:59:59"},
+        "type": {"$in": PROFIT_LOSS_TYPES}
+    }
+    try:
+        query = apply_cursor(query, DETAIL_SORT, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Etkisiz kayıtlar (tedarikçi tahsilatı, iskontosuz ödeme) atlanır;
+    # cursor son döndürülen kayıttan devam eder
+    details = []
+    last_entry = None
+    has_more = False
+    async for entry in db.unified_ledger.find(query, {"_id": 0}).sort(DETAIL_SORT):
+        _, detail = classify_profit_loss(entry)
+        if detail is None:
+            continue
+        if len(details) == limit:
+            has_more = True
+            break
+        details.append(detail)
+        last_entry = entry
+    
+    return {
+        "details": details,
+        "has_more": has_more,
+        "next_cursor": cursor_from_doc(last_entry, DETAIL_SORT) if has_more else None
+    }
+
+
+def _ledger_query(start_date, end_date, type, party_id, party_type, cash_register_id) -> dict:
+    """Ledger liste ve export filtreleri"""
     query = {}
     
     if start_date:
@@ -332,58 +217,132 @@ async def get_unified_ledger(
         query["party_type"] = party_type
     if cash_register_id:
         query["cash_register_id"] = cash_register_id
+    return query
+
+
+# Liste ve export sıralaması (index: transaction_date, created_at, id)
+LEDGER_LIST_SORT = [("transaction_date", -1), ("created_at", -1), ("id", -1)]
+
+LEDGER_EXPORT_COLUMNS = [
+    ("Tarih", "transaction_date"),
+    ("Tip", "type"),
+    ("Açıklama", "description"),
+    ("Cari", "party_name"),
+    ("Cari Tipi", "party_type"),
+    ("HAS Giriş", "has_in"),
+    ("HAS Çıkış", "has_out"),
+    ("Para Birimi", "currency"),
+    ("Tutar Giriş", "amount_in"),
+    ("Tutar Çıkış", "amount_out"),
+    ("Maliyet HAS", "cost_has"),
+    ("Kar HAS", "profit_has"),
+    ("Kar TL", "profit_tl"),
+    ("Kasa", "cash_register_name"),
+    ("Ürün", "product_name"),
+    ("Gram", "weight_gram"),
+    ("Referans Tipi", "reference_type"),
+    ("Referans", "reference_id"),
+    ("Kayıt ID", "id"),
+]
+
+
+@router.get("/unified-ledger")
+async def get_unified_ledger(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    type: Optional[str] = None,
+    party_id: Optional[str] = None,
+    party_type: Optional[str] = None,
+    cash_register_id: Optional[str] = None,
+    page: int = 1,
+    per_page: int = 50,
+    cursor: Optional[str] = Query(None, description="Önceki yanıttaki next_cursor (page yerine)"),
+    include_total: Optional[bool] = Query(None, description="Toplam kayıt sayısı (varsayılan: sadece page ile)"),
+    current_user: User = Depends(get_current_user)
+):
+    """Get unified ledger entries with filters (page or cursor pagination)"""
+    db = get_db()
+    query = _ledger_query(start_date, end_date, type, party_id, party_type, cash_register_id)
     
-    total = await db.unified_ledger.count_documents(query)
-    
-    entries = await db.unified_ledger.find(query, {"_id": 0}).sort([
-        ("transaction_date", -1),
-        ("created_at", -1)
-    ]).skip((page - 1) * per_page).limit(per_page).to_list(per_page)
+    try:
+        entries, page_info = await paginate(
+            db.unified_ledger, query, LEDGER_LIST_SORT, page=page, per_page=per_page,
+            cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "entries": entries,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": (total + per_page - 1) // per_page if total > 0 else 1
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page, minimum=1),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
 
+@router.get("/unified-ledger/export")
+async def export_unified_ledger(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    type: Optional[str] = None,
+    party_id: Optional[str] = None,
+    party_type: Optional[str] = None,
+    cash_register_id: Optional[str] = None,
+    format: str = Query("csv", description="csv veya xlsx"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ledger'ı liste ile aynı filtrelerle CSV/XLSX olarak indir
+
+    Satırlar cursor'dan parça parça yazılır (sabit bellek), sayfalama yok.
+    """
+    db = get_db()
+    query = _ledger_query(start_date, end_date, type, party_id, party_type, cash_register_id)
+    projection = {"_id": 0, **{field: 1 for _, field in LEDGER_EXPORT_COLUMNS}}
+    cursor = db.unified_ledger.find(query, projection).sort(LEDGER_LIST_SORT).batch_size(EXPORT_BATCH_SIZE)
+    filename = f"ledger-{start_date or 'baslangic'}-{end_date or datetime.now().strftime('%Y-%m-%d')}"
+    return export_response(cursor, LEDGER_EXPORT_COLUMNS, format, filename)
+
+
 @router.get("/unified-ledger/summary")
 async def get_ledger_summary(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get summary by type"""
+    """
+    Get summary by type
+
+    Kapalı aylar ledger_checkpoints'ten, kalan günler ledger'dan toplanır.
+    """
     db = get_db()
-    match_query = {}
-    if start_date:
-        match_query["transaction_date"] = {"$gte": start_date}
-    if end_date:
-        if "transaction_date" in match_query:
-            match_query["transaction_date"]["$lte"] = end_date
-        else:
-            match_query["transaction_date"] = {"$lte": end_date}
+    cache_key = await report_cache_key(db, "ledger-summary", {"start_date": start_date, "end_date": end_date})
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    pipeline = [
-        {"$match": match_query} if match_query else {"$match": {}},
-        {"$group": {
-            "_id": "$type",
-            "count": {"$sum": 1},
-            "total_has_in": {"$sum": "$has_in"},
-            "total_has_out": {"$sum": "$has_out"},
-            "total_amount_in": {"$sum": "$amount_in"},
-            "total_amount_out": {"$sum": "$amount_out"},
-            "total_profit": {"$sum": {"$ifNull": ["$profit_has", 0]}},
-            "total_cost": {"$sum": {"$ifNull": ["$cost_has", 0]}}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
+    by_type = await ledger_totals(
+        db, "type", since=start_date, until=end_date, until_inclusive=True
+    )
     
-    results = await db.unified_ledger.aggregate(pipeline).to_list(100)
+    results = [
+        {
+            "_id": entry_type,
+            "count": totals["count"],
+            "total_has_in": totals["has_in"],
+            "total_has_out": totals["has_out"],
+            "total_amount_in": totals["amount_in"],
+            "total_amount_out": totals["amount_out"],
+            "total_profit": totals["profit_has"],
+            "total_cost": totals["cost_has"]
+        }
+        for entry_type, totals in sorted(by_type.items())
+    ]
     
     # Calculate totals
     totals = {
@@ -396,12 +355,14 @@ async def get_ledger_summary(
         "entry_count": sum(r["count"] for r in results)
     }
     
-    return {
+    result = {
         "by_type": results,
         "totals": totals,
         "start_date": start_date,
         "end_date": end_date
     }
+    report_cache.put(cache_key, result)
+    return result
 
 
 @router.get("/gold-movements")
@@ -414,7 +375,8 @@ async def get_gold_movements_report(
 ):
     """
     Altın Hareketleri Raporu - Giriş/Çıkış Hareketleri
-    Ürün tipi ve ayar bazında gruplar.
+    Ürün tipi kategorisi (line.report_category) ve ayar bazında gruplar;
+    gruplama tek $unwind/$group aggregation ile DB'de yapılır.
     """
     db = get_db()
     
@@ -425,187 +387,147 @@ async def get_gold_movements_report(
     except ValueError:
         raise HTTPException(status_code=422, detail="Geçersiz tarih formatı. Format: YYYY-MM-DD")
     
-    # Karat mapping
-    karat_map = {1: "24K", 2: "22K", 3: "18K", 4: "14K", 5: "8K"}
-    
-    # Financial transactions'dan verileri çek (lines dahil)
-    ft_query = {
-        "transaction_date": {
-            "$gte": datetime.fromisoformat(start_date),
-            "$lte": datetime.fromisoformat(end_date + "T23:59:59")
-        }
-    }
-    financial_txs = await db.financial_transactions.find(ft_query).to_list(length=None)
+    cache_key = await report_cache_key(db, "gold-movements", {
+        "start_date": start_date, "end_date": end_date,
+        "product_type": product_type, "karat": karat
+    })
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    karat_map = LEGACY_KARAT_LABELS
+    
+    line_filter = {}
+    if karat and karat != "all":
+        karat_ids = [kid for kid, label in karat_map.items() if label == karat]
+        if karat == "Bilinmeyen":
+            line_filter["lines.karat_id"] = {"$nin": list(karat_map)}
+        else:
+            line_filter["lines.karat_id"] = {"$in": karat_ids}
+    if product_type and product_type != "all":
+        line_filter["category"] = next(
+            (c for c in REPORT_CATEGORIES if c.lower() == product_type.lower()), product_type
+        )
+    
+    def first_truthy(*fields):
+        """Python'daki `a or b or 0` karşılığı"""
+        expr = 0
+        for field in reversed(fields):
+            expr = {"$cond": [{"$and": [field]}, field, expr]}
+        return expr
+    
+    # Satır bazında tek aggregation: sadece gerekli alanlar okunur,
+    # gruplama (işlem tipi, kategori, ayar) DB'de - bellek kullanımı grup sayısı kadar
+    pipeline = [
+        {"$match": {
+            "transaction_date": {
+                "$gte": datetime.fromisoformat(start_date),
+                "$lte": datetime.fromisoformat(end_date + "T23:59:59")
+            },
+            "type_code": {"$in": ["SALE", "PURCHASE", "PAYMENT"]}
+        }},
+        {"$project": {
+            "_id": 0,
+            "type_code": 1,
+            "total_amount_currency": 1,
+            "is_credit_sale": {"$ifNull": ["$meta.is_credit_sale", False]},
+            "line_count": {"$size": {"$ifNull": ["$lines", []]}},
+            "lines.report_category": 1,
+            "lines.product_type_code": 1,
+            "lines.note": 1,
+            "lines.karat_id": 1,
+            "lines.line_total_has": 1,
+            "lines.line_amount_currency": 1,
+            "lines.quantity": 1,
+            "lines.weight_gram": 1,
+            "lines.meta.sale_quantity": 1,
+            "lines.meta.purchase_quantity": 1
+        }},
+        {"$unwind": "$lines"},
+        # Hurda ödeme: sadece HAS çıkışı olan satırlar
+        {"$match": {"$or": [{"type_code": {"$ne": "PAYMENT"}}, {"lines.line_total_has": {"$gt": 0}}]}},
+        {"$addFields": {"category": category_expression("$lines")}},
+    ]
+    if line_filter:
+        pipeline.append({"$match": line_filter})
+    
+    line_share = {"$cond": [
+        {"$gt": ["$line_count", 0]},
+        {"$divide": [{"$ifNull": ["$total_amount_currency", 0]}, "$line_count"]},
+        0
+    ]}
+    pipeline.append({"$group": {
+        "_id": {"type": "$type_code", "category": "$category", "karat_id": "$lines.karat_id"},
+        "total_gram": {"$sum": {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$type_code", "SALE"]},
+                 "then": first_truthy("$lines.meta.sale_quantity", "$lines.quantity")},
+                {"case": {"$eq": ["$type_code", "PURCHASE"]},
+                 "then": first_truthy("$lines.meta.purchase_quantity", "$lines.quantity", "$lines.weight_gram")},
+            ],
+            "default": first_truthy("$lines.weight_gram")
+        }}},
+        "total_has": {"$sum": {"$ifNull": ["$lines.line_total_has", 0]}},
+        # SALE: peşin satışta tutar satırlara eşit bölünür, veresiyede satır tutarı
+        # PURCHASE: ödenen tutar satırlara eşit bölünür
+        "cash_amount": {"$sum": {"$cond": [{"$eq": ["$is_credit_sale", True]}, 0, line_share]}},
+        "paid_amount": {"$sum": line_share},
+        "credit_amount": {"$sum": {"$cond": [
+            {"$eq": ["$is_credit_sale", True]}, {"$ifNull": ["$lines.line_amount_currency", 0]}, 0
+        ]}},
+        "transaction_count": {"$sum": 1}
+    }})
+    
+    groups = await db.financial_transactions.aggregate(pipeline, allowDiskUse=True).to_list(None)
     
     # Sonuç yapıları
     sales = {"items": {}, "totals": {"gram": 0, "has": 0, "cash": 0, "credit": 0, "count": 0}}
     purchases = {"items": {}, "totals": {"gram": 0, "has": 0, "paid": 0, "debt": 0, "count": 0}}
     scrap_payments = {"items": {}, "totals": {"gram": 0, "has": 0, "tl_value": 0, "count": 0}}
     
-    def get_product_type_from_note(note: str) -> str:
-        """Note alanından ürün tipini belirle"""
-        note_lower = note.lower() if note else ""
-        if "hurda" in note_lower:
-            return "Hurda"
-        elif "gram altın" in note_lower or "gram altin" in note_lower:
-            return "Gram Altın"
-        elif "çeyrek" in note_lower or "ceyrek" in note_lower:
-            return "Çeyrek"
-        elif "yarım" in note_lower or "yarim" in note_lower:
-            return "Yarım"
-        elif "tam" in note_lower or "cumhuriyet" in note_lower:
-            return "Tam Altın"
-        elif "bilezik" in note_lower:
-            return "Bilezik"
-        elif "kolye" in note_lower:
-            return "Kolye"
-        elif "yüzük" in note_lower or "yuzuk" in note_lower:
-            return "Yüzük"
-        elif "küpe" in note_lower or "kupe" in note_lower:
-            return "Küpe"
-        return "Diğer"
-    
-    for tx in financial_txs:
-        tx_type = tx.get("type_code", "")
-        lines = tx.get("lines", [])
-        amount_in = tx.get("total_amount_currency", 0) or 0
+    for group in groups:
+        tx_type = group["_id"]["type"]
+        product_type_name = group["_id"]["category"]
+        karat_value = karat_map.get(group["_id"].get("karat_id"), "Bilinmeyen")
+        group_key = f"{product_type_name}|{karat_value}"
+        gram, has, count = group["total_gram"], group["total_has"], group["transaction_count"]
         
         # SATIŞ İŞLEMLERİ
         if tx_type == "SALE":
-            for line in lines:
-                # Ürün bilgilerini al
-                note = line.get("note", "") or ""
-                karat_id = line.get("karat_id")
-                line_total_has = line.get("line_total_has", 0) or 0
-                
-                # SATILAN GRAM MİKTARI
-                meta = line.get("meta", {})
-                sold_gram = meta.get("sale_quantity") or line.get("quantity", 0) or 0
-                
-                # Ayar
-                karat_value = karat_map.get(karat_id, "Bilinmeyen")
-                
-                # Ürün tipi
-                product_type_name = get_product_type_from_note(note)
-                
-                # Filtre uygula
-                if product_type and product_type != "all" and product_type_name.lower() != product_type.lower():
-                    continue
-                if karat and karat != "all" and karat_value != karat:
-                    continue
-                
-                group_key = f"{product_type_name}|{karat_value}"
-                
-                # Peşin vs Veresiye
-                meta = tx.get("meta", {})
-                is_credit_sale = meta.get("is_credit_sale", False)
-                line_cash = amount_in / len(lines) if not is_credit_sale and len(lines) > 0 else 0
-                line_credit = (line.get("line_amount_currency", 0) or 0) if is_credit_sale else 0
-                
-                if group_key not in sales["items"]:
-                    sales["items"][group_key] = {
-                        "product_type": product_type_name,
-                        "karat": karat_value,
-                        "total_gram": 0,
-                        "total_has": 0,
-                        "cash_amount": 0,
-                        "credit_amount": 0,
-                        "transaction_count": 0
-                    }
-                
-                sales["items"][group_key]["total_gram"] += sold_gram
-                sales["items"][group_key]["total_has"] += line_total_has
-                sales["items"][group_key]["cash_amount"] += line_cash
-                sales["items"][group_key]["credit_amount"] += line_credit
-                sales["items"][group_key]["transaction_count"] += 1
-                
-                sales["totals"]["gram"] += sold_gram
-                sales["totals"]["has"] += line_total_has
-                sales["totals"]["cash"] += line_cash
-                sales["totals"]["credit"] += line_credit
-                sales["totals"]["count"] += 1
+            item = sales["items"].setdefault(group_key, {
+                "product_type": product_type_name, "karat": karat_value, "total_gram": 0, "total_has": 0,
+                "cash_amount": 0, "credit_amount": 0, "transaction_count": 0
+            })
+            item["cash_amount"] += group["cash_amount"]
+            item["credit_amount"] += group["credit_amount"]
+            sales["totals"]["cash"] += group["cash_amount"]
+            sales["totals"]["credit"] += group["credit_amount"]
+            target = sales
         
         # ALIŞ İŞLEMLERİ
         elif tx_type == "PURCHASE":
-            for line in lines:
-                note = line.get("note", "") or ""
-                karat_id = line.get("karat_id")
-                line_total_has = line.get("line_total_has", 0) or 0
-                
-                # ALINAN GRAM MİKTARI
-                meta = line.get("meta", {})
-                purchased_gram = meta.get("purchase_quantity") or line.get("quantity", 0) or line.get("weight_gram", 0) or 0
-                
-                karat_value = karat_map.get(karat_id, "Bilinmeyen")
-                product_type_name = get_product_type_from_note(note)
-                
-                if product_type and product_type != "all" and product_type_name.lower() != product_type.lower():
-                    continue
-                if karat and karat != "all" and karat_value != karat:
-                    continue
-                
-                group_key = f"{product_type_name}|{karat_value}"
-                
-                amount_out = tx.get("total_amount_currency", 0) or 0
-                line_paid = amount_out / len(lines) if len(lines) > 0 else 0
-                
-                if group_key not in purchases["items"]:
-                    purchases["items"][group_key] = {
-                        "product_type": product_type_name,
-                        "karat": karat_value,
-                        "total_gram": 0,
-                        "total_has": 0,
-                        "paid_amount": 0,
-                        "debt_amount": 0,
-                        "transaction_count": 0
-                    }
-                
-                purchases["items"][group_key]["total_gram"] += purchased_gram
-                purchases["items"][group_key]["total_has"] += line_total_has
-                purchases["items"][group_key]["paid_amount"] += line_paid
-                purchases["items"][group_key]["transaction_count"] += 1
-                
-                purchases["totals"]["gram"] += purchased_gram
-                purchases["totals"]["has"] += line_total_has
-                purchases["totals"]["paid"] += line_paid
-                purchases["totals"]["count"] += 1
+            item = purchases["items"].setdefault(group_key, {
+                "product_type": product_type_name, "karat": karat_value, "total_gram": 0, "total_has": 0,
+                "paid_amount": 0, "debt_amount": 0, "transaction_count": 0
+            })
+            item["paid_amount"] += group["paid_amount"]
+            purchases["totals"]["paid"] += group["paid_amount"]
+            target = purchases
         
         # HURDA ÖDEME (PAYMENT with has_out)
-        elif tx_type == "PAYMENT":
-            for line in lines:
-                has_out = line.get("line_total_has", 0) or 0
-                if has_out > 0:
-                    note = line.get("note", "") or ""
-                    karat_id = line.get("karat_id")
-                    weight_gram = line.get("weight_gram", 0) or 0
-                    
-                    karat_value = karat_map.get(karat_id, "Bilinmeyen")
-                    product_type_name = get_product_type_from_note(note)
-                    
-                    if product_type and product_type != "all" and product_type_name.lower() != product_type.lower():
-                        continue
-                    if karat and karat != "all" and karat_value != karat:
-                        continue
-                    
-                    group_key = f"{product_type_name}|{karat_value}"
-                    
-                    if group_key not in scrap_payments["items"]:
-                        scrap_payments["items"][group_key] = {
-                            "product_type": product_type_name,
-                            "karat": karat_value,
-                            "total_gram": 0,
-                            "total_has": 0,
-                            "tl_value": 0,
-                            "transaction_count": 0
-                        }
-                    
-                    scrap_payments["items"][group_key]["total_gram"] += weight_gram
-                    scrap_payments["items"][group_key]["total_has"] += has_out
-                    scrap_payments["items"][group_key]["transaction_count"] += 1
-                    
-                    scrap_payments["totals"]["gram"] += weight_gram
-                    scrap_payments["totals"]["has"] += has_out
-                    scrap_payments["totals"]["count"] += 1
+        else:
+            item = scrap_payments["items"].setdefault(group_key, {
+                "product_type": product_type_name, "karat": karat_value, "total_gram": 0, "total_has": 0,
+                "tl_value": 0, "transaction_count": 0
+            })
+            target = scrap_payments
+        
+        item["total_gram"] += gram
+        item["total_has"] += has
+        item["transaction_count"] += count
+        target["totals"]["gram"] += gram
+        target["totals"]["has"] += has
+        target["totals"]["count"] += count
     
     # Dict'leri list'e çevir ve sırala
     sales["items"] = sorted(list(sales["items"].values()), key=lambda x: (x["product_type"], x["karat"]))
@@ -618,7 +540,7 @@ async def get_gold_movements_report(
     total_in_gram = purchases["totals"]["gram"]
     total_in_has = purchases["totals"]["has"]
     
-    return {
+    result = {
         "period": {
             "start_date": start_date,
             "end_date": end_date
@@ -635,4 +557,118 @@ async def get_gold_movements_report(
             "net_has": round(total_in_has - total_out_has, 6)
         }
     }
+    report_cache.put(cache_key, result)
+    return result
+
+
+
+# ==================== REPORT JOBS ====================
+
+def _profit_loss_csv(result: dict):
+    rows = []
+    for section, buckets in (("GELİR", result["revenues"]), ("GİDER", result["expenses"])):
+        for category, bucket in buckets.items():
+            rows.append([section, category, round(bucket["tl"], 2), round(bucket["has"], 6), bucket["count"]])
+    return ["section", "category", "tl", "has", "count"], rows
+
+
+def _ledger_summary_csv(result: dict):
+    rows = [
+        [r["_id"], r["count"], r["total_has_in"], r["total_has_out"], r["total_amount_in"],
+         r["total_amount_out"], r["total_profit"], r["total_cost"]]
+        for r in result["by_type"]
+    ]
+    return ["type", "count", "has_in", "has_out", "amount_in", "amount_out", "profit_has", "cost_has"], rows
+
+
+def _gold_movements_csv(result: dict):
+    rows = []
+    for section in ("sales", "purchases", "scrap_payments"):
+        for item in result[section]["items"]:
+            amount = item.get("cash_amount", item.get("paid_amount", item.get("tl_value", 0)))
+            rows.append([
+                section, item["product_type"], item["karat"], round(item["total_gram"], 2),
+                round(item["total_has"], 6), round(amount or 0, 2), round(item.get("credit_amount", 0) or 0, 2),
+                item["transaction_count"]
+            ])
+    return ["section", "product_type", "karat", "gram", "has", "amount", "credit_amount", "count"], rows
+
+
+register_report("profit-loss", get_profit_loss_report, _profit_loss_csv)
+register_report("ledger-summary", get_ledger_summary, _ledger_summary_csv)
+register_report("gold-movements", get_gold_movements_report, _gold_movements_csv)
+
+
+async def _get_job(db, job_id: str, current_user: User, with_result: bool = False) -> dict:
+    projection = {"_id": 0} if with_result else {"_id": 0, "result": 0}
+    job = await db.report_jobs.find_one({"id": job_id}, projection)
+    if not job:
+        raise HTTPException(status_code=404, detail="Rapor işi bulunamadı")
+    if job.get("created_by") != current_user.id and current_user.role not in ["ADMIN", "SUPER_ADMIN"]:
+        raise HTTPException(status_code=403, detail="Bu rapor işine erişim yetkiniz yok")
+    return job
+
+
+@router.get("/jobs")
+async def list_report_jobs(
+    current_user: User = Depends(get_current_user)
+):
+    """Arka planda çalıştırılabilen raporlar ve kullanıcının son işleri"""
+    db = get_db()
+    jobs = await db.report_jobs.find(
+        {"created_by": current_user.id}, {"_id": 0, "result": 0}
+    ).sort("created_at", -1).limit(20).to_list(20)
+    return {
+        "reports": available_reports(),
+        "jobs": [job_status(job) for job in jobs]
+    }
+
+
+@router.post("/jobs", status_code=202)
+async def create_report_job_endpoint(
+    data: ReportJobCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Raporu arka planda hesapla - hemen job id döner.
+    Durum: GET /reports/jobs/{id}, sonuç: GET /reports/jobs/{id}/result
+    """
+    db = get_db()
+    job = await create_report_job(db, data.report, data.params, data.format, current_user)
+    return job_status(job)
+
+
+@router.get("/jobs/{job_id}")
+async def get_report_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """İş durumu ve ilerleme (tamamlandıysa result_url)"""
+    db = get_db()
+    return job_status(await _get_job(db, job_id, current_user))
 
+
+@router.get("/jobs/{job_id}/result")
+async def get_report_job_result(
+    job_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Saklanan sonuç (JSON veya CSV). İstemci gzip kabul ediyorsa sıkıştırılmış
+    haliyle (Content-Encoding: gzip), etmiyorsa açılarak gönderilir.
+    """
+    db = get_db()
+    job = await _get_job(db, job_id, current_user, with_result=True)
+    status = job_status(job)["status"]
+    if status != "done":
+        raise HTTPException(status_code=409, detail=f"Rapor henüz hazır değil ({status})")
+    
+    payload = bytes(job["result"])
+    filename = f"{job['report']}-{job_id[:8]}.{job['format']}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        payload = gzip.decompress(payload)
+    return Response(content=payload, media_type=job["content_type"], headers=headers)
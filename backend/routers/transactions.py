@@ -25,8 +25,13 @@ from services import (
 )
 
 # Import ledger and cash services
-from init_unified_ledger import create_void_entry, create_adjustment_entry
+from init_unified_ledger import create_void_entry, create_adjustment_entry, ledger_unit_of_work
 from cash_management import create_cash_movement_internal
+from services.party_balance_service import apply_party_balance_delta, currency_balance_delta
+from services.party_lookup_service import resolve_party_display_names
+from report_cache import bump_report_sequence
+from utils.export import EXPORT_BATCH_SIZE, export_response
+from utils.pagination import InvalidCursorError, page_count, paginate
 
 router = APIRouter(prefix="/financial-transactions", tags=["Financial Transactions"])
 logger = logging.getLogger(__name__)
@@ -45,20 +50,22 @@ async def create_financial_transaction(
         user_id = current_user["id"] if isinstance(current_user, dict) else str(current_user.id)
         
         # Route to appropriate handler
-        if type_code == "PURCHASE":
-            result = await create_purchase_transaction(data, user_id, db)
-        elif type_code == "SALE":
-            result = await create_sale_transaction(data, user_id, db)
-        elif type_code == "PAYMENT":
-            result = await create_payment_transaction(data, user_id, db)
-        elif type_code == "RECEIPT":
-            result = await create_receipt_transaction(data, user_id, db)
-        elif type_code == "EXCHANGE":
-            result = await create_exchange_transaction(data, user_id, db)
-        elif type_code == "HURDA":
-            result = await create_hurda_transaction(data, user_id, db)
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported transaction type: {type_code}")
+        # Ledger kayıtları (ana kayıt + kar/zarar) işlem sonunda tek insert_many ile yazılır
+        async with ledger_unit_of_work():
+            if type_code == "PURCHASE":
+                result = await create_purchase_transaction(data, user_id, db)
+            elif type_code == "SALE":
+                result = await create_sale_transaction(data, user_id, db)
+            elif type_code == "PAYMENT":
+                result = await create_payment_transaction(data, user_id, db)
+            elif type_code == "RECEIPT":
+                result = await create_receipt_transaction(data, user_id, db)
+            elif type_code == "EXCHANGE":
+                result = await create_exchange_transaction(data, user_id, db)
+            elif type_code == "HURDA":
+                result = await create_hurda_transaction(data, user_id, db)
+            else:
+                raise HTTPException(status_code=400, detail=f"Unsupported transaction type: {type_code}")
         
         return result
     
@@ -71,22 +78,8 @@ async def create_financial_transaction(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("")
-async def get_financial_transactions(
-    party_id: Optional[str] = None,
-    type_code: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    status: Optional[str] = None,
-    page: int = Query(1, ge=1, description="Sayfa numarası"),
-    page_size: int = Query(10, ge=1, le=100, description="Sayfa başına kayıt"),
-    sort_by: str = Query("transaction_date", description="Sıralama alanı"),
-    sort_order: str = Query("desc", description="Sıralama yönü (asc/desc)"),
-    current_user: User = Depends(get_current_user)
-):
-    """Get financial transactions with filters and pagination"""
-    db = get_db()
-    
+def _transaction_query(party_id, type_code, start_date, end_date, status) -> dict:
+    """İşlem liste ve export filtreleri"""
     query = {}
     
     if party_id:
@@ -101,35 +94,70 @@ async def get_financial_transactions(
             query["transaction_date"]["$gte"] = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
         if end_date:
             query["transaction_date"]["$lte"] = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+    return query
+
+
+def _transaction_sort(sort_by: str, sort_order: str) -> list:
+    """İstenen sıralama + code (tekil) - keyset cursor için"""
+    sort_direction = -1 if sort_order == "desc" else 1
+    sort = [(sort_by, sort_direction)]
+    if sort_by != "code":
+        sort.append(("code", sort_direction))
+    return sort
+
+
+def _lines_weight(tx: dict) -> float:
+    return round(sum(line.get("weight_gram") or 0 for line in tx.get("lines") or []), 4)
+
+
+TRANSACTION_EXPORT_COLUMNS = [
+    ("İşlem Kodu", "code"),
+    ("Tarih", "transaction_date"),
+    ("Tip", "type_code"),
+    ("Durum", "status"),
+    ("Cari", "party_name"),
+    ("HAS Tutar", "total_has_amount"),
+    ("Para Birimi", "currency"),
+    ("Tutar", "total_amount_currency"),
+    ("Satır Sayısı", lambda tx: len(tx.get("lines") or [])),
+    ("Toplam Gram", _lines_weight),
+    ("Not", "notes"),
+    ("Oluşturma", "created_at"),
+]
+
+
+@router.get("")
+async def get_financial_transactions(
+    party_id: Optional[str] = None,
+    type_code: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    page: int = Query(1, ge=1, description="Sayfa numarası"),
+    page_size: int = Query(10, ge=1, le=100, description="Sayfa başına kayıt"),
+    sort_by: str = Query("transaction_date", description="Sıralama alanı"),
+    sort_order: str = Query("desc", description="Sıralama yönü (asc/desc)"),
+    cursor: Optional[str] = Query(None, description="Önceki yanıttaki next_cursor (page yerine)"),
+    include_total: Optional[bool] = Query(None, description="Toplam kayıt sayısı (varsayılan: sadece page ile)"),
+    current_user: User = Depends(get_current_user)
+):
+    """Get financial transactions with filters and pagination (page or cursor)"""
+    db = get_db()
     
-    # Toplam kayıt sayısı
-    total_items = await db.financial_transactions.count_documents(query)
-    total_pages = (total_items + page_size - 1) // page_size
+    query = _transaction_query(party_id, type_code, start_date, end_date, status)
     
-    # Sıralama yönü
-    sort_direction = -1 if sort_order == "desc" else 1
+    # Sayfa: cursor varsa keyset, yoksa page; toplam sayı cache'li (utils.pagination)
+    try:
+        transactions, page_info = await paginate(
+            db.financial_transactions, query, _transaction_sort(sort_by, sort_order),
+            page=page, per_page=page_size, cursor=cursor, include_total=include_total,
+            projection={"_id": 0, "price_snapshot_id": 0}
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    # Sayfalama ile veri çek
-    skip = (page - 1) * page_size
-    transactions = await db.financial_transactions.find(
-        query,
-        {"_id": 0, "price_snapshot_id": 0}
-    ).sort(sort_by, sort_direction).skip(skip).limit(page_size).to_list(page_size)
-    
-    # Collect unique party_ids to fetch party names
-    party_ids = set(tx.get("party_id") for tx in transactions if tx.get("party_id"))
-    party_names = {}
-    if party_ids:
-        parties = await db.parties.find(
-            {"id": {"$in": list(party_ids)}}, 
-            {"_id": 0, "id": 1, "name": 1, "first_name": 1, "last_name": 1, "company_name": 1, "party_type_id": 1}
-        ).to_list(100)
-        for p in parties:
-            if p.get("party_type_id") == 1:  # Customer
-                display_name = f"{p.get('first_name', '')} {p.get('last_name', '')}".strip() or p.get("name")
-            else:  # Supplier or other
-                display_name = p.get("company_name") or p.get("name")
-            party_names[p["id"]] = display_name
+    # Sayfadaki tüm party adlarını tek sorguda çöz
+    party_names = await resolve_party_display_names(db, (tx.get("party_id") for tx in transactions))
     
     # Product type code to Turkish name mapping
     product_type_names = {
@@ -213,12 +241,52 @@ async def get_financial_transactions(
         "pagination": {
             "page": page,
             "page_size": page_size,
-            "total_items": total_items,
-            "total_pages": total_pages
+            "total_items": page_info["total"],
+            "total_pages": page_count(page_info["total"], page_size),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
 
+@router.get("/export")
+async def export_financial_transactions(
+    party_id: Optional[str] = None,
+    type_code: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    sort_by: str = Query("transaction_date", description="Sıralama alanı"),
+    sort_order: str = Query("desc", description="Sıralama yönü (asc/desc)"),
+    format: str = Query("csv", description="csv veya xlsx"),
+    current_user: User = Depends(get_current_user)
+):
+    """İşlemleri liste ile aynı filtrelerle CSV/XLSX olarak indir (akış halinde)"""
+    db = get_db()
+    query = _transaction_query(party_id, type_code, start_date, end_date, status)
+    
+    projection = {
+        "_id": 0, "code": 1, "transaction_date": 1, "type_code": 1, "status": 1,
+        "party_id": 1, "party_name": 1, "total_has_amount": 1, "currency": 1,
+        "total_amount_currency": 1, "notes": 1, "created_at": 1, "lines.weight_gram": 1
+    }
+    cursor = db.financial_transactions.find(query, projection).sort(
+        _transaction_sort(sort_by, sort_order)
+    ).batch_size(EXPORT_BATCH_SIZE)
+    
+    async def add_party_names(batch):
+        # Her parça için party adları tek sorguda
+        missing = [tx.get("party_id") for tx in batch if not tx.get("party_name") and tx.get("party_id")]
+        if missing:
+            party_names = await resolve_party_display_names(db, missing)
+            for tx in batch:
+                if not tx.get("party_name") and tx.get("party_id"):
+                    tx["party_name"] = party_names.get(tx["party_id"])
+    
+    filename = f"islemler-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M')}"
+    return export_response(cursor, TRANSACTION_EXPORT_COLUMNS, format, filename, on_batch=add_party_names)
+
+
 @router.get("/{code}")
 async def get_financial_transaction(
     code: str,
@@ -298,15 +366,16 @@ async def cancel_financial_transaction(
     except Exception as e:
         logger.error(f"Failed to create transaction VOID: {e}")
     
-    # 4. Reverse party balance
-    if party_id and total_has_amount != 0:
+    # 4. Reverse party balance (HAS + döviz)
+    currency = trx.get("currency")
+    currency_reversal = -currency_balance_delta(trx_type, currency, trx.get("total_amount_currency"))
+    if party_id and (total_has_amount != 0 or currency_reversal != 0):
         balance_reversal = -total_has_amount
-        await db.parties.update_one(
-            {"id": party_id},
-            {
-                "$inc": {"has_balance": balance_reversal},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-            }
+        await apply_party_balance_delta(
+            db, party_id,
+            has_delta=balance_reversal,
+            currency=currency,
+            amount_delta=currency_reversal
         )
         logger.info(f"Party {party_id} balance reversed: {balance_reversal}")
     
@@ -360,6 +429,10 @@ async def cancel_financial_transaction(
                     await db.products.delete_one({"id": product_id})
                     logger.info(f"Product {product_id} deleted (PURCHASE cancel)")
     
+    # Stok özeti cache'i (ürün değişiklikleri ledger yazımından sonra)
+    if trx_type in ("SALE", "PURCHASE"):
+        await bump_report_sequence(db, "products")
+    
     # 8. Mark transaction as cancelled
     await db.financial_transactions.update_one(
         {"code": trx_code},
@@ -491,13 +564,7 @@ async def edit_financial_transaction(
         
         if party_id:
             balance_diff = -discount_diff
-            await db.parties.update_one(
-                {"id": party_id},
-                {
-                    "$inc": {"has_balance": balance_diff},
-                    "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-                }
-            )
+            await apply_party_balance_delta(db, party_id, has_delta=balance_diff)
             logger.info(f"Party {party_id} balance adjusted by {balance_diff}")
     
     # 7. No changes? Return early
@@ -6,57 +6,121 @@ import logging
 from database import get_db
 from auth import get_current_user
 from models.user import User
+from init_unified_ledger import get_ledger_write_stats
+from ledger_checkpoints import ledger_totals
+from utils.pagination import (
+    InvalidCursorError, apply_cursor, cursor_from_doc, decode_cursor, keyset_filter, page_count, paginate
+)
 
 router = APIRouter(prefix="/unified-ledger", tags=["Unified Ledger"])
 logger = logging.getLogger(__name__)
 
 
+# Ekstre sıralaması: tarih + id (id tekil, eşit tarihlerde sayfa kayması olmaz)
+STATEMENT_SORT = [("transaction_date", 1), ("id", 1)]
+
+# Ledger listeleri: en yeni en üstte (index: transaction_date, created_at, id)
+LIST_SORT = [("transaction_date", -1), ("created_at", -1), ("id", -1)]
+
+
 @router.get("/party/{party_id}/statement")
 async def get_party_statement(
     party_id: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
     current_user: User = Depends(get_current_user)
 ):
-    """Get party account statement (ekstre)"""
+    """
+    Get party account statement (ekstre) - cursor pagination
+
+    - opening_*_balance: sayfa başlangıcından önceki tüm kayıtların toplamı
+      (start_date öncesi dahil; kapalı aylar checkpoint'ten)
+    - entries: transaction_date, id sırasıyla, running_*_balance ile
+    - page_end_*_balance: sayfadaki son kaydın running bakiyesi
+    - final_*_balance: end_date sonundaki kapanış bakiyesi (sayfadan bağımsız)
+    - next_cursor: sonraki sayfa için (has_more=False ise None)
+    """
     db = get_db()
     
     query = {"party_id": party_id}
-    
     if start_date:
         query["transaction_date"] = {"$gte": start_date}
     if end_date:
-        if "transaction_date" in query:
-            query["transaction_date"]["$lte"] = end_date
-        else:
-            query["transaction_date"] = {"$lte": end_date}
+        query.setdefault("transaction_date", {})["$lte"] = end_date
+    
+    try:
+        page_query = apply_cursor(query, STATEMENT_SORT, cursor)
+        cursor_values = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    entries = await db.unified_ledger.find(query, {"_id": 0}).sort("transaction_date", 1).to_list(1000)
+    # Açılış bakiyesi: sayfa başından önceki tüm kayıtlar
+    # kapalı aylar checkpoint'ten, kalan günler ledger'dan (ledger_checkpoints)
+    opening = None
+    if cursor_values is not None:
+        opening = await ledger_totals(
+            db, "party", party_id,
+            until=cursor_values.get("transaction_date"), until_inclusive=True,
+            extra_match=keyset_filter(STATEMENT_SORT, cursor_values, after=False, inclusive=True)
+        )
+    elif start_date:
+        opening = await ledger_totals(db, "party", party_id, until=start_date)
     
-    # Calculate running balance
-    running_has_balance = 0
-    running_amount_balance = 0
+    opening_has_balance, opening_amount_balance = 0.0, 0.0
+    if opening and party_id in opening:
+        opening_has_balance = opening[party_id]["has_net"]
+        opening_amount_balance = opening[party_id]["amount_net"]
     
-    for entry in entries:
-        running_has_balance += entry.get("has_net", 0)
-        running_amount_balance += entry.get("amount_net", 0)
+    # Sayfa: limit + 1 kayıt okunur, fazlası has_more'u belirler
+    running_has_balance = opening_has_balance
+    running_amount_balance = opening_amount_balance
+    entries = []
+    has_more = False
+    
+    ledger_cursor = db.unified_ledger.find(page_query, {"_id": 0}).sort(STATEMENT_SORT).limit(limit + 1)
+    async for entry in ledger_cursor:
+        if len(entries) == limit:
+            has_more = True
+            break
+        running_has_balance += entry.get("has_net", 0) or 0
+        running_amount_balance += entry.get("amount_net", 0) or 0
         entry["running_has_balance"] = round(running_has_balance, 6)
         entry["running_amount_balance"] = round(running_amount_balance, 2)
+        entries.append(entry)
+    
+    # Kapanış bakiyesi: son sayfadaysak running bakiye, değilse aralığın tamamı
+    final_has_balance, final_amount_balance = running_has_balance, running_amount_balance
+    if has_more:
+        closing = await ledger_totals(db, "party", party_id, until=end_date, until_inclusive=True)
+        final_has_balance, final_amount_balance = 0.0, 0.0
+        if party_id in closing:
+            final_has_balance = closing[party_id]["has_net"]
+            final_amount_balance = closing[party_id]["amount_net"]
     
-    # Get party info
-    party = await db.parties.find_one({"id": party_id}, {"_id": 0})
-    if not party:
-        # Check employees
-        party = await db.employees.find_one({"id": party_id}, {"_id": 0})
-    if not party:
-        # Check partners
-        party = await db.partners.find_one({"id": party_id}, {"_id": 0})
+    # Get party info (sadece ilk sayfada)
+    party = None
+    if not cursor:
+        party = await db.parties.find_one({"id": party_id}, {"_id": 0})
+        if not party:
+            # Check employees
+            party = await db.employees.find_one({"id": party_id}, {"_id": 0})
+        if not party:
+            # Check partners
+            party = await db.partners.find_one({"id": party_id}, {"_id": 0})
     
     return {
         "party": party,
+        "opening_has_balance": round(opening_has_balance, 6),
+        "opening_amount_balance": round(opening_amount_balance, 2),
         "entries": entries,
-        "final_has_balance": round(running_has_balance, 6),
-        "final_amount_balance": round(running_amount_balance, 2)
+        "page_end_has_balance": round(running_has_balance, 6),
+        "page_end_amount_balance": round(running_amount_balance, 2),
+        "final_has_balance": round(final_has_balance, 6),
+        "final_amount_balance": round(final_amount_balance, 2),
+        "has_more": has_more,
+        "next_cursor": cursor_from_doc(entries[-1], STATEMENT_SORT) if has_more else None
     }
 
 
@@ -68,9 +132,11 @@ async def get_ledger_entries(
     end_date: Optional[str] = None,
     page: int = 1,
     per_page: int = 50,
+    cursor: Optional[str] = Query(None, description="Önceki yanıttaki next_cursor (page yerine)"),
+    include_total: Optional[bool] = Query(None, description="Toplam kayıt sayısı (varsayılan: sadece page ile)"),
     current_user: User = Depends(get_current_user)
 ):
-    """Get unified ledger entries with filters"""
+    """Get unified ledger entries with filters (page or cursor pagination)"""
     db = get_db()
     
     query = {}
@@ -86,21 +152,28 @@ async def get_ledger_entries(
         else:
             query["transaction_date"] = {"$lte": end_date}
     
-    # Calculate pagination
-    skip = (page - 1) * per_page
-    
-    # Get total count
-    total = await db.unified_ledger.count_documents(query)
-    
-    # Get entries
-    entries = await db.unified_ledger.find(query, {"_id": 0}).sort("transaction_date", -1).skip(skip).limit(per_page).to_list(per_page)
+    try:
+        entries, page_info = await paginate(
+            db.unified_ledger, query, LIST_SORT, page=page, per_page=per_page,
+            cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "entries": entries,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": (total + per_page - 1) // per_page
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
+
+
+@router.get("/write-stats")
+async def get_unified_ledger_write_stats(current_user: User = Depends(get_current_user)):
+    """Ledger write buffer metrics (entries per flush, flush latency)"""
+    return get_ledger_write_stats()
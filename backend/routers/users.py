@@ -3,12 +3,11 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from datetime import datetime, timezone
 import uuid
-import bcrypt
 import logging
 
 from database import get_db
 from models.user import User, UserCreate, UserUpdate, UserResponse
-from auth import get_current_user, hash_password
+from auth import get_current_user, hash_password_async, invalidate_user_cache
 
 router = APIRouter(prefix="/users", tags=["Users"])
 logger = logging.getLogger(__name__)
@@ -52,7 +51,7 @@ async def create_user(user_data: UserCreate, current_user: User = Depends(get_cu
         raise HTTPException(status_code=400, detail="Email already exists")
     
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password_async(user_data.password)
     
     # Create user
     now = datetime.now(timezone.utc).isoformat()
@@ -109,7 +108,7 @@ async def update_user(user_id: str, user_data: UserUpdate, current_user: User =
     
     if user_data.password:
         # Hash new password
-        hashed_password = bcrypt.hashpw(user_data.password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = await hash_password_async(user_data.password)
         update_doc["password"] = hashed_password
     
     if user_data.name:
@@ -123,6 +122,7 @@ async def update_user(user_id: str, user_data: UserUpdate, current_user: User =
     
     # Update user
     await db.users.update_one({"id": user_id}, {"$set": update_doc})
+    invalidate_user_cache(user_id)
     
     # Get updated user
     updated_user = await db.users.find_one({"id": user_id}, {"password": 0, "_id": 0})
@@ -155,5 +155,6 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    invalidate_user_cache(user_id)
     
     return {"message": "User deleted successfully"}
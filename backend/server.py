@@ -69,14 +69,22 @@ from init_unified_ledger import set_database as set_ledger_db, init_unified_ledg
 from expense_management import set_expense_db, init_expense_categories
 
 # Import market websocket
-from market_websocket import set_database as set_market_db, connect_to_market_websocket
+from market_websocket import set_database as set_market_db, connect_to_market_websocket, stop_tick_pipeline, warm_market_data_cache
+from lookup_cache import init_lookup_cache
+from ledger_checkpoints import init_ledger_checkpoints
+from profit_loss_rollups import init_profit_loss_rollups
+from report_jobs import report_job_runner
+from price_snapshot_service import init_price_snapshot_cache
 
 # Import init modules
 from init_lookups import init_lookups_if_empty
 from database import init_database_indexes
 
 # Import auth helpers for admin user
-from auth import hash_password
+from auth import hash_password_async, verify_password_async
+
+# Import party balance reconciliation for startup migration
+from services.party_balance_service import rebuild_party_balances
 
 # Create FastAPI app
 app = FastAPI(
@@ -158,7 +166,7 @@ async def ensure_admin_user():
         user_dict = {
             "id": "USER-ADMIN-001",
             "email": admin_email,
-            "password": hash_password(admin_password),
+            "password": await hash_password_async(admin_password),
             "name": "Admin Kullanıcı",
             "role": "SUPER_ADMIN",
             "status": "ACTIVE",
@@ -168,16 +176,26 @@ async def ensure_admin_user():
         await db.users.insert_one(user_dict)
         logger.info(f"✅ Admin user created: {admin_email}")
     else:
-        await db.users.update_one(
-            {"email": admin_email},
-            {"$set": {
-                "password": hash_password(admin_password),
-                "role": "SUPER_ADMIN",
-                "status": "ACTIVE",
-                "is_active": True
-            }}
-        )
-        logger.info(f"✅ Admin user updated: {admin_email}")
+        update = {}
+        if existing_user.get("role") != "SUPER_ADMIN":
+            update["role"] = "SUPER_ADMIN"
+        if existing_user.get("status") != "ACTIVE":
+            update["status"] = "ACTIVE"
+        if existing_user.get("is_active") is not True:
+            update["is_active"] = True
+        
+        # Şifre sadece değişmişse yeniden hash'lenir (her startup'ta bcrypt yok)
+        stored_password = existing_user.get("password") or existing_user.get("hashed_password")
+        try:
+            password_ok = bool(stored_password) and await verify_password_async(admin_password, stored_password)
+        except ValueError:
+            password_ok = False  # Geçersiz hash formatı
+        if not password_ok:
+            update["password"] = await hash_password_async(admin_password)
+        
+        if update:
+            await db.users.update_one({"email": admin_email}, {"$set": update})
+            logger.info(f"✅ Admin user updated: {admin_email} ({', '.join(update)})")
 
 
 async def migrate_party_has_balance():
@@ -190,6 +208,14 @@ async def migrate_party_has_balance():
         logger.info(f"✅ Migration: {result.modified_count} party'ye has_balance eklendi")
 
 
+async def migrate_party_currency_balances():
+    """Build materialized currency_balances for parties that don't have it yet"""
+    missing = await db.parties.distinct("id", {"currency_balances": {"$exists": False}})
+    if missing:
+        await rebuild_party_balances(db, party_ids=missing, include_has=False)
+        logger.info(f"✅ Migration: {len(missing)} party'ye currency_balances eklendi")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize all modules on startup"""
@@ -212,6 +238,7 @@ async def startup_event():
     
     # Migrate party has_balance
     await migrate_party_has_balance()
+    await migrate_party_currency_balances()
     
     # Initialize unified ledger indexes
     await init_unified_ledger_indexes()
@@ -220,6 +247,24 @@ async def startup_event():
     # Initialize database indexes (minimal strategy)
     await init_database_indexes(db)
     
+    # Closed-period ledger checkpoints (current month invalidation check)
+    await init_ledger_checkpoints(db)
+    
+    # Daily profit/loss rollups (first run: built from the ledger)
+    await init_profit_loss_rollups(db)
+    
+    # Load lookup tables (karats, product_types, payment_methods, settings...)
+    await init_lookup_cache(db)
+    
+    # Warm price snapshot cache (before market feed starts adding to it)
+    await init_price_snapshot_cache(db)
+    
+    # Warm market data cache (GET /market-data/latest is served from memory)
+    await warm_market_data_cache()
+    
+    # Background report workers (POST /api/reports/jobs)
+    report_job_runner.start(db)
+    
     # Start WebSocket
     asyncio.create_task(connect_to_market_websocket())
     logger.info("✅ Market WebSocket client started")
@@ -231,5 +276,12 @@ async def startup_event():
 async def shutdown_db_client():
     """Close database connection on shutdown"""
     logger.info("Shutting down...")
+    
+    # Flush buffered market ticks before closing the connection
+    await stop_tick_pipeline()
+    
+    # Running report jobs are abandoned (they show as failed after timeout)
+    await report_job_runner.stop()
+    
     client.close()
     logger.info("Database connection closed")
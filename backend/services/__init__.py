@@ -25,12 +25,24 @@ from services.stock_service import (
     get_or_create_stock_pool,
     add_to_stock_pool,
     consume_from_stock_pool,
+    take_from_stock_pool,
     get_stock_pool_info,
     create_stock_lot,
     consume_stock_lots_fifo,
     get_stock_lot_summary,
 )
 
+# Re-export from party balance service
+from services.party_balance_service import (
+    apply_party_balance_delta,
+    currency_balance_delta,
+    party_balance_from_doc,
+    rebuild_party_balances,
+)
+
+# Re-export from line batch service
+from services.line_batch_service import prefetch_line_refs, ProductWriteBatch
+
 # Re-export from transaction services
 from services.purchase_service import create_purchase_transaction
 from services.sale_service import create_sale_transaction
@@ -58,10 +70,19 @@ __all__ = [
     "get_or_create_stock_pool",
     "add_to_stock_pool",
     "consume_from_stock_pool",
+    "take_from_stock_pool",
     "get_stock_pool_info",
     "create_stock_lot",
     "consume_stock_lots_fifo",
     "get_stock_lot_summary",
+    # Party balance services
+    "apply_party_balance_delta",
+    "currency_balance_delta",
+    "party_balance_from_doc",
+    "rebuild_party_balances",
+    # Line batch services
+    "prefetch_line_refs",
+    "ProductWriteBatch",
     # Transaction services
     "create_purchase_transaction",
     "create_sale_transaction",
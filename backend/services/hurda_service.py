@@ -13,6 +13,8 @@ from services.base_service import (
     write_audit_log, create_cash_movement_internal, set_cash_db,
     create_ledger_entry
 )
+from lookup_cache import lookup_cache
+from utils.report_categories import report_category
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +78,7 @@ async def create_hurda_transaction(data, user_id: str, db):
     
     # 5. Process hurda (scrap gold) lines
     processed_lines = []
+    scrap_type = await lookup_cache.find_one(db, "product_types", code="GOLD_SCRAP")
     total_scrap_has = 0.0
     total_weight_gram = 0.0
     
@@ -96,7 +99,7 @@ async def create_hurda_transaction(data, user_id: str, db):
             )
         
         # Get karat info
-        karat = await db.karats.find_one({"id": karat_id})
+        karat = await lookup_cache.get(db, "karats", karat_id)
         if not karat:
             raise HTTPException(
                 status_code=404,
@@ -121,6 +124,8 @@ async def create_hurda_transaction(data, user_id: str, db):
             "product_id": None,  # No product, just scrap gold
             "sku": None,
             "product_type_code": "GOLD_SCRAP",
+            "product_type_id": scrap_type["id"] if scrap_type else None,
+            "report_category": report_category(scrap_type, "GOLD_SCRAP"),
             "karat_id": karat_id,
             "fineness": fineness,
             "weight_gram": weight_gram,
@@ -0,0 +1,125 @@
+"""Line Batch Service - Prefetch and bulk write for multi-line documents
+
+SALE/PURCHASE satırları tek tek find_one/update_one yapmak yerine:
+- Referans verilen products tek $in sorgusuyla önceden okunur; karats ve
+  product_types lookup cache'ten gelir
+- Satır sonuçları bellekte hesaplanır
+- Ürün insert/update'leri tek ordered bulk_write ile yazılır
+
+Aynı ürün birden fazla satırda geçerse sonraki satır, önceki satırın
+bellekte uygulanmış güncellemesini görür (sıralı find_one ile aynı sonuç).
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+
+from pymongo import InsertOne, UpdateOne
+
+from lookup_cache import lookup_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class LineRefs:
+    """Satırların referans verdiği dokümanlar (id -> doc)"""
+
+    def __init__(self, products: Dict[str, Optional[dict]], karats: Dict[Any, dict],
+                 product_types_by_code: Dict[str, dict], product_types_by_id: Dict[int, dict]):
+        self.products = products
+        self.karats = karats
+        self.product_types_by_code = product_types_by_code
+        self.product_types_by_id = product_types_by_id
+
+    async def product(self, db, product_id: str) -> Optional[dict]:
+        """Önbellekte yoksa (ör. invalidate sonrası) DB'den oku"""
+        if product_id not in self.products:
+            self.products[product_id] = await db.products.find_one({"id": product_id})
+        return self.products[product_id]
+
+    def karat(self, karat_id) -> Optional[dict]:
+        return self.karats.get(_to_int(karat_id))
+
+    def product_type(self, code: Optional[str] = None, type_id=None) -> Optional[dict]:
+        """Önce code, bulunamazsa id ile (purchase akışıyla aynı sıra)"""
+        product_type = self.product_types_by_code.get(code) if code else None
+        if not product_type and type_id:
+            product_type = self.product_types_by_id.get(_to_int(type_id) or 0)
+        return product_type
+
+    def apply_product_update(self, product_id: str, update: dict):
+        """$set'i bellekteki kopyaya da uygula"""
+        product = self.products.get(product_id)
+        if product is not None:
+            product.update(update)
+
+    def invalidate_products(self, product_type_id, karat_id):
+        """
+        Başka bir servis (ör. consume_from_stock_pool) bu tip/ayar ürünlerini
+        DB'de değiştirdi - bir sonraki erişimde yeniden oku
+        """
+        stale = [
+            pid for pid, p in self.products.items()
+            if p and p.get("product_type_id") == product_type_id and p.get("karat_id") == karat_id
+        ]
+        for pid in stale:
+            del self.products[pid]
+
+
+async def prefetch_line_refs(db, product_ids: Iterable[str] = ()) -> LineRefs:
+    """
+    Satırların referans verdiği ürünleri tek $in sorgusuyla oku
+
+    karats ve product_types lookup cache'ten gelir (DB round trip yok).
+    """
+    product_ids = list({pid for pid in product_ids if pid})
+    # Bulunamayan ürünler None olarak kalır (satır doğrulaması hata verir)
+    products: Dict[str, Optional[dict]] = {pid: None for pid in product_ids}
+    if product_ids:
+        async for product in db.products.find({"id": {"$in": product_ids}}):
+            products[product["id"]] = product
+
+    karat_docs = await lookup_cache.table(db, "karats")
+    type_docs = await lookup_cache.table(db, "product_types")
+
+    return LineRefs(
+        products=products,
+        karats={k["id"]: k for k in karat_docs},
+        product_types_by_code={t["code"]: t for t in type_docs if t.get("code")},
+        product_types_by_id={t["id"]: t for t in type_docs if t.get("id") is not None},
+    )
+
+
+class ProductWriteBatch:
+    """Ürün insert/update'lerini biriktirir, tek ordered bulk_write ile yazar"""
+
+    def __init__(self, refs: LineRefs):
+        self.refs = refs
+        self.ops: List = []
+
+    def insert(self, product: dict):
+        self.ops.append(InsertOne(product))
+        self.refs.products[product["id"]] = product
+
+    def set(self, product_id: str, update: dict):
+        self.ops.append(UpdateOne({"id": product_id}, {"$set": update}))
+        self.refs.apply_product_update(product_id, update)
+
+    async def product(self, db, product_id: str) -> Optional[dict]:
+        """Önbellekte yoksa DB'den okumadan önce bekleyen yazımları gönder"""
+        if self.ops and product_id not in self.refs.products:
+            await self.flush(db)
+        return await self.refs.product(db, product_id)
+
+    async def flush(self, db):
+        if not self.ops:
+            return None
+        ops, self.ops = self.ops, []
+        result = await db.products.bulk_write(ops, ordered=True)
+        logger.debug(f"Product batch written: {len(ops)} ops")
+        return result
@@ -0,0 +1,238 @@
+"""Lot Ledger Service - In-memory FIFO lot queues for FIFO_LOT sales
+
+Her (product_type_id, karat_id) için ACTIVE lotlar purchase_date sırasıyla
+bellekte bir deque'da tutulur:
+- İlk kullanımda DB'den bir kez yüklenir (compound index, limit yok)
+- create_stock_lot yeni lotu kuyruğa ekler
+- Satış kuyruğun başından tüketir; tüm lot güncellemeleri tek bulk_write
+
+Güncellemeler okunan remaining_quantity'ye koşulludur. Kuyruk DB ile
+uyuşmazsa (başka process, elle düzeltme) eşleşmeyen lotlar tespit edilir,
+kuyruk yeniden yüklenir ve eksik kalan miktar tekrar tüketilir. Kuyruk
+yetersiz görünürse "Yetersiz stok" vermeden önce DB'den bir kez yüklenir.
+"""
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+import asyncio
+import logging
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from database.transactions import unwrap_session
+
+logger = logging.getLogger(__name__)
+
+QUANTITY_EPSILON = 0.001  # Float toleransı (gram)
+MAX_RESYNC_ATTEMPTS = 3
+
+# Tarihi olmayan/okunamayan lotlar kuyruğun başına
+_MIN_PURCHASE_DATE = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def purchase_date_key(value) -> datetime:
+    """
+    purchase_date -> aware UTC datetime (kuyruk sıralama anahtarı)
+
+    DB'den gelen tarihler naive (client tz_aware değil), create_stock_lot'a
+    gelenler aware ya da ISO string olabilir; karşılaştırma tek tipte yapılır.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return _MIN_PURCHASE_DATE
+    if not isinstance(value, datetime):
+        return _MIN_PURCHASE_DATE
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class LotQueue:
+    """Tek (product_type_id, karat_id) için FIFO lot kuyruğu"""
+
+    def __init__(self):
+        self.lots = deque()
+        self.loaded = False
+        self.lock = asyncio.Lock()
+
+    def total_quantity(self) -> float:
+        return sum(lot["remaining_quantity"] for lot in self.lots)
+
+    def insert(self, lot: dict):
+        """purchase_date sırasını koruyarak ekle (genelde sona)"""
+        entry = {
+            "id": lot["id"],
+            "purchase_date": purchase_date_key(lot.get("purchase_date")),
+            "remaining_quantity": float(lot.get("remaining_quantity", 0) or 0),
+            "unit_cost_has": lot.get("unit_cost_has", 0),
+            "supplier_party_id": lot.get("supplier_party_id"),
+        }
+        if not self.lots or self.lots[-1]["purchase_date"] <= entry["purchase_date"]:
+            self.lots.append(entry)
+            return
+        keys = [l["purchase_date"] for l in self.lots]
+        self.lots.insert(bisect_right(keys, entry["purchase_date"]), entry)
+
+
+class LotLedger:
+    """Process-wide FIFO lot kuyrukları"""
+
+    def __init__(self):
+        self._queues: Dict[Tuple[int, int], LotQueue] = {}
+
+    def _queue(self, product_type_id: int, karat_id: int) -> LotQueue:
+        key = (product_type_id, karat_id)
+        if key not in self._queues:
+            self._queues[key] = LotQueue()
+        return self._queues[key]
+
+    def invalidate(self, product_type_id: int = None, karat_id: int = None):
+        """Kuyruğu (veya tümünü) bir sonraki kullanımda DB'den yeniden yüklenecek şekilde işaretle"""
+        if product_type_id is None:
+            self._queues.clear()
+            return
+        self._queues.pop((product_type_id, karat_id), None)
+
+    async def _load(self, db, queue: LotQueue, product_type_id: int, karat_id: int):
+        queue.lots.clear()
+        cursor = db.stock_lots.find({
+            "product_type_id": product_type_id,
+            "karat_id": karat_id,
+            "status": "ACTIVE",
+            "remaining_quantity": {"$gt": 0}
+        }, {"_id": 0, "id": 1, "purchase_date": 1, "remaining_quantity": 1,
+            "unit_cost_has": 1, "supplier_party_id": 1}).sort("purchase_date", 1)
+
+        async for lot in cursor:
+            queue.insert(lot)
+        queue.loaded = True
+        logger.debug(f"Lot queue loaded {product_type_id}/{karat_id}: {len(queue.lots)} lots")
+
+    def add_lot(self, lot_doc: dict):
+        """Yeni lot - kuyruk yüklüyse ekle (yüklü değilse ilk kullanımda DB'den gelir)"""
+        queue = self._queues.get((lot_doc.get("product_type_id"), lot_doc.get("karat_id")))
+        if queue is not None and queue.loaded and lot_doc.get("status", "ACTIVE") == "ACTIVE":
+            queue.insert(lot_doc)
+
+    @staticmethod
+    def _plan(queue: LotQueue, quantity: float):
+        """Kuyruğun başından tüketim planı (kuyruğu değiştirmez)"""
+        plan = []
+        remaining = quantity
+        for lot in queue.lots:
+            if remaining <= 0:
+                break
+            if lot["remaining_quantity"] <= 0:
+                continue
+            take = min(lot["remaining_quantity"], remaining)
+            plan.append((lot, take))
+            remaining -= take
+        return plan, remaining
+
+    async def consume(self, db, product_type_id: int, karat_id: int, quantity: float) -> List[dict]:
+        """
+        FIFO tüketim - tüm lot güncellemeleri tek bulk_write
+
+        Returns: [{"lot_id", "supplier_party_id", "quantity_taken", "unit_cost_has", "lot_depleted"}]
+        """
+        queue = self._queue(product_type_id, karat_id)
+        _, session = unwrap_session(db)
+
+        async with queue.lock:
+            consumed = []
+            to_consume = quantity
+            reloaded = False
+
+            for attempt in range(MAX_RESYNC_ATTEMPTS + 1):
+                if not queue.loaded:
+                    await self._load(db, queue, product_type_id, karat_id)
+                    reloaded = True
+
+                plan, shortfall = self._plan(queue, to_consume)
+                if shortfall > QUANTITY_EPSILON and not reloaded:
+                    # Bellekteki kuyruk eksik olabilir (başka process'te eklenen lotlar) -
+                    # hata vermeden önce DB'den bir kez yükle ve yeniden planla
+                    await self._load(db, queue, product_type_id, karat_id)
+                    reloaded = True
+                    plan, shortfall = self._plan(queue, to_consume)
+                if shortfall > QUANTITY_EPSILON:
+                    raise HTTPException(status_code=400, detail=f"Yetersiz stok! {shortfall:.2f}g eksik.")
+
+                now = datetime.now(timezone.utc).isoformat()
+                ops = []
+                for lot, take in plan:
+                    new_remaining = lot["remaining_quantity"] - take
+                    update = {"remaining_quantity": new_remaining, "updated_at": now}
+                    if new_remaining <= QUANTITY_EPSILON:
+                        update["status"] = "DEPLETED"
+                        update["remaining_quantity"] = 0
+                    ops.append(UpdateOne(
+                        {"id": lot["id"], "status": "ACTIVE", "remaining_quantity": lot["remaining_quantity"]},
+                        {"$set": update}
+                    ))
+
+                result = await db.stock_lots.bulk_write(ops, ordered=True)
+                applied = plan
+                if result.matched_count != len(ops):
+                    applied = await self._applied_part(db, plan)
+
+                for lot, take in applied:
+                    new_remaining = lot["remaining_quantity"] - take
+                    depleted = new_remaining <= QUANTITY_EPSILON
+                    consumed.append({
+                        "lot_id": lot["id"],
+                        "supplier_party_id": lot.get("supplier_party_id"),
+                        "quantity_taken": take,
+                        "unit_cost_has": lot.get("unit_cost_has", 0),
+                        "lot_depleted": depleted
+                    })
+                    lot["remaining_quantity"] = 0 if depleted else new_remaining
+                    to_consume -= take
+
+                # Biten lotları kuyruktan at
+                while queue.lots and queue.lots[0]["remaining_quantity"] <= QUANTITY_EPSILON:
+                    queue.lots.popleft()
+
+                if len(applied) == len(plan):
+                    break
+
+                # Kuyruk DB ile uyuşmuyor: yeniden yükle, eksik kalan miktarı tekrar tüket
+                logger.warning(
+                    f"Lot queue {product_type_id}/{karat_id} out of sync "
+                    f"({len(plan) - len(applied)} lots changed), reloading"
+                )
+                queue.loaded = False
+            else:
+                raise HTTPException(status_code=409, detail="Stok lotları eşzamanlı değişti, tekrar deneyin")
+
+            # Transaction içinde: abort olursa bellek DB'den ayrışır, sonraki kullanımda yeniden yükle
+            if session is not None:
+                queue.loaded = False
+
+        logger.info(f"FIFO lots consumed {product_type_id}/{karat_id}: {quantity}g from {len(consumed)} lots")
+        return consumed
+
+    @staticmethod
+    async def _applied_part(db, plan):
+        """Koşulu tutmayan güncellemeleri tespit et: DB'deki değer beklenen sonuçla aynı mı?"""
+        ids = [lot["id"] for lot, _ in plan]
+        docs = await db.stock_lots.find(
+            {"id": {"$in": ids}}, {"_id": 0, "id": 1, "remaining_quantity": 1}
+        ).to_list(len(ids))
+        current = {d["id"]: d.get("remaining_quantity", 0) or 0 for d in docs}
+
+        applied = []
+        for lot, take in plan:
+            expected = lot["remaining_quantity"] - take
+            expected = 0 if expected <= QUANTITY_EPSILON else expected
+            if abs(current.get(lot["id"], -1) - expected) <= 1e-9:
+                applied.append((lot, take))
+        return applied
+
+
+# Process-wide lot ledger
+lot_ledger = LotLedger()
@@ -0,0 +1,191 @@
+"""Party Balance Service - Materialized per-party HAS and currency balances
+
+Bakiye tek kaynak olarak parties dokümanında tutulur:
+- has_balance: HAS bakiyesi (mevcut alan)
+- currency_balances: {"USD": x, "EUR": y} döviz bakiyeleri
+
+Tüm transaction servisleri, iptal ve düzenleme işlemleri bakiyeyi
+$inc ile atomik olarak günceller. Liste ekranları transaction taraması
+yapmadan doğrudan party dokümanından okur.
+"""
+from datetime import datetime, timezone
+from typing import Optional, Dict, Iterable
+import logging
+
+from models.party import PartyBalance
+
+logger = logging.getLogger(__name__)
+
+# Döviz bakiyesi tutulan para birimleri
+BALANCE_CURRENCIES = ("USD", "EUR")
+
+
+def currency_balance_delta(type_code: str, currency: Optional[str], amount_currency: Optional[float]) -> float:
+    """
+    Bir transaction'ın döviz bakiyesine etkisi
+
+    - RECEIPT: Döviz tahsilatı bakiyeyi artırır
+    - PAYMENT: Döviz ödemesi bakiyeyi azaltır
+    - Diğer tipler döviz bakiyesini etkilemez
+    """
+    if currency not in BALANCE_CURRENCIES:
+        return 0.0
+
+    amount = abs(amount_currency or 0)
+    if amount <= 0:
+        return 0.0
+
+    if type_code == "RECEIPT":
+        return amount
+    if type_code == "PAYMENT":
+        return -amount
+    return 0.0
+
+
+def build_balance_update(has_delta: float = 0.0, currency: Optional[str] = None,
+                         amount_delta: float = 0.0) -> Dict:
+    """Party bakiyesi için $inc update dokümanı oluştur"""
+    inc = {"has_balance": has_delta}
+    if currency in BALANCE_CURRENCIES and amount_delta:
+        inc[f"currency_balances.{currency}"] = amount_delta
+
+    return {
+        "$inc": inc,
+        "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+    }
+
+
+async def apply_party_balance_delta(db, party_id: str, has_delta: float = 0.0,
+                                    currency: Optional[str] = None, amount_delta: float = 0.0):
+    """
+    Party bakiyesini atomik olarak güncelle (HAS + döviz tek update_one ile)
+    """
+    if not party_id:
+        return
+
+    await db.parties.update_one(
+        {"id": party_id},
+        build_balance_update(has_delta, currency, amount_delta)
+    )
+
+
+def party_balance_from_doc(party: Optional[dict], party_id: Optional[str] = None) -> PartyBalance:
+    """Party dokümanındaki materialized alanlardan PartyBalance oluştur (DB sorgusu yok)"""
+    party = party or {}
+    currency_balances = party.get("currency_balances") or {}
+
+    return PartyBalance(
+        party_id=party_id or party.get("id", ""),
+        has_gold_balance=round(party.get("has_balance", 0) or 0, 6),
+        try_balance=0.0,
+        usd_balance=round(currency_balances.get("USD", 0) or 0, 2),
+        eur_balance=round(currency_balances.get("EUR", 0) or 0, 2)
+    )
+
+
+# ==================== RECONCILIATION ====================
+
+async def compute_ledger_balances(db, party_ids: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """
+    financial_transactions'dan party bakiyelerini yeniden hesapla
+
+    HAS: İptal edilmemiş transaction'ların total_has_amount toplamı
+         (PURCHASE, PAYMENT, SALE, RECEIPT - /admin/fix-party-balances ile aynı kural)
+    Döviz: USD/EUR RECEIPT (+) ve PAYMENT (-) toplamları
+
+    Returns: {party_id: {"has_balance": float, "currency_balances": {...}, "breakdown": {...}}}
+    """
+    match = {"status": {"$ne": "CANCELLED"}, "party_id": {"$ne": None}}
+    if party_ids is not None:
+        match["party_id"] = {"$in": list(party_ids)}
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "party_id": "$party_id",
+                "type_code": "$type_code",
+                "currency": "$currency"
+            },
+            "has_total": {"$sum": "$total_has_amount"},
+            "amount_total": {"$sum": {"$abs": {"$ifNull": ["$total_amount_currency", 0]}}}
+        }}
+    ]
+
+    balances: Dict[str, dict] = {}
+    async for row in db.financial_transactions.aggregate(pipeline):
+        key = row["_id"]
+        party_id = key.get("party_id")
+        type_code = key.get("type_code")
+        currency = key.get("currency")
+
+        entry = balances.setdefault(party_id, {
+            "has_balance": 0.0,
+            "currency_balances": {c: 0.0 for c in BALANCE_CURRENCIES},
+            "breakdown": {}
+        })
+
+        if type_code in ("PURCHASE", "PAYMENT", "SALE", "RECEIPT"):
+            has_total = row.get("has_total") or 0
+            entry["has_balance"] += has_total
+            entry["breakdown"][type_code] = entry["breakdown"].get(type_code, 0) + has_total
+
+        delta = currency_balance_delta(type_code, currency, row.get("amount_total"))
+        if delta:
+            entry["currency_balances"][currency] += delta
+
+    return balances
+
+
+async def rebuild_party_balances(db, party_ids: Optional[Iterable[str]] = None,
+                                 include_has: bool = True) -> list:
+    """
+    Materialized bakiyeleri ledger'dan yeniden oluştur (reconciliation)
+
+    include_has=False: Sadece döviz bakiyelerini yeniden yaz (startup migration)
+    Returns: Bakiyesi değişen party'lerin listesi
+    """
+    query = {}
+    if party_ids is not None:
+        party_ids = list(party_ids)
+        query["id"] = {"$in": party_ids}
+
+    computed = await compute_ledger_balances(db, party_ids)
+    changed = []
+
+    async for party in db.parties.find(query, {"_id": 0, "id": 1, "name": 1,
+                                               "has_balance": 1, "currency_balances": 1}):
+        party_id = party["id"]
+        new = computed.get(party_id) or {
+            "has_balance": 0.0,
+            "currency_balances": {c: 0.0 for c in BALANCE_CURRENCIES},
+            "breakdown": {}
+        }
+        new_currency = {c: round(v, 2) for c, v in new["currency_balances"].items()}
+
+        update = {"currency_balances": new_currency}
+        if include_has:
+            update["has_balance"] = new["has_balance"]
+
+        await db.parties.update_one({"id": party_id}, {"$set": update})
+
+        old_has = party.get("has_balance", 0) or 0
+        old_currency = party.get("currency_balances") or {}
+        has_changed = include_has and abs(old_has - new["has_balance"]) > 0.0001
+        currency_changed = any(
+            abs((old_currency.get(c, 0) or 0) - new_currency[c]) > 0.005 for c in BALANCE_CURRENCIES
+        )
+
+        if has_changed or currency_changed:
+            changed.append({
+                "party_id": party_id,
+                "name": party.get("name"),
+                "old_balance": old_has,
+                "new_balance": new["has_balance"] if include_has else old_has,
+                "old_currency_balances": old_currency,
+                "new_currency_balances": new_currency,
+                "breakdown": new["breakdown"]
+            })
+
+    logger.info(f"Party balances rebuilt: {len(changed)} changed")
+    return changed
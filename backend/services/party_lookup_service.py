@@ -0,0 +1,83 @@
+"""Party Lookup Service - Batched party name/balance resolution for list endpoints
+
+Sayfalı listelerde her satır için ayrı find_one yerine sayfadaki tüm
+party_id'ler tek sorguda çözülür (N+1 sorgu yok).
+"""
+from typing import Dict, Iterable, Optional
+import logging
+
+from models.party import PartyBalance
+from services.party_balance_service import compute_ledger_balances, party_balance_from_doc
+
+logger = logging.getLogger(__name__)
+
+# Balance kaynakları
+BALANCE_SOURCE_MATERIALIZED = "materialized"  # parties.has_balance + currency_balances
+BALANCE_SOURCE_LEDGER = "ledger"              # financial_transactions $group
+
+
+def _unique_ids(party_ids: Iterable[Optional[str]]) -> list:
+    """None/boş değerleri at, sırayı koruyarak tekilleştir"""
+    return list(dict.fromkeys(pid for pid in party_ids if pid))
+
+
+def party_display_name(party: dict) -> Optional[str]:
+    """Müşteri için Ad Soyad, diğerleri için firma adı"""
+    if party.get("party_type_id") == 1:  # Customer
+        return f"{party.get('first_name') or ''} {party.get('last_name') or ''}".strip() or party.get("name")
+    return party.get("company_name") or party.get("name")
+
+
+async def resolve_party_docs(db, party_ids: Iterable[Optional[str]], projection: Optional[dict] = None) -> Dict[str, dict]:
+    """Verilen party_id'leri tek $in sorgusu ile getir: {party_id: party_doc}"""
+    ids = _unique_ids(party_ids)
+    if not ids:
+        return {}
+
+    fields = {"_id": 0, "id": 1}
+    fields.update(projection or {})
+
+    parties = await db.parties.find({"id": {"$in": ids}}, fields).to_list(len(ids))
+    return {p["id"]: p for p in parties}
+
+
+async def resolve_party_display_names(db, party_ids: Iterable[Optional[str]]) -> Dict[str, Optional[str]]:
+    """Sayfadaki tüm party'lerin görünen adlarını tek sorguda çöz"""
+    docs = await resolve_party_docs(db, party_ids, {
+        "name": 1, "first_name": 1, "last_name": 1, "company_name": 1, "party_type_id": 1
+    })
+    return {pid: party_display_name(p) for pid, p in docs.items()}
+
+
+async def resolve_party_balances(db, party_ids: Iterable[Optional[str]],
+                                 source: str = BALANCE_SOURCE_MATERIALIZED) -> Dict[str, PartyBalance]:
+    """
+    Sayfadaki tüm party'lerin bakiyelerini toplu çöz
+
+    - materialized: parties dokümanlarından tek $in sorgusu
+    - ledger: financial_transactions üzerinde tek $group aggregation
+      (/admin/fix-party-balances ile aynı hesaplama kuralı)
+
+    Bulunamayan party'ler için sıfır bakiye döner.
+    """
+    ids = _unique_ids(party_ids)
+    if not ids:
+        return {}
+
+    if source == BALANCE_SOURCE_LEDGER:
+        computed = await compute_ledger_balances(db, ids)
+        result = {}
+        for pid in ids:
+            entry = computed.get(pid) or {}
+            currency_balances = entry.get("currency_balances") or {}
+            result[pid] = PartyBalance(
+                party_id=pid,
+                has_gold_balance=round(entry.get("has_balance", 0) or 0, 6),
+                try_balance=0.0,
+                usd_balance=round(currency_balances.get("USD", 0) or 0, 2),
+                eur_balance=round(currency_balances.get("EUR", 0) or 0, 2)
+            )
+        return result
+
+    docs = await resolve_party_docs(db, ids, {"has_balance": 1, "currency_balances": 1})
+    return {pid: party_balance_from_doc(docs.get(pid), pid) for pid in ids}
@@ -13,6 +13,10 @@ from services.base_service import (
     write_audit_log, create_cash_movement_internal, set_cash_db,
     create_ledger_entry
 )
+from services.party_balance_service import apply_party_balance_delta, currency_balance_delta
+from services.stock_service import take_from_stock_pool
+from lookup_cache import lookup_cache
+from utils.report_categories import report_category
 
 logger = logging.getLogger(__name__)
 
@@ -113,7 +117,7 @@ async def create_payment_transaction(data, user_id: str, db):
             has_amount = scrap_line.get('has_amount')
             
             # Validate karat
-            karat = await db.karats.find_one({"id": karat_id})
+            karat = await lookup_cache.get(db, "karats", karat_id)
             if not karat:
                 raise HTTPException(status_code=400, detail=f"Invalid karat_id: {karat_id}")
             
@@ -124,6 +128,8 @@ async def create_payment_transaction(data, user_id: str, db):
                 "product_id": None,
                 "sku": None,
                 "product_type_code": "GOLD_SCRAP",
+                "product_type_id": None,  # Hurda tipi aşağıda fineness'a göre belirlenir
+                "report_category": report_category(code="GOLD_SCRAP"),
                 "karat_id": karat_id,
                 "fineness": fineness,
                 "weight_gram": weight_gram,
@@ -148,16 +154,14 @@ async def create_payment_transaction(data, user_id: str, db):
             
             # HURDA STOKTAN DÜŞ - Products tablosundan FIFO ile düş (Havuz DEĞİL!)
             # Karat/fineness'a göre doğru hurda tipini bul
-            hurda_product_type = await db.product_types.find_one({
-                "group": "HURDA",
-                "milyem": fineness
-            })
+            hurda_product_type = await lookup_cache.find_one(db, "product_types", group="HURDA", milyem=fineness)
             
             if not hurda_product_type:
-                hurda_product_type = await db.product_types.find_one({"code": "GOLD_SCRAP"})
+                hurda_product_type = await lookup_cache.find_one(db, "product_types", code="GOLD_SCRAP")
             
             if hurda_product_type:
                 hurda_product_type_id = hurda_product_type["id"]
+                line_doc["product_type_id"] = hurda_product_type_id
                 logger.info(f"GOLD_SCRAP PAYMENT: Using product_type {hurda_product_type_id} ({hurda_product_type.get('name')}) for fineness {fineness}")
                 
                 # Hurda stoğunu PRODUCTS tablosundan kontrol et
@@ -225,21 +229,11 @@ async def create_payment_transaction(data, user_id: str, db):
                     remaining_to_deduct -= to_deduct
                 
                 # Stock pool'u da güncelle (senkronizasyon için)
-                pool = await db.stock_pools.find_one({
-                    "product_type_id": hurda_product_type_id,
-                    "karat_id": karat_id
-                })
+                pool = await take_from_stock_pool(
+                    db, hurda_product_type_id, karat_id, weight_gram, require_available=False
+                )
                 if pool:
-                    new_pool_weight = max(0, pool.get("total_weight", 0) - weight_gram)
-                    new_pool_cost = max(0, pool.get("total_cost_has", 0) - (weight_gram * pool.get("avg_cost_per_gram", 0)))
-                    await db.stock_pools.update_one(
-                        {"id": pool["id"]},
-                        {"$set": {
-                            "total_weight": new_pool_weight,
-                            "total_cost_has": new_pool_cost,
-                            "updated_at": datetime.now(timezone.utc).isoformat()
-                        }}
-                    )
+                    new_pool_weight = pool.get("total_weight", 0)
                     logger.info(f"GOLD_SCRAP PAYMENT: Updated stock_pool, new weight: {new_pool_weight}g")
         
         # Calculate TL equivalent for total
@@ -396,13 +390,13 @@ async def create_payment_transaction(data, user_id: str, db):
     # 8. Update party balance (close our debt)
     # Bizim borcumuz pozitif balance olarak tutulur (onlara borçluyuz)
     # Ödeme: balance'ı azalt (pozitiften 0'a doğru)
+    # Döviz ödemesi ise currency_balances da aynı update ile düşülür
     balance_change = -total_closed_has  # Total debt being closed (negative)
-    await db.parties.update_one(
-        {"id": party_id},
-        {
-            "$inc": {"has_balance": balance_change},
-            "$set": {"updated_at": now.isoformat()}
-        }
+    await apply_party_balance_delta(
+        db, party_id,
+        has_delta=balance_change,
+        currency=currency,
+        amount_delta=currency_balance_delta("PAYMENT", currency, transaction_doc["total_amount_currency"])
     )
     logger.info(f"Updated party {party_id} HAS balance by {balance_change} (payment)")
     
@@ -14,6 +14,10 @@ from services.base_service import (
     create_ledger_entry
 )
 from services.stock_service import create_stock_lot, add_to_stock_pool
+from services.party_balance_service import apply_party_balance_delta
+from services.line_batch_service import prefetch_line_refs, ProductWriteBatch
+from lookup_cache import lookup_cache
+from utils.report_categories import report_category
 
 logger = logging.getLogger(__name__)
 
@@ -67,7 +71,11 @@ async def create_purchase_transaction(data, user_id: str, db):
     created_products = []
     total_has = 0.0
     
-    # Logger already defined at module level
+    # Referans verileri tek seferde oku; ürünler tek bulk_write ile yazılır,
+    # lot/havuz girişleri ürünler yazıldıktan sonra yapılır
+    refs = await prefetch_line_refs(db, product_ids=[l.get("product_id") for l in data.lines])
+    product_batch = ProductWriteBatch(refs)
+    stock_entries = []
     
     for idx, line_input in enumerate(data.lines, 1):
         product_id = line_input.get("product_id")
@@ -91,17 +99,8 @@ async def create_purchase_transaction(data, user_id: str, db):
         product_type_id_input = line_input.get("product_type_id")
         
         if not product_id and (product_type_code or product_type_id_input):
-            # Get product type
-            product_type = None
-            if product_type_code:
-                product_type = await db.product_types.find_one({"code": product_type_code})
-            if not product_type and product_type_id_input:
-                # Try by id
-                try:
-                    type_id = int(product_type_id_input)
-                except (ValueError, TypeError):
-                    type_id = 0
-                product_type = await db.product_types.find_one({"id": type_id})
+            # Get product type (code, yoksa id ile)
+            product_type = refs.product_type(product_type_code, product_type_id_input)
             
             product_type_id = product_type["id"] if product_type else 1
             is_gold_based = product_type.get("is_gold_based", True) if product_type else True
@@ -111,12 +110,7 @@ async def create_purchase_transaction(data, user_id: str, db):
             
             # Get karat info
             if karat_id and not fineness:
-                # Ensure karat_id is an integer for MongoDB lookup
-                try:
-                    karat_id_int = int(karat_id)
-                except (ValueError, TypeError):
-                    karat_id_int = 0
-                karat = await db.karats.find_one({"id": karat_id_int})
+                karat = refs.karat(karat_id)
                 if karat:
                     fineness = karat.get("fineness", 0.995)
                 else:
@@ -209,50 +203,30 @@ async def create_purchase_transaction(data, user_id: str, db):
             }
             
             # Insert product
-            await db.products.insert_one(new_product)
+            product_batch.insert(new_product)
             product_id = new_product["id"]
             created_products.append(new_product)
             
-            # FIFO_LOT için stock_lot oluştur
-            if track_type == "FIFO_LOT":
-                unit_cost_has = total_cost_has / weight_gram if weight_gram > 0 else 0
-                await create_stock_lot(
-                    db=db,
-                    product_type_id=product_type_id,
-                    product_type_code=line_input.get("product_type_code"),
-                    karat_id=karat_id,
-                    supplier_party_id=data.party_id,
-                    purchase_date=transaction_date,
-                    quantity=weight_gram,  # Gram bazlı
-                    unit_cost_has=unit_cost_has,
-                    labor_cost_has=labor_has_cost,
-                    fineness=fineness or 0.916
-                )
-                logger.info(f"Created FIFO_LOT for {product_type.get('name')}: {weight_gram}g")
-            
-            # POOL için havuza ekle
-            elif track_type == "POOL":
-                pool_result = await add_to_stock_pool(
-                    db=db,
-                    product_type_id=product_type_id,
-                    karat_id=int(karat_id) if karat_id else 1,
-                    weight_gram=weight_gram,
-                    cost_has=total_cost_has,
-                    fineness=fineness or 0.916
-                )
-                logger.info(f"Added to POOL for {product_type.get('name')}: {weight_gram}g, new total: {pool_result['new_total_weight']}g")
+            if track_type in ("FIFO_LOT", "POOL"):
+                stock_entries.append({
+                    "track_type": track_type,
+                    "product_type": product_type,
+                    "product_type_id": product_type_id,
+                    "product_type_code": line_input.get("product_type_code"),
+                    "karat_id": karat_id,
+                    "fineness": fineness,
+                    "weight_gram": weight_gram,
+                    "labor_has_cost": labor_has_cost,
+                    "total_cost_has": total_cost_has
+                })
         
         # If product exists, update stock status
         elif product_id:
-            product = await db.products.find_one({"id": product_id})
-            if product:
-                await db.products.update_one(
-                    {"id": product_id},
-                    {"$set": {
-                        "stock_status_id": 1,  # IN_STOCK
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }}
-                )
+            if refs.products.get(product_id):
+                product_batch.set(product_id, {
+                    "stock_status_id": 1,  # IN_STOCK
+                    "updated_at": datetime.now(timezone.utc).isoformat()
+                })
         
         # Build line document - use calculated values, not frontend values
         # Note için ürün adı belirle
@@ -262,7 +236,7 @@ async def create_purchase_transaction(data, user_id: str, db):
             if product_type.get("group") == "HURDA":
                 karat_name = ""
                 if karat_id:
-                    karat_doc = await db.karats.find_one({"id": int(karat_id)})
+                    karat_doc = refs.karat(karat_id)
                     if karat_doc:
                         karat_name = karat_doc.get("karat", "")
                 line_note = f"{product_type.get('name', 'Hurda')} - {weight_gram}gr"
@@ -271,6 +245,12 @@ async def create_purchase_transaction(data, user_id: str, db):
             else:
                 line_note = product_type.get("name", "")
         
+        # Rapor kategorisi: yeni ürünün tipi, mevcut ürün için ürünün kendi tipi
+        line_product_type = product_type
+        if line_product_type is None and refs.products.get(product_id):
+            existing = refs.products[product_id]
+            line_product_type = refs.product_type(existing.get("product_type_code"), existing.get("product_type_id"))
+        
         line_doc = {
             "_id": BsonObjectId(),
             "line_no": idx,
@@ -278,6 +258,8 @@ async def create_purchase_transaction(data, user_id: str, db):
             "product_id": product_id,
             "sku": line_input.get("sku"),
             "product_type_code": line_input.get("product_type_code"),
+            "product_type_id": line_product_type["id"] if line_product_type else product_type_id,
+            "report_category": report_category(line_product_type, line_input.get("product_type_code")),
             "karat_id": line_input.get("karat_id"),
             "fineness": fineness,
             "weight_gram": weight_gram,
@@ -304,12 +286,45 @@ async def create_purchase_transaction(data, user_id: str, db):
         processed_lines.append(line_doc)
         total_has += total_cost_has
     
+    # Yeni ürünler ve stok durumu güncellemeleri tek bulk_write
+    await product_batch.flush(db)
+    
+    # FIFO_LOT için stock_lot oluştur, POOL için havuza ekle
+    for entry in stock_entries:
+        product_type = entry["product_type"]
+        weight_gram = entry["weight_gram"]
+        if entry["track_type"] == "FIFO_LOT":
+            unit_cost_has = entry["total_cost_has"] / weight_gram if weight_gram > 0 else 0
+            await create_stock_lot(
+                db=db,
+                product_type_id=entry["product_type_id"],
+                product_type_code=entry["product_type_code"],
+                karat_id=entry["karat_id"],
+                supplier_party_id=data.party_id,
+                purchase_date=transaction_date,
+                quantity=weight_gram,  # Gram bazlı
+                unit_cost_has=unit_cost_has,
+                labor_cost_has=entry["labor_has_cost"],
+                fineness=entry["fineness"] or 0.916
+            )
+            logger.info(f"Created FIFO_LOT for {product_type.get('name')}: {weight_gram}g")
+        else:
+            pool_result = await add_to_stock_pool(
+                db=db,
+                product_type_id=entry["product_type_id"],
+                karat_id=int(entry["karat_id"]) if entry["karat_id"] else 1,
+                weight_gram=weight_gram,
+                cost_has=entry["total_cost_has"],
+                fineness=entry["fineness"] or 0.916
+            )
+            logger.info(f"Added to POOL for {product_type.get('name')}: {weight_gram}g, new total: {pool_result['new_total_weight']}g")
+    
     # Commission calculation
     commission_amount_currency = 0.0
     commission_has_amount = 0.0
     
     if data.payment_method_code and data.total_amount_currency:
-        payment_method = await db.payment_methods.find_one({"code": data.payment_method_code})
+        payment_method = await lookup_cache.find_one(db, "payment_methods", code=data.payment_method_code)
         if payment_method and payment_method.get("commission_rate", 0) > 0:
             commission_amount_currency = round_currency(
                 data.total_amount_currency * payment_method["commission_rate"]
@@ -443,13 +458,7 @@ async def create_purchase_transaction(data, user_id: str, db):
             logger.info(f"PURCHASE without payment: Party {party_id} balance += {alis_has:.6f} HAS (full debt)")
         
         # Bakiye güncelle (sadece değişiklik varsa)
-        await db.parties.update_one(
-            {"id": party_id},
-            {
-                "$inc": {"has_balance": net_balance_change},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-            }
-        )
+        await apply_party_balance_delta(db, party_id, has_delta=net_balance_change)
         logger.info(f"Party {party_id} balance updated by {net_balance_change:.6f} HAS")
     
     # ==================== KASA HAREKETİ ====================
@@ -13,6 +13,7 @@ from services.base_service import (
     write_audit_log, create_cash_movement_internal, set_cash_db,
     create_ledger_entry
 )
+from services.party_balance_service import apply_party_balance_delta, currency_balance_delta
 
 logger = logging.getLogger(__name__)
 
@@ -221,13 +222,13 @@ async def create_receipt_transaction(data, user_id: str, db):
     # 7. Update party balance (close debt)
     # Party'nin borcu negatif balance olarak tutulur
     # Tahsilat: balance'ı artır (negatiften 0'a doğru)
+    # Döviz tahsilatı ise currency_balances da aynı update ile artırılır
     balance_change = total_closed_has  # Total debt being closed
-    await db.parties.update_one(
-        {"id": party_id},
-        {
-            "$inc": {"has_balance": balance_change},
-            "$set": {"updated_at": now.isoformat()}
-        }
+    await apply_party_balance_delta(
+        db, party_id,
+        has_delta=balance_change,
+        currency=currency,
+        amount_delta=currency_balance_delta("RECEIPT", currency, transaction_doc["total_amount_currency"])
     )
     logger.info(f"Updated party {party_id} HAS balance by +{balance_change} (receipt)")
     
@@ -4,6 +4,7 @@ from typing import Optional, List, Dict, Any
 from bson import ObjectId as BsonObjectId
 from fastapi import HTTPException
 import logging
+import os
 import uuid
 
 from services.base_service import (
@@ -14,10 +15,21 @@ from services.base_service import (
     create_ledger_entry
 )
 from services.stock_service import consume_from_stock_pool, consume_stock_lots_fifo
+from services.party_balance_service import apply_party_balance_delta
+from services.line_batch_service import prefetch_line_refs, ProductWriteBatch
+from lookup_cache import lookup_cache
+from utils.report_categories import report_category
+from database.transactions import run_in_transaction, unwrap_session
+from init_unified_ledger import ledger_unit_of_work
 
 logger = logging.getLogger(__name__)
 
-async def create_sale_transaction(data, user_id: str, db):
+# none: her adım bağımsız yazılır (standalone Mongo)
+# transaction: tüm satış tek Mongo transaction'ı (replica set gerekir)
+SALE_TRANSACTION_MODE = os.environ.get("SALE_TRANSACTION_MODE", "none").lower()
+
+
+async def create_sale_transaction(data, user_id: str, db, atomic: Optional[bool] = None):
     """
     SALE Transaction - Müşteriye ürün satışı (Dokümana %100 uyumlu implementasyon)
     
@@ -41,7 +53,27 @@ async def create_sale_transaction(data, user_id: str, db):
     - discount_tl/discount_has: İskonto tutarı
     - customer_debt_has: Müşteri borcu (HAS)
     - is_credit_sale: Veresiye satış mı?
+    
+    atomic=True (veya SALE_TRANSACTION_MODE=transaction): ürün/lot/havuz
+    güncellemeleri, party bakiyesi, transaction, audit log, kasa hareketi ve
+    ledger kaydı tek Mongo transaction'ında yazılır; TransientTransactionError
+    durumunda tüm satış tekrar denenir. Kasa/ledger hatası satışı geri alır.
     """
+    if atomic is None:
+        atomic = SALE_TRANSACTION_MODE == "transaction"
+    
+    if not atomic:
+        return await _run_sale_pipeline(data, user_id, db)
+    
+    async def operation(session_db):
+        async with ledger_unit_of_work(session=session_db.session):
+            return await _run_sale_pipeline(data, user_id, session_db, atomic=True)
+    
+    return await run_in_transaction(db, operation)
+
+
+async def _run_sale_pipeline(data, user_id: str, db, atomic: bool = False):
+    """Satış adımları - db session'a bağlı (SessionDatabase) olabilir"""
     
     # 1. Validations
     party_id = data.party_id
@@ -74,7 +106,8 @@ async def create_sale_transaction(data, user_id: str, db):
             }
     
     # 3. Get price snapshot
-    snapshot = await get_or_create_price_snapshot(db, transaction_date)
+    # Snapshot paylaşılan referans veri - transaction dışında alınır (write conflict olmasın)
+    snapshot = await get_or_create_price_snapshot(unwrap_session(db)[0], transaction_date)
     tx_code = generate_transaction_code(transaction_date)
     
     # 4. Process lines
@@ -85,6 +118,10 @@ async def create_sale_transaction(data, user_id: str, db):
     total_cost_has = 0.0  # Toplam maliyet (OUT)
     total_sale_has = 0.0  # Toplam satış değeri
     
+    # Ürün ve ayarları tek seferde oku, ürün güncellemelerini tek bulk_write ile yaz
+    refs = await prefetch_line_refs(db, product_ids=[l.get("product_id") for l in data.lines])
+    product_batch = ProductWriteBatch(refs)
+    
     for idx, line_input in enumerate(data.lines, 1):
         product_id = line_input.get("product_id")
         sale_quantity = float(line_input.get("quantity", 1) or 1)  # Satış miktarı
@@ -93,7 +130,7 @@ async def create_sale_transaction(data, user_id: str, db):
             raise HTTPException(status_code=400, detail=f"Line {idx}: product_id required for SALE")
         
         # Get product
-        product = await db.products.find_one({"id": product_id})
+        product = await product_batch.product(db, product_id)
         if not product:
             raise HTTPException(status_code=404, detail=f"Line {idx}: Product {product_id} not found")
         
@@ -138,7 +175,7 @@ async def create_sale_transaction(data, user_id: str, db):
                 update_data["sold_date"] = transaction_date.isoformat()
                 update_data["sold_transaction_code"] = tx_code
             
-            await db.products.update_one({"id": product_id}, {"$set": update_data})
+            product_batch.set(product_id, update_data)
             
             # Lot bilgilerini line meta'ya ekle
             line_input["consumed_lots"] = consumed_lots
@@ -186,7 +223,7 @@ async def create_sale_transaction(data, user_id: str, db):
                 update_data["sold_date"] = transaction_date.isoformat()
                 update_data["sold_transaction_code"] = tx_code
             
-            await db.products.update_one({"id": product_id}, {"$set": update_data})
+            product_batch.set(product_id, update_data)
             logger.info(f"FIFO Sale: Product {product_id}, sold {sale_quantity}, remaining {new_remaining}")
         
         elif track_type == "POOL":
@@ -194,10 +231,13 @@ async def create_sale_transaction(data, user_id: str, db):
             product_type_id = product.get("product_type_id")
             karat_id = product.get("karat_id")
             
+            # Havuz tüketimi products tablosunu okur/günceller: bekleyen yazımlar önce gitmeli
+            await product_batch.flush(db)
             try:
                 pool_result = await consume_from_stock_pool(db, product_type_id, karat_id, sale_quantity)
             except HTTPException as e:
                 raise HTTPException(status_code=400, detail=f"Line {idx}: {e.detail}")
+            refs.invalidate_products(product_type_id, karat_id)
             
             # Maliyet = ortalama maliyet × satılan gram
             product_cost_has = pool_result["consumed_cost"]
@@ -207,7 +247,7 @@ async def create_sale_transaction(data, user_id: str, db):
             fineness = float(line_input.get("fineness", 0) or 0)
             if fineness <= 0:
                 # Karat tablosundan milyem değerini al
-                karat_doc = await db.karats.find_one({"id": karat_id})
+                karat_doc = refs.karat(karat_id)
                 fineness = karat_doc.get("fineness", 0.916) if karat_doc else 0.916
             
             # İşçilik: line'dan gelen toplam labor_has_value (zaten gram * işçilik hesaplanmış)
@@ -231,7 +271,7 @@ async def create_sale_transaction(data, user_id: str, db):
                 update_data["sold_date"] = transaction_date.isoformat()
                 update_data["sold_transaction_code"] = tx_code
             
-            await db.products.update_one({"id": product_id}, {"$set": update_data})
+            product_batch.set(product_id, update_data)
             
             # Pool bilgilerini line meta'ya ekle
             line_input["pool_info"] = pool_result
@@ -260,16 +300,13 @@ async def create_sale_transaction(data, user_id: str, db):
             logger.info(f"UNIQUE Sale: cost_has={product_cost_has:.4f}, sale_has={sale_has_value:.4f}, profit={sale_has_value - product_cost_has:.4f}")
             
             # Mark product as SOLD
-            await db.products.update_one(
-                {"id": product_id},
-                {"$set": {
-                    "stock_status_id": 2,  # SOLD
-                    "remaining_quantity": 0,
-                    "updated_at": datetime.now(timezone.utc).isoformat(),
-                    "sold_date": transaction_date.isoformat(),
-                    "sold_transaction_code": tx_code
-                }}
-            )
+            product_batch.set(product_id, {
+                "stock_status_id": 2,  # SOLD
+                "remaining_quantity": 0,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "sold_date": transaction_date.isoformat(),
+                "sold_transaction_code": tx_code
+            })
         
         # Get cost values from product
         material_has = product.get("material_has_cost", 0.0)
@@ -286,6 +323,11 @@ async def create_sale_transaction(data, user_id: str, db):
             "product_id": product_id,
             "sku": product.get("barcode"),
             "product_type_code": product.get("product_type_code"),
+            "product_type_id": product.get("product_type_id"),
+            "report_category": report_category(
+                refs.product_type(product.get("product_type_code"), product.get("product_type_id")),
+                product.get("product_type_code")
+            ),
             "karat_id": product.get("karat_id"),
             "fineness": product.get("fineness"),
             "weight_gram": product.get("weight_gram"),
@@ -315,12 +357,15 @@ async def create_sale_transaction(data, user_id: str, db):
         total_cost_has += product_cost_has
         total_sale_has += sale_has_value
     
+    # Tüm satırlar doğrulandı - ürün güncellemelerini tek seferde yaz
+    await product_batch.flush(db)
+    
     # 5. Commission calculation
     commission_amount_currency = 0.0
     commission_has_amount = 0.0
     
     if data.payment_method_code and data.total_amount_currency:
-        payment_method = await db.payment_methods.find_one({"code": data.payment_method_code})
+        payment_method = await lookup_cache.find_one(db, "payment_methods", code=data.payment_method_code)
         if payment_method and payment_method.get("commission_rate", 0) > 0:
             commission_amount_currency = round_currency(
                 data.total_amount_currency * payment_method["commission_rate"]
@@ -487,13 +532,7 @@ async def create_sale_transaction(data, user_id: str, db):
     # Party balance sadece BORÇ kısmını tutar
     if party_id and customer_debt_has > 0.001:
         # Sadece ödenmeyen kısım borç olarak yazılır
-        await db.parties.update_one(
-            {"id": party_id},
-            {
-                "$inc": {"has_balance": -customer_debt_has},  # Negatif = müşteri bize borçlu
-                "$set": {"updated_at": now.isoformat()}
-            }
-        )
+        await apply_party_balance_delta(db, party_id, has_delta=-customer_debt_has)  # Negatif = müşteri bize borçlu
         logger.info(f"Updated party {party_id} HAS balance by -{customer_debt_has} (SALE - customer owes us)")
     
     # Insert to database
@@ -515,8 +554,9 @@ async def create_sale_transaction(data, user_id: str, db):
     
     if cash_register_id and actual_amount_tl and actual_amount_tl > 0:
         try:
-            # Set db for cash management module
-            set_cash_db(db)
+            # Set db for cash management module (session ayrı verilir)
+            base_db, session = unwrap_session(db)
+            set_cash_db(base_db)
             
             # Get cash register to determine currency
             cash_register = await db.cash_registers.find_one({"id": cash_register_id, "is_active": True})
@@ -542,7 +582,8 @@ async def create_sale_transaction(data, user_id: str, db):
                         reference_id=tx_code,
                         description=f"Satış tahsilatı - {party_name} - {foreign_amount} {payment_currency}",
                         created_by=user_id,
-                        transaction_date=transaction_date
+                        transaction_date=transaction_date,
+                        session=session
                     )
                     logger.info(f"Cash movement created for SALE {tx_code}: +{foreign_amount} {payment_currency} to {cash_register_id}")
                 else:
@@ -556,12 +597,15 @@ async def create_sale_transaction(data, user_id: str, db):
                         reference_id=tx_code,
                         description=f"Satış tahsilatı - {party_name} - {products_str}",
                         created_by=user_id,
-                        transaction_date=transaction_date
+                        transaction_date=transaction_date,
+                        session=session
                     )
                     logger.info(f"Cash movement created for SALE {tx_code}: +{actual_amount_tl} TL to {cash_register_id}")
         except Exception as e:
             logger.error(f"Failed to create cash movement for SALE {tx_code}: {e}")
-            # Don't fail the transaction, just log the error
+            # Atomik modda satış geri alınır, aksi halde sadece loglanır
+            if atomic:
+                raise
     
     logger.info(f"SALE transaction created: {tx_code}, Party: {party_id}, Net Profit HAS: {net_profit_has}, Discount HAS: {discount_has}, Debt HAS: {customer_debt_has}")
     
@@ -635,7 +679,9 @@ async def create_sale_transaction(data, user_id: str, db):
         logger.info(f"✅ Unified ledger entry created for SALE: {tx_code}")
     except Exception as e:
         logger.error(f"Failed to create ledger entry for SALE {tx_code}: {e}")
-        # Ledger hatası ana işlemi engellemez
+        # Ledger hatası ana işlemi engellemez (atomik mod hariç)
+        if atomic:
+            raise
     
     # Return response
     return {
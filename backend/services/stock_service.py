@@ -1,25 +1,52 @@
 """Stock Service - Stock pool and lot management"""
+import asyncio
 from datetime import datetime, timezone
 from fastapi import HTTPException
+from pymongo import ReturnDocument
 import logging
 import uuid
 
+from database.transactions import unwrap_session
+from services.lot_ledger_service import lot_ledger
+
 logger = logging.getLogger(__name__)
 
 
 # ==================== STOCK POOL HELPERS (Bilezik vb.) ====================
+# Havuz değişiklikleri read-modify-write yerine tek atomik find_one_and_update
+# ile yapılır: ağırlık/maliyet sunucuda artırılır, ortalama maliyet aynı
+# update içinde yeniden hesaplanır. Eşzamanlı satış/alışlarda güncelleme kaybolmaz.
+
+POOL_WEIGHT_EPSILON = 0.0001
+
+# Güncel total_weight/total_cost_has'tan ortalama maliyet (update pipeline aşaması)
+_RECOMPUTE_AVG_COST = {"$set": {
+    "avg_cost_per_gram": {"$cond": [
+        {"$gt": ["$total_weight", 0]},
+        {"$divide": ["$total_cost_has", "$total_weight"]},
+        0
+    ]}
+}}
+
+
+def stock_pool_id(product_type_id: int, karat_id: int) -> str:
+    return f"POOL-{product_type_id}-{karat_id}"
+
 
 async def get_or_create_stock_pool(db, product_type_id: int, karat_id: int, fineness: float = 0.916):
     """
-    POOL için stok havuzu getir veya oluştur
+    POOL için stok havuzu getir veya oluştur (atomik upsert)
     """
-    pool_id = f"POOL-{product_type_id}-{karat_id}"
+    pool_id = stock_pool_id(product_type_id, karat_id)
     
     pool = await db.stock_pools.find_one({"id": pool_id})
+    if pool:
+        return pool
     
-    if not pool:
-        now = datetime.now(timezone.utc).isoformat()
-        pool = {
+    now = datetime.now(timezone.utc).isoformat()
+    pool = await db.stock_pools.find_one_and_update(
+        {"id": pool_id},
+        {"$setOnInsert": {
             "id": pool_id,
             "product_type_id": product_type_id,
             "karat_id": karat_id,
@@ -29,73 +56,137 @@ async def get_or_create_stock_pool(db, product_type_id: int, karat_id: int, fine
             "avg_cost_per_gram": 0.0,
             "created_at": now,
             "updated_at": now
-        }
-        await db.stock_pools.insert_one(pool)
-        logger.info(f"Created stock pool: {pool_id}")
-    
+        }},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    logger.info(f"Created stock pool: {pool_id}")
     return pool
 
 
 async def add_to_stock_pool(db, product_type_id: int, karat_id: int, 
                            weight_gram: float, cost_has: float, fineness: float = 0.916):
     """
-    POOL'a stok ekle (alış işlemi)
+    POOL'a stok ekle (alış işlemi) - tek atomik upsert, ortalama maliyet sunucuda
     """
-    pool = await get_or_create_stock_pool(db, product_type_id, karat_id, fineness)
-    
-    new_total_weight = pool.get("total_weight", 0) + weight_gram
-    new_total_cost = pool.get("total_cost_has", 0) + cost_has
-    new_avg_cost = new_total_cost / new_total_weight if new_total_weight > 0 else 0
+    pool_id = stock_pool_id(product_type_id, karat_id)
+    now = datetime.now(timezone.utc).isoformat()
     
-    await db.stock_pools.update_one(
-        {"id": pool["id"]},
-        {"$set": {
-            "total_weight": new_total_weight,
-            "total_cost_has": new_total_cost,
-            "avg_cost_per_gram": new_avg_cost,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+    pool = await db.stock_pools.find_one_and_update(
+        {"id": pool_id},
+        [
+            {"$set": {
+                "id": pool_id,
+                "product_type_id": {"$ifNull": ["$product_type_id", product_type_id]},
+                "karat_id": {"$ifNull": ["$karat_id", karat_id]},
+                "fineness": {"$ifNull": ["$fineness", fineness]},
+                "created_at": {"$ifNull": ["$created_at", now]},
+                "total_weight": {"$add": [{"$ifNull": ["$total_weight", 0]}, weight_gram]},
+                "total_cost_has": {"$add": [{"$ifNull": ["$total_cost_has", 0]}, cost_has]},
+                "updated_at": now
+            }},
+            _RECOMPUTE_AVG_COST
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
     
-    logger.info(f"Added to pool {pool['id']}: +{weight_gram}g, new total: {new_total_weight}g")
+    logger.info(f"Added to pool {pool_id}: +{weight_gram}g, new total: {pool['total_weight']}g")
     return {
-        "pool_id": pool["id"],
+        "pool_id": pool_id,
         "added_weight": weight_gram,
         "added_cost": cost_has,
-        "new_total_weight": new_total_weight,
-        "new_total_cost": new_total_cost,
-        "new_avg_cost": new_avg_cost
+        "new_total_weight": pool["total_weight"],
+        "new_total_cost": pool["total_cost_has"],
+        "new_avg_cost": pool["avg_cost_per_gram"]
     }
 
 
+async def take_from_stock_pool(db, product_type_id: int, karat_id: int,
+                               weight_gram: float, require_available: bool = True):
+    """
+    POOL'dan atomik düşüm
+
+    Maliyet, update anındaki ortalama maliyetle sunucuda düşülür.
+    require_available=True: total_weight >= weight_gram guard'ı; yetersizse
+    (eşzamanlı satış stoğu bitirdiyse) None döner.
+    require_available=False: guard yok, değerler 0'ın altına inmez.
+    """
+    query = {"id": stock_pool_id(product_type_id, karat_id)}
+    if require_available:
+        query["total_weight"] = {"$gte": weight_gram - POOL_WEIGHT_EPSILON}
+    
+    consumed_cost = {"$multiply": [weight_gram, {"$ifNull": ["$avg_cost_per_gram", 0]}]}
+    return await db.stock_pools.find_one_and_update(
+        query,
+        [
+            {"$set": {
+                "last_consumed_cost": consumed_cost,
+                "total_cost_has": {"$max": [0, {"$subtract": [{"$ifNull": ["$total_cost_has", 0]}, consumed_cost]}]},
+                "total_weight": {"$max": [0, {"$subtract": [{"$ifNull": ["$total_weight", 0]}, weight_gram]}]},
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }},
+            _RECOMPUTE_AVG_COST
+        ],
+        return_document=ReturnDocument.AFTER
+    )
+
+
 async def get_stock_pool_info(db, product_type_id: int, karat_id: int):
     """
-    POOL bilgisi getir - hem stock_pools tablosundan hem de products tablosundan hesapla
+    POOL bilgisi getir - stock_pools + IN_STOCK ürünler
+
+    Ürün toplamları tek $group aggregation ile hesaplanır
+    (product_type_id, karat_id, stock_status_id, weight_gram, total_cost_has
+    covering index) - stoktaki ürün sayısından bağımsız, limit yok.
     """
-    pool = await get_or_create_stock_pool(db, product_type_id, karat_id)
-    pool_weight = pool.get("total_weight", 0)
-    pool_cost = pool.get("total_cost_has", 0)
+    pool_id = stock_pool_id(product_type_id, karat_id)
+    pool_read = db.stock_pools.find_one({"id": pool_id}, {"_id": 0, "total_weight": 1, "total_cost_has": 1})
     
-    # Products tablosundan da stok hesapla (IN_STOCK = 1)
-    products_cursor = db.products.find({
-        "product_type_id": product_type_id,
-        "karat_id": karat_id,
-        "stock_status_id": 1  # IN_STOCK
-    }, {"_id": 0, "weight_gram": 1, "total_cost_has": 1})
-    products = await products_cursor.to_list(1000)
+    # Session (atomic satış) eşzamanlı işlem desteklemez - sırayla çalıştır
+    if unwrap_session(db)[1] is None:
+        pool, (products_weight, products_cost) = await asyncio.gather(
+            pool_read, _in_stock_product_totals(db, product_type_id, karat_id)
+        )
+    else:
+        pool = await pool_read
+        products_weight, products_cost = await _in_stock_product_totals(db, product_type_id, karat_id)
     
-    products_weight = sum(p.get("weight_gram", 0) or 0 for p in products)
-    products_cost = sum(p.get("total_cost_has", 0) or 0 for p in products)
+    return _pool_info(pool_id, pool, products_weight, products_cost)
+
+
+async def _in_stock_product_totals(db, product_type_id: int, karat_id: int):
+    """IN_STOCK ürünlerin (ağırlık, maliyet) toplamı - tek $group"""
+    product_totals = await db.products.aggregate([
+        {"$match": {
+            "product_type_id": product_type_id,
+            "karat_id": karat_id,
+            "stock_status_id": 1  # IN_STOCK
+        }},
+        {"$group": {
+            "_id": None,
+            "weight": {"$sum": "$weight_gram"},
+            "cost": {"$sum": "$total_cost_has"}
+        }}
+    ]).to_list(1)
+    totals = product_totals[0] if product_totals else {}
+    return totals.get("weight", 0) or 0, totals.get("cost", 0) or 0
+
+
+def _pool_info(pool_id: str, pool, products_weight: float, products_cost: float) -> dict:
+    pool = pool or {}
+    pool_weight = pool.get("total_weight", 0) or 0
+    pool_cost = pool.get("total_cost_has", 0) or 0
     
     # Toplam stok = pool + products
     total_weight = pool_weight + products_weight
     total_cost = pool_cost + products_cost
     avg_cost = total_cost / total_weight if total_weight > 0 else 0
     
-    logger.info(f"Pool {product_type_id}/{karat_id}: pool_weight={pool_weight}, products_weight={products_weight}, total={total_weight}")
+    logger.debug(f"Pool {pool_id}: pool_weight={pool_weight}, products_weight={products_weight}, total={total_weight}")
     
     return {
-        "pool_id": pool.get("id"),
+        "pool_id": pool_id,
         "total_weight": total_weight,
         "total_cost_has": total_cost,
         "avg_cost_per_gram": avg_cost,
@@ -104,11 +195,28 @@ async def get_stock_pool_info(db, product_type_id: int, karat_id: int):
     }
 
 
+async def _restore_products(db, changes):
+    """consume_from_stock_pool'un ürün yazımlarını geri al (havuz düşümü başarısız)"""
+    now = datetime.now(timezone.utc).isoformat()
+    for product_id, taken, fully_sold in changes:
+        if fully_sold:
+            await db.products.update_one(
+                {"id": product_id, "stock_status_id": 2, "weight_gram": taken},
+                {"$set": {"stock_status_id": 1, "updated_at": now}}
+            )
+        else:
+            await db.products.update_one(
+                {"id": product_id},
+                {"$inc": {"weight_gram": taken}, "$set": {"updated_at": now}}
+            )
+    logger.info(f"Pool sale rolled back: {len(changes)} product updates restored")
+
+
 async def consume_from_stock_pool(db, product_type_id: int, karat_id: int, weight_gram: float):
     """
     POOL'dan stok düş (satış işlemi)
     Önce products tablosundan düşer, sonra stock_pools'dan
-    Returns: consumed info with cost calculation
+    Returns: consumed info with cost calculation (maliyet havuzdan sunucuda düşülen değer)
     """
     # Önce toplam mevcut stoğu hesapla
     pool_info = await get_stock_pool_info(db, product_type_id, karat_id)
@@ -117,20 +225,20 @@ async def consume_from_stock_pool(db, product_type_id: int, karat_id: int, weigh
     if total_available < weight_gram:
         raise HTTPException(status_code=400, detail=f"Yetersiz havuz stoğu! Mevcut: {total_available:.2f}g, İstenen: {weight_gram:.2f}g")
     
-    avg_cost = pool_info.get("avg_cost_per_gram", 0)
-    consumed_cost = weight_gram * avg_cost
-    
     remaining_to_consume = weight_gram
+    product_changes = []  # (id, düşülen gram, tamamen satıldı mı) - geri alma için
     
     # 1. Önce products tablosundan düş (SOLD yap)
+    # Her ürün güncellemesi okunan duruma koşullu: başka bir satış aynı ürünü
+    # aldıysa eşleşme olmaz ve sıradaki ürüne geçilir
     products_cursor = db.products.find({
         "product_type_id": product_type_id,
         "karat_id": karat_id,
         "stock_status_id": 1  # IN_STOCK
-    }, {"_id": 0}).sort("created_at", 1)  # FIFO - eski olanı önce
-    products = await products_cursor.to_list(100)
+    }, {"_id": 0, "id": 1, "weight_gram": 1}).sort("created_at", 1)  # FIFO - eski olanı önce
     
-    for product in products:
+    # Cursor ile ilerle: sadece ihtiyaç kadar ürün okunur, 100 kaydı sınırı yok
+    async for product in products_cursor:
         if remaining_to_consume <= 0:
             break
         
@@ -138,74 +246,72 @@ async def consume_from_stock_pool(db, product_type_id: int, karat_id: int, weigh
         if product_weight <= 0:
             continue
         
+        guard = {"id": product["id"], "stock_status_id": 1, "weight_gram": product_weight}
         if product_weight <= remaining_to_consume:
             # Tüm ürünü sat
-            await db.products.update_one(
-                {"id": product["id"]},
+            result = await db.products.update_one(
+                guard,
                 {"$set": {"stock_status_id": 2, "updated_at": datetime.now(timezone.utc).isoformat()}}  # SOLD
             )
+            if result.modified_count == 0:
+                continue
+            product_changes.append((product["id"], product_weight, True))
             remaining_to_consume -= product_weight
             logger.info(f"Pool sale: Product {product['id']} fully sold ({product_weight}g)")
         else:
             # Kısmi satış - ürün ağırlığını düşür
-            new_weight = product_weight - remaining_to_consume
-            await db.products.update_one(
-                {"id": product["id"]},
-                {"$set": {"weight_gram": new_weight, "updated_at": datetime.now(timezone.utc).isoformat()}}
+            result = await db.products.update_one(
+                guard,
+                {"$inc": {"weight_gram": -remaining_to_consume},
+                 "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
             )
-            logger.info(f"Pool sale: Product {product['id']} partial sold ({remaining_to_consume}g), remaining: {new_weight}g")
+            if result.modified_count == 0:
+                continue
+            product_changes.append((product["id"], remaining_to_consume, False))
+            logger.info(f"Pool sale: Product {product['id']} partial sold ({remaining_to_consume}g), remaining: {product_weight - remaining_to_consume}g")
             remaining_to_consume = 0
     
-    # 2. stock_pools tablosunu her zaman güncelle
+    # 2. stock_pools'dan tek atomik düşüm (tüm gram)
+    # Ürünler yetmediyse kalan havuzdan karşılanır: total_weight >= tüm gram guard'ı.
+    # Guard tutmazsa (eşzamanlı satış stoğu tüketti) ürün yazımları geri alınır,
+    # havuza hiç dokunulmamış olur. Ürünler yettiyse guard yok (eski davranış).
     products_consumed = weight_gram - remaining_to_consume
-    if products_consumed > 0:
-        pool = await get_or_create_stock_pool(db, product_type_id, karat_id)
-        current_pool_weight = pool.get("total_weight", 0)
-        
-        new_pool_weight = max(0, current_pool_weight - products_consumed)
-        pool_consumed_cost = products_consumed * pool.get("avg_cost_per_gram", 0)
-        new_pool_cost = max(0, pool.get("total_cost_has", 0) - pool_consumed_cost)
-        
-        await db.stock_pools.update_one(
-            {"id": pool["id"]},
-            {"$set": {
-                "total_weight": new_pool_weight,
-                "total_cost_has": new_pool_cost,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
+    pool = await take_from_stock_pool(
+        db, product_type_id, karat_id, weight_gram, require_available=remaining_to_consume > 0
+    )
+    if pool is None and remaining_to_consume > 0:
+        await _restore_products(db, product_changes)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Yetersiz havuz stoğu! İstenen: {weight_gram:.2f}g (eşzamanlı satış stoğu tüketti)"
         )
-        logger.info(f"Pool sale: stock_pools reduced by {products_consumed}g (from products)")
+    logger.info(f"Pool sale: stock_pools reduced by {weight_gram}g ({products_consumed}g from products)")
     
-    # 3. Kalan varsa stock_pools tablosundan ekstra düş
-    if remaining_to_consume > 0:
-        pool = await get_or_create_stock_pool(db, product_type_id, karat_id)
-        current_pool_weight = pool.get("total_weight", 0)
-        
-        new_pool_weight = max(0, current_pool_weight - remaining_to_consume)
-        pool_consumed_cost = remaining_to_consume * pool.get("avg_cost_per_gram", 0)
-        new_pool_cost = max(0, pool.get("total_cost_has", 0) - pool_consumed_cost)
-        
-        await db.stock_pools.update_one(
-            {"id": pool["id"]},
-            {"$set": {
-                "total_weight": new_pool_weight,
-                "total_cost_has": new_pool_cost,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        logger.info(f"Pool sale: stock_pools reduced by {remaining_to_consume}g")
+    # Maliyet: update anında sunucuda düşülen değer (havuz dokümanı yoksa okunan ortalamadan)
+    pool_id = stock_pool_id(product_type_id, karat_id)
+    if pool is not None:
+        consumed_cost = pool.get("last_consumed_cost", 0) or 0
+    else:
+        consumed_cost = weight_gram * pool_info.get("avg_cost_per_gram", 0)
+        pool = await db.stock_pools.find_one({"id": pool_id}, {"_id": 0, "total_weight": 1, "total_cost_has": 1})
+    avg_cost = consumed_cost / weight_gram if weight_gram > 0 else 0
     
-    # Güncel pool bilgisini al
-    final_pool_info = await get_stock_pool_info(db, product_type_id, karat_id)
+    # Kalan stok tüketim SONRASI durumdan: havuz find_one_and_update'in döndürdüğü
+    # güncel dokümandan, ürünler yeniden toplanır (eşzamanlı satışlar dahil)
+    products_weight, products_cost = await _in_stock_product_totals(db, product_type_id, karat_id)
+    final_pool_info = _pool_info(pool_id, pool, products_weight, products_cost)
+    remaining_weight = final_pool_info["total_weight"]
+    remaining_cost = final_pool_info["total_cost_has"]
     
-    logger.info(f"Pool consume complete: -{weight_gram}g, remaining: {final_pool_info['total_weight']}g")
+    logger.info(f"Pool consume complete: -{weight_gram}g, remaining: {remaining_weight}g")
     return {
-        "pool_id": f"POOL-{product_type_id}-{karat_id}",
+        "pool_id": pool_id,
         "consumed_weight": weight_gram,
+        "products_consumed_weight": products_consumed,
         "consumed_cost": consumed_cost,
         "avg_cost_per_gram": avg_cost,
-        "remaining_weight": final_pool_info.get("total_weight", 0),
-        "remaining_cost": final_pool_info.get("total_cost_has", 0)
+        "remaining_weight": remaining_weight,
+        "remaining_cost": remaining_cost
     }
 
 
@@ -238,6 +344,8 @@ async def create_stock_lot(db, product_type_id: int, product_type_code: str, kar
     }
     
     await db.stock_lots.insert_one(lot_doc)
+    lot_doc.pop("_id", None)
+    lot_ledger.add_lot(lot_doc)
     logger.info(f"Created stock lot: {lot_id}, qty: {quantity}g, supplier: {supplier_party_id}")
     return lot_doc
 
@@ -245,63 +353,10 @@ async def create_stock_lot(db, product_type_id: int, product_type_code: str, kar
 async def consume_stock_lots_fifo(db, product_type_id: int, karat_id: int, quantity_to_sell: float):
     """
     FIFO sırasına göre lotlardan stok tüket
+    Bellekteki lot kuyruğundan plan çıkarılır, tüm lot güncellemeleri tek bulk_write
     Returns: list of consumed lots with quantities
     """
-    # En eski lottan başla (purchase_date sırası)
-    lots = await db.stock_lots.find({
-        "product_type_id": product_type_id,
-        "karat_id": karat_id,
-        "status": "ACTIVE",
-        "remaining_quantity": {"$gt": 0}
-    }).sort("purchase_date", 1).to_list(100)
-    
-    consumed = []
-    remaining_to_sell = quantity_to_sell
-    
-    for lot in lots:
-        if remaining_to_sell <= 0:
-            break
-            
-        lot_remaining = lot.get("remaining_quantity", 0)
-        
-        if lot_remaining <= 0:
-            continue
-            
-        # Bu lottan ne kadar alabiliriz?
-        take_from_lot = min(lot_remaining, remaining_to_sell)
-        new_remaining = lot_remaining - take_from_lot
-        
-        # Lot güncelle
-        update_data = {
-            "remaining_quantity": new_remaining,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        # Lot bittiyse DEPLETED yap
-        if new_remaining <= 0.001:  # Float toleransı
-            update_data["status"] = "DEPLETED"
-            update_data["remaining_quantity"] = 0
-            
-        await db.stock_lots.update_one(
-            {"id": lot["id"]},
-            {"$set": update_data}
-        )
-        
-        consumed.append({
-            "lot_id": lot["id"],
-            "supplier_party_id": lot.get("supplier_party_id"),
-            "quantity_taken": take_from_lot,
-            "unit_cost_has": lot.get("unit_cost_has", 0),
-            "lot_depleted": new_remaining <= 0.001
-        })
-        
-        remaining_to_sell -= take_from_lot
-        logger.info(f"Consumed {take_from_lot}g from lot {lot['id']}, remaining in lot: {new_remaining}g")
-    
-    if remaining_to_sell > 0.001:
-        raise HTTPException(status_code=400, detail=f"Yetersiz stok! {remaining_to_sell:.2f}g eksik.")
-    
-    return consumed
+    return await lot_ledger.consume(db, product_type_id, karat_id, quantity_to_sell)
 
 
 async def get_stock_lot_summary(db, product_type_id: int, karat_id: int = None):
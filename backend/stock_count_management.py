@@ -4,7 +4,6 @@ Stok sayım sistemi - Manuel ve Barkodlu sayım desteği
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, timezone
@@ -12,8 +11,11 @@ from pathlib import Path
 from dotenv import load_dotenv
 import uuid
 import logging
-import jwt
-import os
+
+from auth import get_current_user
+from models.user import User
+from report_jobs import register_report
+from utils.pagination import InvalidCursorError, page_count, paginate
 
 # Load .env file
 ROOT_DIR = Path(__file__).parent
@@ -22,11 +24,6 @@ load_dotenv(ROOT_DIR / '.env')
 logger = logging.getLogger(__name__)
 
 stock_count_router = APIRouter(prefix="/api/stock-counts", tags=["Stock Counts"])
-security = HTTPBearer()
-
-# JWT Settings
-JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
 
 # Database reference
 db = None
@@ -35,25 +32,6 @@ def set_database(database):
     global db
     db = database
 
-async def get_current_user_internal(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current user from JWT token"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 # ==================== MODELS ====================
 
 class StockCountCreate(BaseModel):
@@ -322,14 +300,14 @@ async def get_stock_items_for_count(count_id: str, user_id: str) -> List[dict]:
 @stock_count_router.post("")
 async def create_stock_count(
     data: StockCountCreate,
-    current_user: dict = Depends(get_current_user_internal)
+    current_user: User = Depends(get_current_user)
 ):
     """Start a new stock count"""
     if data.type not in ["MANUAL", "BARCODE"]:
         raise HTTPException(status_code=400, detail="Geçersiz sayım tipi. MANUAL veya BARCODE olmalı.")
     
     count_id = generate_count_id()
-    user_id = current_user.get("id", "system") if current_user else "system"
+    user_id = current_user.id
     
     # Create stock count record
     count_record = {
@@ -376,9 +354,11 @@ async def get_stock_counts(
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100),
     status: Optional[str] = None,
-    type: Optional[str] = None
+    type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
 ):
-    """Get list of stock counts"""
+    """Get list of stock counts (page or cursor)"""
     query = {}
     
     if status:
@@ -386,19 +366,23 @@ async def get_stock_counts(
     if type:
         query["type"] = type
     
-    total = await db.stock_counts.count_documents(query)
-    
-    counts = await db.stock_counts.find(query, {"_id": 0}).sort(
-        "created_at", -1
-    ).skip((page - 1) * per_page).limit(per_page).to_list(per_page)
+    try:
+        counts, page_info = await paginate(
+            db.stock_counts, query, [("created_at", -1), ("id", -1)],
+            page=page, per_page=per_page, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "stock_counts": counts,
         "pagination": {
             "page": page,
             "per_page": per_page,
-            "total": total,
-            "total_pages": (total + per_page - 1) // per_page
+            "total": page_info["total"],
+            "total_pages": page_count(page_info["total"], per_page),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -466,15 +450,21 @@ async def delete_stock_count(count_id: str):
     
     return {"message": "Sayım silindi", "id": count_id}
 
+# Kategori / tip / ayar / barkod sırası; id tekil (keyset cursor)
+ITEM_SORT = [("category", 1), ("product_type", 1), ("karat", 1), ("barcode", 1), ("id", 1)]
+
+
 @stock_count_router.get("/{count_id}/items")
 async def get_stock_count_items(
     count_id: str,
     category: Optional[str] = None,
     is_counted: Optional[bool] = None,
     page: int = Query(1, ge=1),
-    per_page: int = Query(100, ge=1, le=500)
+    per_page: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None
 ):
-    """Get stock count items with filters"""
+    """Get stock count items with filters (page or cursor)"""
     count = await db.stock_counts.find_one({"id": count_id})
     if not count:
         raise HTTPException(status_code=404, detail="Sayım bulunamadı")
@@ -486,14 +476,14 @@ async def get_stock_count_items(
     if is_counted is not None:
         query["is_counted"] = is_counted
     
-    total = await db.stock_count_items.count_documents(query)
-    
-    items = await db.stock_count_items.find(query, {"_id": 0}).sort([
-        ("category", 1),
-        ("product_type", 1),
-        ("karat", 1),
-        ("barcode", 1)
-    ]).skip((page - 1) * per_page).limit(per_page).to_list(per_page)
+    try:
+        items, page_info = await paginate(
+            db.stock_count_items, query, ITEM_SORT,
+            page=page, per_page=per_page, cursor=cursor, include_total=include_total
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    total = page_info["total"]
     
     # Group by category for frontend
     barcode_items = [i for i in items if i.get("category") == "BARCODE"]
@@ -517,7 +507,9 @@ async def get_stock_count_items(
             "page": page,
             "per_page": per_page,
             "total": total,
-            "total_pages": (total + per_page - 1) // per_page
+            "total_pages": page_count(total, per_page),
+            "has_more": page_info["has_more"],
+            "next_cursor": page_info["next_cursor"]
         }
     }
 
@@ -526,14 +518,14 @@ async def update_stock_count_item(
     count_id: str,
     item_id: str,
     data: StockCountItemUpdate,
-    current_user: dict = Depends(get_current_user_internal)
+    current_user: User = Depends(get_current_user)
 ):
     """Update stock count item (record count)"""
     item = await db.stock_count_items.find_one({"id": item_id, "count_id": count_id})
     if not item:
         raise HTTPException(status_code=404, detail="Sayım kalemi bulunamadı")
     
-    user_id = current_user.get("id", "system") if current_user else "system"
+    user_id = current_user.id
     
     update_data = {
         "counted_at": datetime.now(timezone.utc).isoformat(),
@@ -585,7 +577,7 @@ async def update_stock_count_item(
 async def scan_barcode(
     count_id: str,
     data: BarcodeScancRequest,
-    current_user: dict = Depends(get_current_user_internal)
+    current_user: User = Depends(get_current_user)
 ):
     """Scan barcode and mark item as counted"""
     count = await db.stock_counts.find_one({"id": count_id})
@@ -629,7 +621,7 @@ async def scan_barcode(
             "item": {k: v for k, v in item.items() if k != "_id"}
         }
     
-    user_id = current_user.get("id", "system") if current_user else "system"
+    user_id = current_user.id
     
     # Mark as counted
     update_data = {
@@ -800,3 +792,30 @@ async def get_printable_list(count_id: str):
             "total_piece_count": total_piece_count
         }
     }
+
+
+# ==================== REPORT JOBS ====================
+# Büyük sayımlarda rapor/yazdırma listesi arka planda: POST /api/reports/jobs
+
+def _count_report_csv(result: dict):
+    rows = [
+        [d.get("product_name"), d.get("barcode"), d.get("category"), d.get("system_value"),
+         d.get("counted_value"), d.get("difference"), d.get("unit")]
+        for d in result["differences"]
+    ]
+    return ["product_name", "barcode", "category", "system_value", "counted_value", "difference", "unit"], rows
+
+
+def _count_print_csv(result: dict):
+    rows = []
+    for section, data in result["sections"].items():
+        for item in data["items"]:
+            rows.append([
+                section, item.get("product_name"), item.get("barcode"), item.get("product_type"),
+                item.get("karat"), item.get("system_weight_gram"), item.get("system_quantity")
+            ])
+    return ["section", "product_name", "barcode", "product_type", "karat", "system_weight_gram", "system_quantity"], rows
+
+
+register_report("stock-count-report", get_stock_count_report, _count_report_csv)
+register_report("stock-count-print", get_printable_list, _count_print_csv)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Stock Pool Concurrency Stress Test
+==================================
+Aynı havuza binlerce paralel satış (consume_from_stock_pool) ve alış
+(add_to_stock_pool) gönderir, sonunda havuz ağırlığında kayma (drift)
+olmadığını doğrular:
+
+    final_weight == initial + eklenen - başarılı satışlar
+    final_weight >= 0, avg_cost_per_gram == total_cost_has / total_weight
+
+Havuzun bir kısmı IN_STOCK ürün satırı olarak da eklenir (POOL alışı gibi:
+ürün + havuz). Satışlar önce ürünlerden düşer; ürün tarafında da:
+
+    başlangıç ürün gramı - kalan IN_STOCK gram == başarılı satışların
+    products_consumed_weight toplamı (reddedilen satış ürün bırakmamalı)
+    hiçbir ürünün weight_gram'ı negatif değil
+
+Satış sayısı stoktan fazla tutulur; fazlası "Yetersiz havuz stoğu" ile
+reddedilmeli, havuz eksiye düşmemeli.
+
+Kullanım:
+    python stress_stock_pool.py [satış_sayısı] [eşzamanlılık]
+
+Ayrı bir DB'de (BENCH_DB_NAME, varsayılan sarraf_pool_stress) çalışır ve
+sonunda DB'yi siler.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+BENCH_DB_NAME = os.environ.get('BENCH_DB_NAME', 'sarraf_pool_stress')
+
+from services.stock_service import add_to_stock_pool, consume_from_stock_pool, stock_pool_id
+
+PRODUCT_TYPE_ID = 999
+KARAT_ID = 1
+SALE_GRAM = 2.5
+PRODUCT_GRAMS = (1.0, 3.0, 4.5)  # Tam ve kısmi ürün satışları birlikte
+ADD_GRAM = 10.0
+ADD_COST_PER_GRAM = 0.93
+TOLERANCE = 1e-6
+
+
+async def main(sales: int, concurrency: int):
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[BENCH_DB_NAME]
+    await client.drop_database(BENCH_DB_NAME)
+    await db.stock_pools.create_index("id", unique=True)
+
+    # Başlangıç stoğu satışların ~%60'ını karşılar, alışlar arada eklenir
+    initial_weight = sales * SALE_GRAM * 0.6
+    await add_to_stock_pool(db, PRODUCT_TYPE_ID, KARAT_ID, initial_weight, initial_weight * 0.9)
+    additions = sales // 10
+
+    # Başlangıç stoğunun ~yarısı ürün satırı (havuz ağırlığına dahil)
+    products = []
+    products_weight = 0.0
+    while products_weight < initial_weight / 2:
+        grams = PRODUCT_GRAMS[len(products) % len(PRODUCT_GRAMS)]
+        products.append({
+            "id": f"stress-{len(products)}",
+            "product_type_id": PRODUCT_TYPE_ID,
+            "karat_id": KARAT_ID,
+            "stock_status_id": 1,
+            "weight_gram": grams,
+            "total_cost_has": grams * 0.9,
+            "created_at": f"2025-01-01T00:00:{len(products) % 60:02d}",
+        })
+        products_weight += grams
+    await db.products.insert_many(products)
+    initial_weight += products_weight
+    await add_to_stock_pool(db, PRODUCT_TYPE_ID, KARAT_ID, products_weight, products_weight * 0.9)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    sold = 0
+    rejected = 0
+    added = 0
+    from_products = 0.0
+
+    async def sell():
+        nonlocal sold, rejected, from_products
+        async with semaphore:
+            try:
+                result = await consume_from_stock_pool(db, PRODUCT_TYPE_ID, KARAT_ID, SALE_GRAM)
+                sold += 1
+                from_products += result["products_consumed_weight"]
+            except HTTPException:
+                rejected += 1
+
+    async def add():
+        nonlocal added
+        async with semaphore:
+            await add_to_stock_pool(db, PRODUCT_TYPE_ID, KARAT_ID, ADD_GRAM, ADD_GRAM * ADD_COST_PER_GRAM)
+            added += 1
+
+    tasks = [sell() for _ in range(sales)] + [add() for _ in range(additions)]
+    print(f"🔄 {sales} sales x {SALE_GRAM}g + {additions} additions x {ADD_GRAM}g, "
+          f"initial {initial_weight:.2f}g, concurrency {concurrency}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    pool = await db.stock_pools.find_one({"id": stock_pool_id(PRODUCT_TYPE_ID, KARAT_ID)})
+    expected_weight = initial_weight + added * ADD_GRAM - sold * SALE_GRAM
+    drift = pool["total_weight"] - expected_weight
+    avg_expected = pool["total_cost_has"] / pool["total_weight"] if pool["total_weight"] > 0 else 0
+
+    print(f"⏱️  {elapsed:.2f}s ({(sales + additions) / elapsed:.0f} ops/s)")
+    print(f"✅ Sold: {sold}, ❌ Rejected: {rejected}, ➕ Added: {added}")
+    print(f"📦 Final weight: {pool['total_weight']:.4f}g, expected: {expected_weight:.4f}g, drift: {drift:.6f}g")
+    print(f"💰 Total cost: {pool['total_cost_has']:.6f} HAS, avg: {pool['avg_cost_per_gram']:.6f}")
+
+    # Ürün satırları: düşülen gram == başarılı satışların ürünlerden aldığı gram
+    in_stock_weight = 0.0
+    negative = 0
+    async for product in db.products.find({"product_type_id": PRODUCT_TYPE_ID}, {"_id": 0}):
+        if product["weight_gram"] < 0:
+            negative += 1
+        if product["stock_status_id"] == 1:
+            in_stock_weight += product["weight_gram"]
+    product_drift = (products_weight - in_stock_weight) - from_products
+    print(f"🏷️  Products: {products_weight:.4f}g seeded, {in_stock_weight:.4f}g in stock, "
+          f"{from_products:.4f}g sold from products, drift: {product_drift:.6f}g, negative rows: {negative}")
+
+    ok = (
+        abs(drift) < TOLERANCE
+        and pool["total_weight"] >= 0
+        and abs(pool["avg_cost_per_gram"] - avg_expected) < TOLERANCE
+        and abs(product_drift) < TOLERANCE
+        and negative == 0
+    )
+    print("🎯 PASS - no drift" if ok else "💥 FAIL - pool or products drifted")
+
+    await client.drop_database(BENCH_DB_NAME)
+    client.close()
+    return ok
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    passed = asyncio.run(main(
+        int(args[0]) if len(args) > 0 else 5000,
+        int(args[1]) if len(args) > 1 else 100
+    ))
+    sys.exit(0 if passed else 1)
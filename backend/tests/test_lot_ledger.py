@@ -0,0 +1,69 @@
+"""
+LotLedger kuyruk testleri (DB yok - stock_lots için bellek içi sahte koleksiyon)
+
+Çalıştırma: cd backend && python -m pytest tests/test_lot_ledger.py -q
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.lot_ledger_service import LotLedger  # noqa: E402
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, field, direction):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return _Cursor([dict(d) for d in self.docs])
+
+
+class _Db:
+    def __init__(self, lots):
+        self.stock_lots = _Collection(lots)
+
+
+def test_add_lot_after_load_with_aware_datetime():
+    # Mongo (tz_aware=False) naive datetime döndürür; yeni alış aware transaction_date verir
+    db = _Db([
+        {"id": "lot-1", "purchase_date": datetime(2025, 1, 1, 9, 0), "remaining_quantity": 10.0,
+         "unit_cost_has": 0.9, "supplier_party_id": "s1"},
+        {"id": "lot-2", "purchase_date": "2025-01-05T09:00:00+00:00", "remaining_quantity": 5.0,
+         "unit_cost_has": 0.9, "supplier_party_id": "s1"},
+    ])
+    ledger = LotLedger()
+    queue = ledger._queue(1, 2)
+    asyncio.run(ledger._load(db, queue, 1, 2))
+
+    ledger.add_lot({"id": "lot-3", "product_type_id": 1, "karat_id": 2, "status": "ACTIVE",
+                    "purchase_date": datetime(2025, 1, 10, 12, 0, tzinfo=timezone.utc),
+                    "remaining_quantity": 3.0})
+    ledger.add_lot({"id": "lot-0", "product_type_id": 1, "karat_id": 2, "status": "ACTIVE",
+                    "purchase_date": datetime(2024, 12, 31, tzinfo=timezone.utc),
+                    "remaining_quantity": 1.0})
+    ledger.add_lot({"id": "lot-x", "product_type_id": 1, "karat_id": 2, "status": "ACTIVE",
+                    "purchase_date": None, "remaining_quantity": 1.0})
+
+    assert [lot["id"] for lot in queue.lots] == ["lot-x", "lot-0", "lot-1", "lot-2", "lot-3"]
+    assert all(lot["purchase_date"].tzinfo is not None for lot in queue.lots)
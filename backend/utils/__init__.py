@@ -28,6 +28,22 @@ from .formatters import (
     format_currency,
 )
 
+from .pagination import (
+    InvalidCursorError,
+    encode_cursor,
+    decode_cursor,
+    cursor_from_doc,
+    apply_cursor,
+    paginate,
+    page_count,
+)
+
+from .report_categories import (
+    REPORT_CATEGORIES,
+    report_category,
+    category_expression,
+)
+
 __all__ = [
     # Constants
     "TRANSACTION_TYPES",
@@ -52,4 +68,16 @@ __all__ = [
     "generate_barcode",
     "parse_transaction_date",
     "format_currency",
+    # Pagination
+    "InvalidCursorError",
+    "encode_cursor",
+    "decode_cursor",
+    "cursor_from_doc",
+    "apply_cursor",
+    "paginate",
+    "page_count",
+    # Report categories
+    "REPORT_CATEGORIES",
+    "report_category",
+    "category_expression",
 ]
@@ -0,0 +1,222 @@
+"""Streaming CSV/XLSX export helpers
+
+Mongo cursor'ından gelen satırlar EXPORT_BATCH_SIZE'lık parçalar halinde
+yazılıp gönderilir; sonuç hiçbir zaman tamamen belleğe alınmaz.
+
+XLSX için ek bağımlılık yok: tek sayfalık SpreadsheetML dosyası zipfile ile
+akış halinde üretilir (inline string hücreler, stil yok). Excel'in satır
+sınırı nedeniyle XLSX en fazla XLSX_MAX_ROWS satır içerir; daha büyük
+dökümler için CSV kullanılmalı.
+"""
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple, Union
+from xml.sax.saxutils import escape
+import csv
+import io
+import logging
+import re
+import zipfile
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "xlsx")
+EXPORT_BATCH_SIZE = 1000
+XLSX_MAX_ROWS = 1048575  # 1048576 - başlık satırı
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# (başlık, alan adı / "a.b" yolu / doc -> değer fonksiyonu)
+ExportColumn = Tuple[str, Union[str, Callable[[dict], Any]]]
+# Parça zenginleştirme (ör. party adları tek sorguda)
+BatchHook = Callable[[List[dict]], Awaitable[None]]
+
+
+def export_value(doc: dict, field: Union[str, Callable[[dict], Any]]) -> Any:
+    if callable(field):
+        return field(doc)
+    value = doc
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def iter_batches(rows: AsyncIterable[dict], size: int = EXPORT_BATCH_SIZE,
+                       on_batch: Optional[BatchHook] = None) -> AsyncIterator[List[dict]]:
+    """Cursor'ı size'lık listelere böl (her parça için on_batch çağrılır)"""
+    batch = []
+    async for doc in rows:
+        batch.append(doc)
+        if len(batch) >= size:
+            if on_batch:
+                await on_batch(batch)
+            yield batch
+            batch = []
+    if batch:
+        if on_batch:
+            await on_batch(batch)
+        yield batch
+
+
+# ==================== CSV ====================
+
+async def stream_csv(rows: AsyncIterable[dict], columns: Sequence[ExportColumn],
+                     on_batch: Optional[BatchHook] = None) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in columns])
+    yield buffer.getvalue().encode("utf-8-sig")  # Excel için BOM
+
+    async for batch in iter_batches(rows, on_batch=on_batch):
+        buffer.seek(0)
+        buffer.truncate()
+        for doc in batch:
+            writer.writerow([_text(export_value(doc, field)) for _, field in columns])
+        yield buffer.getvalue().encode("utf-8")
+
+
+# ==================== XLSX ====================
+
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_CONTENT_TYPES_XML = _XML_HEADER + (
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS_XML = _XML_HEADER + (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS_XML = _XML_HEADER + (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_OPEN = _XML_HEADER + (
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_CLOSE = '</sheetData></worksheet>'
+
+# XML 1.0'da geçersiz kontrol karakterleri
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _workbook_xml(sheet_name: str) -> str:
+    # Excel sayfa adı: en fazla 31 karakter, : \ / ? * [ ] olmadan
+    name = re.sub(r"[:\\/?*\[\]]", "", _INVALID_XML.sub("", sheet_name))[:31] or "Sheet1"
+    name = escape(name, {'"': "&quot;"})
+    return _XML_HEADER + (
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )
+
+
+def _xlsx_cell(value: Any) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value != value or value in (float("inf"), float("-inf")):
+            return "<c/>"
+        return f"<c><v>{value}</v></c>"
+    text = _text(value)
+    if not text:
+        return "<c/>"
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_INVALID_XML.sub("", text))}</t></is></c>'
+
+
+def _xlsx_row(values: Sequence[Any]) -> str:
+    return "<row>" + "".join(_xlsx_cell(v) for v in values) + "</row>"
+
+
+class _ChunkSink(io.RawIOBase):
+    """zipfile çıktısını toplayan seek edilemeyen hedef (data descriptor modu)"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def stream_xlsx(rows: AsyncIterable[dict], columns: Sequence[ExportColumn],
+                      sheet_name: str = "Sheet1", on_batch: Optional[BatchHook] = None) -> AsyncIterator[bytes]:
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+    archive.writestr("[Content_Types].xml", _CONTENT_TYPES_XML)
+    archive.writestr("_rels/.rels", _ROOT_RELS_XML)
+    archive.writestr("xl/workbook.xml", _workbook_xml(sheet_name))
+    archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS_XML)
+
+    written = 0
+    # zip64 zorlanmaz (Excel bazı sürümlerde reddediyor); sayfa XML'i 2GB'ı
+    # aşarsa zipfile hata verir - XLSX_MAX_ROWS satır bunun çok altında
+    with archive.open("xl/worksheets/sheet1.xml", mode="w") as sheet:
+        sheet.write((_SHEET_OPEN + _xlsx_row([header for header, _ in columns])).encode("utf-8"))
+        yield sink.drain()
+
+        async for batch in iter_batches(rows, on_batch=on_batch):
+            if written + len(batch) > XLSX_MAX_ROWS:
+                batch = batch[:XLSX_MAX_ROWS - written]
+            sheet.write("".join(
+                _xlsx_row([export_value(doc, field) for _, field in columns]) for doc in batch
+            ).encode("utf-8"))
+            written += len(batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+            if written >= XLSX_MAX_ROWS:
+                logger.warning(f"XLSX export truncated at {XLSX_MAX_ROWS} rows (Excel limit)")
+                break
+
+        sheet.write(_SHEET_CLOSE.encode("utf-8"))
+    archive.close()
+    yield sink.drain()
+
+
+def export_response(rows: AsyncIterable[dict], columns: Sequence[ExportColumn], fmt: str,
+                    filename: str, on_batch: Optional[BatchHook] = None):
+    """Cursor'ı CSV veya XLSX olarak StreamingResponse ile gönder"""
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Geçersiz format: {fmt} (csv veya xlsx)")
+    if fmt == "xlsx":
+        body = stream_xlsx(rows, columns, sheet_name=filename, on_batch=on_batch)
+    else:
+        body = stream_csv(rows, columns, on_batch=on_batch)
+    return StreamingResponse(
+        body,
+        media_type=CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
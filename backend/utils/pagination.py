@@ -0,0 +1,194 @@
+"""Keyset (cursor) pagination utilities
+
+skip/limit yerine son görülen kaydın sıralama anahtarından devam edilir:
+sayfa derinliğinden bağımsız olarak her sayfa tek index taraması.
+
+Cursor, son kaydın sıralama alanlarının base64 JSON'ıdır (opak token).
+Sıralamanın son alanı tekil olmalı (ör. id) - eşit tarihlerde kayıt atlanmaz.
+
+paginate() liste endpoint'lerinin ortak sorgusu: cursor verilirse keyset,
+verilmezse page ile skip (eski sayfa numaralı istemciler). Toplam kayıt
+sayısı isteğe bağlı ve COUNT_CACHE_TTL süresince cache'lenir.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import base64
+import json
+import os
+import time
+
+SortSpec = Sequence[Tuple[str, int]]
+
+COUNT_CACHE_TTL = int(os.environ.get("COUNT_CACHE_TTL", "60"))
+COUNT_CACHE_MAX_ENTRIES = 1024
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def _encode_value(value: Any) -> Any:
+    # datetime alanlar (financial_transactions, cash_movements) tipiyle saklanır;
+    # string olarak karşılaştırılsa Mongo hiçbir kaydı eşlemez
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and set(value) == {"$date"}:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Sıralama alanı değerlerinden opak cursor"""
+    values = {field: _encode_value(value) for field, value in values.items()}
+    payload = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Cursor'ı çöz - bozuksa InvalidCursorError (ValueError)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, dict):
+            raise ValueError("not an object")
+        return {field: _decode_value(value) for field, value in values.items()}
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}")
+
+
+def cursor_from_doc(doc: dict, sort: SortSpec) -> str:
+    """Sayfanın son kaydından devam cursor'ı"""
+    return encode_cursor({field: doc.get(field) for field, _ in sort})
+
+
+def keyset_filter(sort: SortSpec, values: Dict[str, Any], after: bool = True,
+                  inclusive: bool = False) -> dict:
+    """
+    Sıralamaya göre values'tan sonra (after=True) veya önce gelen kayıtlar
+
+    sort=[("transaction_date", 1), ("id", 1)] için after:
+        {"$or": [{"transaction_date": {"$gt": d}},
+                 {"transaction_date": d, "id": {"$gt": i}}]}
+    inclusive=True son alanda eşitliği de dahil eder ($gte/$lte).
+    None değerler (alan yok / null) sıralamadaki gibi en küçük kabul edilir.
+    """
+    clauses: List[dict] = []
+    for depth, (field, direction) in enumerate(sort):
+        forward = (direction >= 0) == after
+        last = depth == len(sort) - 1
+        op = ("$gt" if forward else "$lt") + ("e" if last and inclusive else "")
+        clause = {prev_field: values.get(prev_field) for prev_field, _ in sort[:depth]}
+        value = values.get(field)
+        if value is None:
+            # null'dan küçük değer yok; büyükler null olmayanların hepsi
+            if op == "$lt":
+                continue
+            if op == "$gt":
+                clause[field] = {"$ne": None}
+            elif op == "$lte":
+                clause[field] = None
+        elif op.startswith("$lt"):
+            # $not: null/eksik alanlar da (sıralamada en küçük) dahil, index kullanılabilir
+            clause[field] = {"$not": {("$gt" if op == "$lte" else "$gte"): value}}
+        else:
+            clause[field] = {op: value}
+        clauses.append(clause)
+    if not clauses:
+        return {"_id": {"$exists": False}}  # hiçbir kayıt
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def apply_cursor(query: dict, sort: SortSpec, cursor: Optional[str]) -> dict:
+    """Sorguya cursor'dan devam koşulunu ekle (cursor yoksa sorgu aynen)"""
+    if not cursor:
+        return query
+    values = decode_cursor(cursor)
+    if set(values) != {field for field, _ in sort}:
+        # Başka bir sıralama ile üretilmiş cursor
+        raise InvalidCursorError("Cursor does not match sort order")
+    condition = keyset_filter(sort, values)
+    return {"$and": [query, condition]} if query else condition
+
+
+# ==================== COUNT CACHE ====================
+
+_count_cache: "OrderedDict[tuple, Tuple[float, int]]" = OrderedDict()
+
+
+async def cached_count(collection, query: dict, refresh: bool = False) -> int:
+    """
+    Sorgunun kayıt sayısı, COUNT_CACHE_TTL saniye cache'li
+
+    Filtresiz sorgu collection metadata'sından (estimated_document_count).
+    refresh=True sayımı yeniler (liste ilk sayfası: yeni kayıtlar hemen görünür).
+    """
+    key = (collection.name, json.dumps(query, sort_keys=True, default=str))
+    entry = _count_cache.get(key)
+    if entry is not None and not refresh and time.monotonic() - entry[0] <= COUNT_CACHE_TTL:
+        _count_cache.move_to_end(key)
+        return entry[1]
+
+    if query:
+        total = await collection.count_documents(query)
+    else:
+        total = await collection.estimated_document_count()
+    _count_cache[key] = (time.monotonic(), total)
+    _count_cache.move_to_end(key)
+    while len(_count_cache) > COUNT_CACHE_MAX_ENTRIES:
+        _count_cache.popitem(last=False)
+    return total
+
+
+# ==================== PAGINATE ====================
+
+def page_count(total: Optional[int], per_page: int, minimum: int = 0) -> Optional[int]:
+    """Toplam sayfa sayısı (total istenmediyse None)"""
+    if total is None:
+        return None
+    if per_page <= 0:
+        return 1
+    return max((total + per_page - 1) // per_page, minimum)
+
+
+async def paginate(collection, query: dict, sort: SortSpec, page: int = 1, per_page: int = 50,
+                   cursor: Optional[str] = None, include_total: Optional[bool] = None,
+                   projection: Optional[dict] = None) -> Tuple[List[dict], Dict[str, Any]]:
+    """
+    Liste sayfası: (kayıtlar, sayfa bilgisi)
+
+    - cursor varsa keyset (skip yok), yoksa page ile skip - eski istemciler
+      değişmeden çalışır, yanıttaki next_cursor ile keyset'e geçebilir
+    - per_page + 1 kayıt okunur, fazlası has_more'u belirler
+    - include_total: None ise sadece sayfa numaralı isteklerde; sayım
+      cache'li, ilk sayfada yenilenir
+
+    Sayfa bilgisi: page, per_page, has_more, next_cursor, total (yoksa None).
+    Bozuk/uyumsuz cursor'da InvalidCursorError.
+    """
+    page_query = apply_cursor(query, sort, cursor)
+    find = collection.find(page_query, projection if projection is not None else {"_id": 0}).sort(list(sort))
+    if not cursor and page > 1:
+        find = find.skip((page - 1) * per_page)
+    docs = await find.limit(per_page + 1).to_list(per_page + 1)
+
+    has_more = len(docs) > per_page
+    docs = docs[:per_page]
+
+    if include_total is None:
+        include_total = cursor is None
+    total = None
+    if include_total:
+        total = await cached_count(collection, query, refresh=page == 1 and not cursor)
+
+    return docs, {
+        "page": page,
+        "per_page": per_page,
+        "has_more": has_more,
+        "next_cursor": cursor_from_doc(docs[-1], sort) if has_more else None,
+        "total": total
+    }
@@ -0,0 +1,87 @@
+"""Report categories for transaction lines (gold movements report)
+
+Satır yazılırken ürün tipinden hesaplanıp line["report_category"] olarak
+saklanır; rapor bu alan üzerinden gruplar. Alanı olmayan eski satırlar
+için aynı eşleme aggregation içinde (product_type_code, yoksa note) yapılır.
+"""
+from typing import Optional
+
+OTHER_CATEGORY = "Diğer"
+
+REPORT_CATEGORIES = [
+    "Hurda", "Gram Altın", "Çeyrek", "Yarım", "Tam Altın",
+    "Bilezik", "Kolye", "Yüzük", "Küpe", OTHER_CATEGORY,
+]
+
+CATEGORY_BY_CODE = {
+    "GOLD_SCRAP": "Hurda",
+    "GRAM_GOLD": "Gram Altın",
+    "GOLD_BULLION": "Gram Altın",
+    "ZIYNET_QUARTER": "Çeyrek",
+    "ATA_QUARTER": "Çeyrek",
+    "ZIYNET_HALF": "Yarım",
+    "ATA_HALF": "Yarım",
+    "ZIYNET_FULL": "Tam Altın",
+    "ATA_FULL": "Tam Altın",
+    "GOLD_BRACELET": "Bilezik",
+    "GOLD_NECKLACE": "Kolye",
+    "GOLD_PENDANT": "Kolye",
+    "GOLD_RING": "Yüzük",
+    "GOLD_EARRING": "Küpe",
+}
+
+# Sonradan eklenen ürün tipleri için grup bazlı eşleme
+CATEGORY_BY_GROUP = {
+    "HURDA": "Hurda",
+    "GRAM_GOLD": "Gram Altın",
+    "BILEZIK": "Bilezik",
+}
+
+# Eski satırlar: note içinde aranan kelimeler (sıra önemli)
+LEGACY_NOTE_PATTERNS = [
+    ("hurda", "Hurda"),
+    ("gram altın|gram altin", "Gram Altın"),
+    ("çeyrek|ceyrek", "Çeyrek"),
+    ("yarım|yarim", "Yarım"),
+    ("tam|cumhuriyet", "Tam Altın"),
+    ("bilezik", "Bilezik"),
+    ("kolye", "Kolye"),
+    ("yüzük|yuzuk", "Yüzük"),
+    ("küpe|kupe", "Küpe"),
+]
+
+
+def report_category(product_type: Optional[dict] = None, code: Optional[str] = None) -> str:
+    """Ürün tipi dokümanından (veya sadece code'dan) rapor kategorisi"""
+    if product_type:
+        code = product_type.get("code") or code
+    category = CATEGORY_BY_CODE.get(code or "")
+    if category is None and product_type:
+        category = CATEGORY_BY_GROUP.get(product_type.get("group") or "")
+    return category or OTHER_CATEGORY
+
+
+def category_expression(line: str = "$lines") -> dict:
+    """
+    Aggregation ifadesi: report_category, yoksa product_type_code eşlemesi,
+    o da yoksa note'tan (eski satırlar)
+    """
+    note = {"$ifNull": [f"{line}.note", ""]}
+    from_note = {"$switch": {
+        "branches": [
+            {"case": {"$regexMatch": {"input": note, "regex": pattern, "options": "i"}}, "then": category}
+            for pattern, category in LEGACY_NOTE_PATTERNS
+        ],
+        "default": OTHER_CATEGORY
+    }}
+    codes_by_category = {}
+    for code, category in CATEGORY_BY_CODE.items():
+        codes_by_category.setdefault(category, []).append(code)
+    from_code = {"$switch": {
+        "branches": [
+            {"case": {"$in": [f"{line}.product_type_code", codes]}, "then": category}
+            for category, codes in codes_by_category.items()
+        ],
+        "default": from_note
+    }}
+    return {"$ifNull": [f"{line}.report_category", from_code]}
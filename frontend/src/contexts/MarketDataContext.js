@@ -1,5 +1,5 @@
 import React, { createContext, useContext, useState, useEffect, useRef, useCallback } from 'react';
-import api from '../lib/api';
+import api, { API } from '../lib/api';
 
 const MarketDataContext = createContext(null);
 
@@ -18,28 +18,29 @@ export const MarketDataProvider = ({ children }) => {
   const retryCountRef = useRef(0);
   const maxRetries = 3;
 
+  const applyMarketData = useCallback((data) => {
+    if (!data) return;
+    setMarketData({
+      has_gold_buy: data.has_gold_buy,
+      has_gold_sell: data.has_gold_sell,
+      usd_buy: data.usd_buy,
+      usd_sell: data.usd_sell,
+      eur_buy: data.eur_buy,
+      eur_sell: data.eur_sell,
+      timestamp: data.timestamp
+    });
+    
+    if (data.has_gold_buy !== null || data.usd_buy !== null) {
+      setConnected(true);
+      setError(null);
+      retryCountRef.current = 0;
+    }
+  }, []);
+
   const fetchMarketData = useCallback(async () => {
     try {
       const response = await api.get('/api/market-data/latest');
-      const data = response.data;
-      
-      if (data) {
-        setMarketData({
-          has_gold_buy: data.has_gold_buy,
-          has_gold_sell: data.has_gold_sell,
-          usd_buy: data.usd_buy,
-          usd_sell: data.usd_sell,
-          eur_buy: data.eur_buy,
-          eur_sell: data.eur_sell,
-          timestamp: data.timestamp
-        });
-        
-        if (data.has_gold_buy !== null || data.usd_buy !== null) {
-          setConnected(true);
-          setError(null);
-          retryCountRef.current = 0;
-        }
-      }
+      applyMarketData(response.data);
     } catch (err) {
       console.warn('Market data fetch warning:', err.message);
       
@@ -58,25 +59,74 @@ export const MarketDataProvider = ({ children }) => {
         setConnected(false);
       }
     }
-  }, []);
+  }, [applyMarketData]);
 
   useEffect(() => {
-    // Token varsa fetch yap
+    // Token varsa bağlan
     const token = localStorage.getItem('token');
     if (!token) {
       return;
     }
 
-    // Initial fetch
-    fetchMarketData();
+    let interval = null;
+    const startPolling = () => {
+      if (interval) return;
+      fetchMarketData();
+      // Poll every 30 seconds (was 5 - causing 429)
+      interval = setInterval(fetchMarketData, 30000);
+    };
 
-    // Poll every 30 seconds (was 5 - causing 429)
-    const interval = setInterval(fetchMarketData, 30000);
+    // SSE: fiyatlar sunucudan push edilir, desteklenmiyorsa polling
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return () => clearInterval(interval);
+    }
+
+    // Access token URL'de taşınmaz: her bağlantı için kısa ömürlü stream token alınır
+    let source = null;
+    let closed = false;
+    let reconnects = 0;
+    const connect = async () => {
+      try {
+        const response = await api.post('/api/market-data/stream-token');
+        if (closed) return;
+        source = new EventSource(`${API}/market-data/stream?token=${encodeURIComponent(response.data.token)}`);
+      } catch (err) {
+        console.warn('Market stream token warning:', err.message);
+        startPolling();
+        return;
+      }
+      source.addEventListener('market', (event) => {
+        reconnects = 0;
+        try {
+          applyMarketData(JSON.parse(event.data));
+        } catch (err) {
+          console.warn('Market stream parse warning:', err.message);
+        }
+      });
+      source.onerror = () => {
+        // EventSource aynı URL ile yeniden bağlanır; token süresi dolduysa kapanır -
+        // yeni token ile tekrar dene, olmazsa polling'e dön
+        if (source.readyState === EventSource.CLOSED) {
+          setConnected(false);
+          source.close();
+          if (!closed && reconnects < maxRetries) {
+            reconnects += 1;
+            connect();
+          } else {
+            startPolling();
+          }
+        }
+      };
+    };
+    connect();
 
     return () => {
+      closed = true;
+      if (source) source.close();
       clearInterval(interval);
     };
-  }, [fetchMarketData]);
+  }, [fetchMarketData, applyMarketData]);
 
   // Manual refresh function
   const refresh = useCallback(() => {